@@ -1,6 +1,9 @@
 from .grain_hill import CTSModel
 from .grain_hill import plot_hill
 from .grain_hill import calculate_settling_rate
+from .grain_hill import cap_settling_rate
+from .grain_hill import mirror_column_values
+from .grain_hill import mirror_node_values
 from .grain_hill import GrainHill
 from .grain_hill import VERSION
 from .block_hill import BlockHill
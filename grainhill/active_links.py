@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+active_links.py: GrainHill module that restricts CellLab-CTS event
+bookkeeping to "potentially active" links.
+
+Most links in a GrainHill domain are rock-rock pairs deep inside the hill or
+air-air pairs high above it. No transition can ever fire on such a link, so
+there is no point keeping it in the event queue or sweeping over it when the
+lattice is uplifted or offset. A link is considered potentially active when it
+is an active link and its current (tail, head, orientation) state appears
+among the from-states of the transition table.
+
+@author: gtucker
+"""
+
+import numpy as np
+from landlab.ca.boundaries.hex_lattice_tectonicizer import (LatticeUplifter,
+                                                            LatticeNormalFault)
+from landlab.ca.cfuncs import get_next_event_new
+
+_NEVER = 1.0e50  # same "never" time used by landlab.ca.cfuncs
+
+
+def potentially_active_link_mask(ca):
+    """Return boolean array that is True for potentially active links.
+
+    Parameters
+    ----------
+    ca : CellLabCTSModel
+        CTS model whose links are to be tested.
+
+    Examples
+    --------
+    >>> from grainhill import GrainHill
+    >>> gh = GrainHill((5, 7))
+    >>> mask = potentially_active_link_mask(gh.ca)
+    >>> int(np.count_nonzero(mask)) < gh.grid.number_of_active_links
+    True
+    """
+    mask = np.zeros(ca.grid.number_of_links, dtype=bool)
+    active = ca.grid.active_links
+    mask[active] = ca.n_trn[ca.link_state[active]] > 0
+    return mask
+
+
+def compact_event_queue(ca):
+    """Rebuild the event queue so it holds only the currently valid events
+    on potentially active links.
+
+    The CTS engine never deletes an event when a link changes state; it
+    simply pushes a new one, and the superseded event is discarded when it
+    is eventually popped. Rebuilding the queue from the next_update array
+    removes these stale entries, along with anything scheduled on links that
+    can no longer change state.
+
+    Examples
+    --------
+    >>> from grainhill import GrainHill
+    >>> gh = GrainHill((5, 7), disturbance_rate=0.01, weathering_rate=0.0)
+    >>> gh.ca.priority_queue.push(0, 1.0e40)  # a stale entry
+    >>> n = compact_event_queue(gh.ca)
+    >>> n == len(gh.ca.priority_queue._queue)
+    True
+    >>> n == int(np.count_nonzero(potentially_active_link_mask(gh.ca)))
+    True
+    """
+    mask = potentially_active_link_mask(ca)
+    links = np.where(np.logical_and(mask, ca.next_update < _NEVER))[0]
+    links = links[np.argsort(ca.next_update[links], kind='stable')]
+
+    # A list sorted by time is already a valid heap
+    times = ca.next_update[links].tolist()
+    ca.priority_queue._queue = list(zip(times, range(len(links)),
+                                        links.tolist()))
+    ca.priority_queue._index = len(links)
+    return len(links)
+
+
+def schedule_transition(ca, link, current_time):
+    """Assign the current state of a link, and choose its next transition.
+
+    Unlike CellLabCTSModel.update_link_state_new(), this does not push the
+    event onto the queue; it is intended for use just before the queue is
+    rebuilt with compact_event_queue().
+    """
+    g = ca.grid
+    new_link_state = (int(ca.link_orientation[link]) * ca.num_node_states_sq
+                      + int(ca.node_state[g.node_at_link_tail[link]])
+                      * ca.num_node_states
+                      + int(ca.node_state[g.node_at_link_head[link]]))
+    ca.link_state[link] = new_link_state
+    if ca.n_trn[new_link_state] > 0:
+        (event_time, trn_id) = get_next_event_new(link, new_link_state,
+                                                  current_time, ca.n_trn,
+                                                  ca.trn_id, ca.trn_rate)
+        ca.next_update[link] = event_time
+        ca.next_trn_id[link] = trn_id
+    else:
+        ca.next_update[link] = _NEVER
+        ca.next_trn_id[link] = -1
+
+
+def reschedule_transitions(ca, current_time, links=None):
+    """Choose new transitions for the given links (default: all active
+    links), starting from current_time, and rebuild the event queue.
+
+    Because waiting times in a CTS model are exponentially distributed,
+    discarding the pending events and drawing new ones from the current time
+    does not change the statistics of the model. This is useful whenever the
+    node-state grid has been modified from outside the CA, or the CA has been
+    rebuilt part way through a run.
+
+    Examples
+    --------
+    >>> from grainhill import GrainHill
+    >>> gh = GrainHill((5, 7))
+    >>> reschedule_transitions(gh.ca, 100.0)
+    >>> t = np.array([ev[0] for ev in gh.ca.priority_queue._queue])
+    >>> bool(np.all(t >= 100.0))
+    True
+    """
+    if links is None:
+        links = ca.grid.active_links
+    for lnk in links:
+        schedule_transition(ca, lnk, current_time)
+    compact_event_queue(ca)
+
+
+class ActiveLinkLatticeUplifter(LatticeUplifter):
+    """LatticeUplifter that shifts link data with array operations and
+    keeps only potentially active links in the event queue.
+
+    Examples
+    --------
+    >>> from grainhill import GrainHill
+    >>> gh = GrainHill((6, 7), disturbance_rate=0.0, weathering_rate=0.0)
+    >>> isinstance(gh.uplifter, ActiveLinkLatticeUplifter)
+    True
+    >>> gh.uplifter.uplift_interior_nodes(gh.ca, 0.0, rock_state=8)
+    >>> gh.ca.node_state[:14].tolist()
+    [8, 8, 8, 8, 8, 8, 8, 0, 7, 7, 0, 7, 7, 7]
+    >>> len(gh.ca.priority_queue._queue) == int(np.count_nonzero(
+    ...     potentially_active_link_mask(gh.ca)))
+    True
+    """
+
+    def shift_link_and_transition_data_upward(self, ca, current_time):
+        """Applies uplift to links and transitions.
+
+        Overrides the method of the same name in LatticeUplifter. The result
+        is the same, but the link data are shifted in a single array
+        operation, and instead of sweeping through every entry in the event
+        queue, the queue is rebuilt from the potentially active links.
+        """
+        nc = self.grid.number_of_node_columns
+        num_links = self.grid.number_of_links
+        first_link = (((nc - 1) // 2) + (3 * (nc - 1)) + nc
+                      + ((nc + 1) // 2))
+        shift = nc + 2 * (nc - 1)
+
+        # Shift link state, next transition, and time of next transition one
+        # row upward (numpy takes care of the overlap between the two slices)
+        for data in (ca.link_state, ca.next_trn_id, ca.next_update):
+            data[first_link:] = data[first_link - shift:num_links - shift]
+
+        # Update state of links along the boundaries
+        for lnk in self.links_to_update:
+            schedule_transition(ca, lnk, current_time)
+
+        compact_event_queue(ca)
+
+
+class ActiveLinkLatticeNormalFault(LatticeNormalFault):
+    """LatticeNormalFault that shifts link data with array operations and
+    keeps only potentially active links in the event queue.
+
+    Examples
+    --------
+    >>> from grainhill import GrainFacetSimulator
+    >>> gfs = GrainFacetSimulator((5, 7), fault_x=1.0)
+    >>> isinstance(gfs.uplifter, ActiveLinkLatticeNormalFault)
+    True
+    """
+
+    def shift_link_states(self, ca, current_time):
+        """Shift link data up and right.
+
+        Overrides the method of the same name in LatticeNormalFault. Links
+        are visited in the same (descending) order, but as fancy-indexed
+        array assignments, and the event queue is rebuilt rather than swept.
+        """
+        links = np.arange(self.grid.number_of_links - 1,
+                          self.first_link_shifted_from - 1, -1)
+        links = links[self.link_offset_id[links] != links]
+        dest = self.link_offset_id[links]
+        for data in (ca.link_state, ca.next_trn_id, ca.next_update):
+            data[dest] = data[links]
+
+        for lnk in self.links_to_update:
+            schedule_transition(ca, lnk, current_time)
+
+        compact_event_queue(ca)
@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+adaptive_replicates.py: GrainHill module for running replicates of each
+point of a sweep until its metrics are known to a target precision.
+
+A fixed number of replicates per point wastes runs on points whose metrics
+barely vary from seed to seed, and leaves the noisy points under-resolved.
+run_adaptive_replicates() first runs min_replicates of every point (replicate
+i of a point uses seed start_seed + i). It then keeps adding one replicate to
+whichever unresolved point has the widest confidence interval, relative to
+its tolerance, until the confidence interval on the mean of every chosen
+metric is within tolerance at every point, or each unresolved point has
+reached max_replicates.
+
+The default metrics are those of run_index.run_metrics(): the SlopeMeasurer
+dip of the surface, mean soil thickness, and relief.
+
+@author: gtucker
+"""
+
+import numpy as np
+
+from .result_cache import create_model, normalize_params
+from .run_index import run_metrics
+
+DEFAULT_METRICS = ('dip', 'mean_soil_thickness', 'relief')
+
+
+def run_replicate(params):
+    """Run a model to its run_duration and return run_index.run_metrics()."""
+    model = create_model(normalize_params(params))
+    model.run()
+    return run_metrics(model)
+
+
+def confidence_half_width(values, confidence=0.95):
+    """Return the half-width of the Student-t confidence interval on the
+    mean of a sample (ignoring NaN values), or infinity if there are fewer
+    than two values.
+
+    Examples
+    --------
+    >>> round(confidence_half_width([1.0, 2.0, 3.0]), 3)
+    2.484
+    >>> confidence_half_width([1.0])
+    inf
+    """
+    from scipy.stats import t
+
+    values = np.asarray(values, dtype=float)
+    values = values[np.isfinite(values)]
+    n = len(values)
+    if n < 2:
+        return np.inf
+    return float(t.ppf(0.5 + 0.5 * confidence, n - 1)
+                 * np.std(values, ddof=1) / np.sqrt(n))
+
+
+def _summarize(point, metrics, tolerance, confidence):
+    """Update the means, half-widths, and resolved flag of a point, and
+    return the largest ratio of half-width to tolerance."""
+    worst = 0.0
+    for name in metrics:
+        values = np.array(point['samples'][name], dtype=float)
+        finite = values[np.isfinite(values)]
+        point['mean'][name] = (float(np.mean(finite)) if len(finite) > 0
+                               else np.nan)
+        point['half_width'][name] = confidence_half_width(values, confidence)
+        worst = max(worst, point['half_width'][name] / tolerance[name])
+    point['resolved'] = worst <= 1.0
+    return worst
+
+
+def run_adaptive_replicates(points, tolerance, metrics=DEFAULT_METRICS,
+                            min_replicates=3, max_replicates=20,
+                            confidence=0.95, start_seed=0,
+                            run_fn=run_replicate):
+    """Run replicates of each point until its metrics reach a target
+    precision.
+
+    Parameters
+    ----------
+    points : list of dict
+        Parameters of each point of the sweep (see
+        result_cache.normalize_params()); their seeds are replaced.
+    tolerance : float or dict
+        Largest acceptable half-width of the confidence interval on the
+        mean of each metric (one value for all, or a dict by metric).
+    metrics : sequence of str
+        Names of the metrics, as returned by run_fn.
+    min_replicates, max_replicates : int
+        Fewest and most replicates of each point.
+    confidence : float
+        Confidence level of the intervals.
+    start_seed : int
+        Seed of the first replicate of each point.
+    run_fn : function
+        Function of a dict of parameters that runs one replicate and
+        returns a dict of metrics (None or NaN for a metric that could not
+        be measured). Default is run_replicate(); a function that calls
+        result_cache.cached_run() makes the sweep resumable.
+
+    Returns
+    -------
+    list of dict
+        For each point: params, num_replicates, samples (list of values by
+        metric), mean and half_width (by metric), and resolved (True if
+        every half-width is within tolerance).
+
+    Examples
+    --------
+    >>> def fake_run(p):  # a quiet point and a noisy one
+    ...     return {'relief': 10.0 + p['noise'] * (-1.0) ** p['seed']}
+    >>> results = run_adaptive_replicates(
+    ...     [{'noise': 0.01}, {'noise': 1.0}], tolerance=0.5,
+    ...     metrics=('relief',), run_fn=fake_run)
+    >>> [r['num_replicates'] for r in results]
+    [3, 19]
+    >>> [r['resolved'] for r in results]
+    [True, True]
+    """
+    if not isinstance(tolerance, dict):
+        tolerance = {name: tolerance for name in metrics}
+    results = [{'params': dict(p), 'num_replicates': 0,
+                'samples': {name: [] for name in metrics}, 'mean': {},
+                'half_width': {}, 'resolved': False} for p in points]
+
+    def add_replicate(point):
+        params = dict(point['params'])
+        params['seed'] = start_seed + point['num_replicates']
+        values = run_fn(params)
+        for name in metrics:
+            value = values.get(name)
+            point['samples'][name].append(np.nan if value is None
+                                          else float(value))
+        point['num_replicates'] += 1
+
+    for point in results:
+        for _ in range(min_replicates):
+            add_replicate(point)
+    while True:
+        worst = None
+        worst_ratio = 1.0
+        for point in results:
+            ratio = _summarize(point, metrics, tolerance, confidence)
+            if (ratio > worst_ratio
+                    and point['num_replicates'] < max_replicates):
+                worst = point
+                worst_ratio = ratio
+        if worst is None:
+            return results
+        add_replicate(worst)
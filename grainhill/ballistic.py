@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+ballistic.py: GrainHill module that provides a shortcut for grains falling
+straight down through columns of air.
+
+In the lattice-grain model, a grain falling through air (state 4) moves one
+cell per "motion" event, so a grain that drops off a steep slope can take a
+long chain of events to reach the ground. BallisticFall is a callback for the
+downward motion transition: when a falling grain has more air below it, the
+grain is moved directly to the lowest air cell above the first occupied (or
+boundary) cell. The time the fall would have taken is the sum of one
+exponential waiting time per cell, which is drawn from a gamma distribution,
+and the links around the landing cell are given events starting at the end
+of the fall. Collisions then proceed as usual.
+
+The shortcut ignores anything else that might happen in the column while the
+grain is falling through it; this is normally a tiny interval, because the
+motion rate is the (very fast) settling rate.
+
+@author: gtucker
+"""
+
+import numpy as np
+from landlab.ca.celllab_cts import Transition
+
+_FALLING = 4  # "moving down" state in lattice_grain
+
+
+class BallisticFall(object):
+    """BallisticFall: callback that moves a falling grain to the bottom of the
+    column of air beneath it.
+
+    Examples
+    --------
+    >>> from grainhill import GrainHill
+    >>> gh = GrainHill((8, 5), disturbance_rate=0.0, weathering_rate=0.0,
+    ...                opt_ballistic_fall=True)
+    >>> ns = gh.ca.node_state
+    >>> (ns[26], ns[31]) = (4, 0)  # grain has fallen from row 6 to row 5
+    >>> gh.ballistic_fall(gh.ca, 26, 31, 0.0)
+    >>> ns[[6, 11, 16, 21, 26, 31]].tolist()  # column 2, rows 1 to 6
+    [7, 4, 0, 0, 0, 0]
+    >>> (gh.ballistic_fall.num_falls, gh.ballistic_fall.num_cells_skipped)
+    (1, 3)
+    """
+
+    def __init__(self, motion_rate, callback=None):
+        """Initialize a BallisticFall.
+
+        Parameters
+        ----------
+        motion_rate : float
+            Rate of motion (cells per time unit) of a falling grain.
+        callback : function (optional)
+            User callback for the motion transition, which is also called
+            (with the landing cell as tail and the starting cell as head, and
+            the landing time) after each shortcut.
+        """
+        self.motion_rate = motion_rate
+        self.callback = callback
+        self.num_falls = 0
+        self.num_cells_skipped = 0
+        self._grid = None
+
+    def motion_transition(self):
+        """Return the downward motion transition, with this object as its
+        callback."""
+        return Transition((0, _FALLING, 0), (_FALLING, 0, 0),
+                          self.motion_rate, 'motion', True, self)
+
+    def add_to_transition_list(self, xn_list):
+        """Replace the downward motion transition in a lattice-grain
+        transition list with one that calls this object, and return the list.
+
+        Examples
+        --------
+        >>> from grainhill.lattice_grain import lattice_grain_transition_list
+        >>> xn_list = lattice_grain_transition_list(g=1.0, f=0.5)
+        >>> bf = BallisticFall(1.0)
+        >>> xn_list = bf.add_to_transition_list(xn_list)
+        >>> xn_list[3].prop_update_fn is bf
+        True
+        """
+        for i in range(len(xn_list)):
+            if (xn_list[i].name == 'motion'
+                    and tuple(xn_list[i].from_state) == (0, _FALLING, 0)):
+                xn_list[i] = self.motion_transition()
+        return xn_list
+
+    def _set_up_node_below(self, grid, link_orientation):
+        """Find the node directly beneath each node (-1 if none)."""
+        vertical = np.where(link_orientation == 0)[0]
+        self.node_below = -np.ones(grid.number_of_nodes, dtype=int)
+        self.node_below[grid.node_at_link_head[vertical]] = \
+            grid.node_at_link_tail[vertical]
+        self._grid = grid
+
+    def __call__(self, ca, tail, head, current_time):
+        """Called by the CTS model after a downward motion event, in which
+        the grain moved from head to tail."""
+        if self.callback is not None:
+            self.callback(ca, tail, head, current_time)
+
+        g = ca.grid
+        ns = ca.node_state
+        if ns[tail] != _FALLING or g.status_at_node[tail] != g.BC_NODE_IS_CORE:
+            return
+        if g is not self._grid:
+            self._set_up_node_below(g, ca.link_orientation)
+
+        # Find the bottom of the column of air below the grain
+        landing = tail
+        num_cells = 0
+        below = self.node_below[landing]
+        while (below >= 0 and ns[below] == 0
+               and g.status_at_node[below] == g.BC_NODE_IS_CORE):
+            landing = below
+            num_cells += 1
+            below = self.node_below[landing]
+        if num_cells == 0:
+            return
+
+        # Move the grain (and its property ID), and draw the time it takes
+        ns[landing] = _FALLING
+        ns[tail] = 0
+        (ca.propid[landing], ca.propid[tail]) = (ca.propid[tail],
+                                                 ca.propid[landing])
+        landing_time = current_time + np.random.gamma(num_cells,
+                                                      1.0 / self.motion_rate)
+        self.num_falls += 1
+        self.num_cells_skipped += num_cells
+
+        # Update links at the starting cell now, and at the landing cell as
+        # of the time of landing
+        self._update_links_at_node(ca, tail, current_time)
+        self._update_links_at_node(ca, landing, landing_time)
+
+        if self.callback is not None:
+            self.callback(ca, landing, tail, landing_time)
+
+    def _update_links_at_node(self, ca, node, current_time):
+        """Update the state and next event of active links at a node."""
+        g = ca.grid
+        nsn = ca.num_node_states
+        for i in range(g.links_at_node.shape[1]):
+            if g.active_link_dirs_at_node[node, i] != 0:
+                lnk = g.links_at_node[node, i]
+                new_state = (int(ca.link_orientation[lnk]) * nsn * nsn
+                             + int(ca.node_state[g.node_at_link_tail[lnk]])
+                             * nsn
+                             + int(ca.node_state[g.node_at_link_head[lnk]]))
+                ca.update_link_state_new(lnk, new_state, current_time)
@@ -12,6 +12,7 @@ from grainhill import GrainHill
 from .lattice_grain import (lattice_grain_node_states,
                            lattice_grain_transition_list)
 from landlab.ca.boundaries.hex_lattice_tectonicizer import LatticeUplifter
+from .active_links import ActiveLinkLatticeUplifter
 from landlab.ca.celllab_cts import Transition
 
 BLOCK_ID = 9
@@ -30,7 +31,8 @@ class BlockHill(GrainHill):
                  plot_filename='blockhill', plot_filetype='.png',
                  friction_coef=0.3, rock_state_for_uplift=7,
                  opt_rock_collapse=False, block_layer_dip_angle=0.0,
-                 block_layer_thickness=1.0, layer_left_x=0.0, y0_top=0.0):
+                 block_layer_thickness=1.0, layer_left_x=0.0, y0_top=0.0,
+                 cts_type='oriented_hex', seed=0):
         """Call the initialize() method."""
         self.bh_initialize(grid_size, cell_width, grav_accel, report_interval,
                         run_duration,output_interval, disturbance_rate,
@@ -38,7 +40,7 @@ class BlockHill(GrainHill):
                         plot_interval, save_plots, plot_filename, plot_filetype,
                         friction_coef, rock_state_for_uplift, opt_rock_collapse,
                         block_layer_dip_angle, block_layer_thickness,
-                        layer_left_x, y0_top)
+                        layer_left_x, y0_top, cts_type, seed)
 
     def bh_initialize(self, grid_size, cell_width, grav_accel, report_interval,
                    run_duration, output_interval, disturbance_rate,
@@ -46,7 +48,7 @@ class BlockHill(GrainHill):
                    plot_interval, save_plots, plot_filename, plot_filetype,
                    friction_coef, rock_state_for_uplift, opt_rock_collapse,
                    block_layer_dip_angle, block_layer_thickness, layer_left_x,
-                   y0_top):
+                   y0_top, cts_type='oriented_hex', seed=0):
         """Initialize the BlockHill model."""
 
         # Set block-related variables
@@ -72,15 +74,25 @@ class BlockHill(GrainHill):
                                         opt_rock_collapse=opt_rock_collapse,
                                         save_plots=save_plots,
                                         plot_filename=plot_filename,
-                                        plot_filetype=plot_filetype)
-
-        self.uplifter = LatticeUplifter(self.grid,
-                                self.grid.at_node['node_state'],
-                                opt_block_layer=True,
-                                block_ID=8,
-                                block_layer_dip_angle=block_layer_dip_angle,
-                                block_layer_thickness=block_layer_thickness,
-                                layer_left_x=layer_left_x, y0_top=y0_top)
+                                        plot_filetype=plot_filetype,
+                                        cts_type=cts_type,
+                                        seed=seed)
+
+    def create_uplifter(self):
+        """Create and return the object that handles uplift, including the
+        layer of blocks."""
+        if self.opt_exclude_inert_links:
+            uplifter_class = ActiveLinkLatticeUplifter
+        else:
+            uplifter_class = LatticeUplifter
+        return uplifter_class(self.grid,
+                              self.grid.at_node['node_state'],
+                              opt_block_layer=True,
+                              block_ID=8,
+                              block_layer_dip_angle=self.block_layer_dip_angle,
+                              block_layer_thickness=self.block_layer_thickness,
+                              layer_left_x=self.layer_left_x,
+                              y0_top=self.y0_top)
 
     def node_state_dictionary(self):
         """
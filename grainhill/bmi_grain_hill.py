@@ -90,9 +90,17 @@ class BmiGrainHill(Bmi):
 
         self._initialized = True
 
+    def _refresh_grid(self):
+        """Update grid reference, in case the model has rebuilt its grid
+        (for example, when opt_grow_domain is True)."""
+        if self._model.grid is not self.grid:
+            self.grid = self._model.grid
+            self._values["node_state"] = self.grid.at_node['node_state']
+
     def update(self):
         """Advance forward for one year."""
         self._model.run(to=self._model.current_time + 1.0)
+        self._refresh_grid()
 
     def update_frac(self, time_frac):
         """Update model by a fraction of a time step.
@@ -103,6 +111,7 @@ class BmiGrainHill(Bmi):
             Fraction of a year.
         """
         self._model.run(to=self._model.current_time + time_frac)
+        self._refresh_grid()
 
     def update_until(self, then):
         """Update model until a particular time.
@@ -113,6 +122,7 @@ class BmiGrainHill(Bmi):
             Time to run model until.
         """
         self._model.run(to=then)
+        self._refresh_grid()
 
     def finalize(self):
         """Finalize model."""
@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+branching.py: GrainHill module for running branches of an ensemble from a
+shared spun-up state.
+
+Many experiments differ only after a common spin-up: a change in disturbance
+or weathering rate, a switch to baselevel rise, or simply a different random
+seed. run_branches() runs a GrainHill or GrainFacetSimulator model once to
+the branch time, then forks one child process per branch. Each child
+applies its parameter changes (see apply_branch_changes()), continues to the
+end of the run, and sends back the result of result_fn. Forked children share
+the parent's memory copy-on-write, so neither the spin-up computation nor
+most of the memory is duplicated. Forking is required (it is not available on
+Windows).
+
+@author: gtucker
+"""
+
+import multiprocessing
+import traceback
+
+import numpy as np
+
+from .active_links import reschedule_transitions
+from .grain_hill import get_profile
+from .tau_leaping import SlowProcessLeaper
+
+_RATE_PARAMS = ('disturbance_rate', 'weathering_rate', 'dissolution_rate')
+_TIMING_PARAMS = ('run_duration', 'uplift_interval', 'uplift_duration',
+                  'baselevel_rise_interval')
+
+
+def apply_branch_changes(model, changes):
+    """Change the parameters of a model part way through a run.
+
+    Parameters
+    ----------
+    model : GrainHill or GrainFacetSimulator
+        The model, which keeps its node states and current time.
+    changes : dict
+        New values for any of disturbance_rate, weathering_rate,
+        dissolution_rate, run_duration, uplift_interval, uplift_duration
+        (GrainHill), baselevel_rise_interval (GrainFacetSimulator), and seed.
+
+    Changing a rate rebuilds the CA (and the tau-leaper, if there is one)
+    with the new transition rates; the settling rate is not changed, even
+    if it was capped with motion_rate_cap. The next uplift or baselevel rise
+    happens one (new) interval after the current time. Pending events are
+    always discarded and new ones drawn from the current time, after
+    seeding numpy's random number generator with the given seed (if any),
+    so that branches with different seeds diverge at once.
+
+    Examples
+    --------
+    >>> from grainhill import GrainHill
+    >>> gh = GrainHill((5, 7), run_duration=20.0, disturbance_rate=0.01,
+    ...                weathering_rate=0.0)
+    >>> gh.ca.run(5.0, gh.ca.node_state)
+    >>> gh.current_time = 5.0
+    >>> apply_branch_changes(gh, {'weathering_rate': 0.1, 'seed': 3})
+    >>> bool(np.any(gh.ca.trn_rate == 0.1))  # weathering transitions
+    True
+    >>> gh.ca.current_time
+    5.0
+    >>> bool(np.all(gh.ca.next_update[gh.grid.active_links] >= 5.0))
+    True
+    """
+    unknown = set(changes) - set(_RATE_PARAMS + _TIMING_PARAMS + ('seed',))
+    if unknown:
+        raise ValueError('cannot change ' + ', '.join(sorted(unknown))
+                         + ' in a branch')
+    now = model.current_time
+
+    if any(name in changes for name in _RATE_PARAMS):
+        if model.leaper is not None:
+            model.leaper.leap(model.ca, now)  # catch up at the old rates
+        for name in _RATE_PARAMS:
+            if name in changes:
+                setattr(model, name, changes[name])
+        _rebuild_ca(model)
+        if model.leaper is not None:
+            xn_list = model.add_weathering_and_disturbance_transitions(
+                [], model.disturbance_rate, model.weathering_rate,
+                model.dissolution_rate)
+            model.leaper = SlowProcessLeaper(
+                xn_list, len(model.node_state_dictionary()),
+                model.leaper.tolerance, start_time=now)
+
+    for name in _TIMING_PARAMS:
+        if name in changes:
+            setattr(model, name, changes[name])
+    if 'uplift_interval' in changes:
+        model.next_uplift = now + model.uplift_interval
+    if 'baselevel_rise_interval' in changes:
+        if model.baselevel_rise_interval > 0:
+            model.next_baselevel = now + model.baselevel_rise_interval
+            if not hasattr(model, 'baselevel_row'):
+                model.baselevel_row = 1
+        else:
+            model.next_baselevel = model.run_duration + 1
+    if model.leaper is not None:
+        model.leaper.update_leap_interval(model.ca)
+        model.next_leap = now + model.leaper.leap_interval
+    else:
+        model.next_leap = model.run_duration + 1.0
+
+    if 'seed' in changes:
+        np.random.seed(changes['seed'])
+        if hasattr(model.ca, 'seed_streams'):  # common random numbers
+            model.ca.seed_streams(changes['seed'])
+    reschedule_transitions(model.ca, now)
+
+
+def _rebuild_ca(model):
+    """Replace a model's CA with one built from its current transition list,
+    node states, and time."""
+    old_ca = model.ca
+    model.grid.delete_field('link', 'next_update_time')  # the new CA adds it
+    rng_state = np.random.get_state()
+    model.ca = model.create_ca(model.cts_type, model.node_state_dictionary(),
+                               model.transition_list(), old_ca.node_state,
+                               old_ca.prop_data, old_ca.prop_reset_value,
+                               model.seed)
+    np.random.set_state(rng_state)
+    model.ca.propid[:] = old_ca.propid
+    model.ca.current_time = old_ca.current_time
+    if hasattr(model.ca, 'continue_streams'):  # common random numbers
+        model.ca.continue_streams(old_ca)
+    if getattr(old_ca, 'occupancy', None) is not None:
+        model.ca.occupancy = old_ca.occupancy
+    if hasattr(model, 'create_uplifter'):  # the uplifter refers to the CA
+        old_uplifter = model.uplifter
+        model.uplifter = model.create_uplifter()
+        for name in ('cum_uplift', 'y0_top'):  # block-layer state, if any
+            if hasattr(old_uplifter, name):
+                setattr(model.uplifter, name, getattr(old_uplifter, name))
+
+
+def _run_branch(conn, model, changes, result_fn):
+    """Apply changes to a (forked) model, run it to the end, and send the
+    result, or the traceback of any error, through conn."""
+    try:
+        apply_branch_changes(model, changes)
+        model.run(model.run_duration)
+        conn.send((True, result_fn(model)))
+    except Exception:
+        conn.send((False, traceback.format_exc()))
+    conn.close()
+
+
+def run_branches(model, branch_time, branches, result_fn=get_profile,
+                 max_processes=None):
+    """Run a model to branch_time, then continue each branch in its own
+    forked process.
+
+    Parameters
+    ----------
+    model : GrainHill or GrainFacetSimulator
+        The model to spin up. It is left at branch_time.
+    branch_time : float
+        Time at which the branches start.
+    branches : list of dict
+        Parameter changes for each branch (see apply_branch_changes()).
+        Each branch runs to its run_duration.
+    result_fn : function
+        Function of a model that returns the (picklable) result of a branch.
+        Default is the final elevation and soil-thickness profiles.
+    max_processes : int (optional)
+        Largest number of branches run at once (default: number of CPUs).
+
+    Returns
+    -------
+    list
+        The result of each branch, in the order given.
+
+    Examples
+    --------
+    >>> from grainhill import GrainHill
+    >>> gh = GrainHill((5, 7), run_duration=20.0, uplift_interval=5.0,
+    ...                disturbance_rate=0.01, weathering_rate=0.001)
+    >>> import contextlib, io
+    >>> with contextlib.redirect_stdout(io.StringIO()):  # progress reports
+    ...     results = run_branches(gh, 10.0,
+    ...                            [{'seed': 1},
+    ...                             {'seed': 2, 'weathering_rate': 0.1}],
+    ...                            result_fn=lambda m: m.current_time)
+    >>> results
+    [20.0, 20.0]
+    >>> gh.current_time
+    10.0
+    """
+    if 'fork' not in multiprocessing.get_all_start_methods():
+        raise RuntimeError('run_branches requires processes to be forked')
+    context = multiprocessing.get_context('fork')
+    if max_processes is None:
+        max_processes = multiprocessing.cpu_count()
+
+    if model.current_time < branch_time:
+        model.run(branch_time)
+
+    results = [None] * len(branches)
+    running = []
+    for (i, changes) in enumerate(branches):
+        (conn, child_conn) = context.Pipe(duplex=False)
+        process = context.Process(target=_run_branch,
+                                  args=(child_conn, model, changes,
+                                        result_fn))
+        process.start()
+        child_conn.close()
+        running.append((i, conn, process))
+        if len(running) >= max_processes or i == len(branches) - 1:
+            for (j, conn, process) in running:
+                (ok, result) = conn.recv()
+                process.join()
+                if not ok:
+                    raise RuntimeError('branch ' + str(j) + ' failed:\n'
+                                       + result)
+                results[j] = result
+            running = []
+    return results
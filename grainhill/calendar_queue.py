@@ -0,0 +1,328 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+calendar_queue.py: GrainHill module with a calendar-queue scheduler for the
+JIT-compiled CellLab-CTS engine.
+
+A calendar queue (Brown, 1988, Communications of the ACM 31, 1220-1227)
+divides time into "days" of equal width, and hashes each event into the
+bucket for its day, modulo the number of buckets (a "year"). The next event
+is found by scanning forward from the current day. When the bucket width is
+close to the typical spacing between the earliest events, each operation
+touches only a few events, so the cost per event does not grow with queue
+size, as it does (logarithmically) for a binary heap.
+
+In a CTS model each link has at most one valid event, so the queue here is
+indexed by link: every bucket is a doubly linked list of links, the event
+time of a link is its next_update value, and rescheduling a link simply
+moves it to another bucket, leaving no superseded events behind. There is
+roughly one bucket per event: the number of buckets (a power of two) is
+doubled when the number of events grows beyond twice the number of buckets,
+and halved when it falls below a quarter of it. Most links in a lattice-grain
+model (air above air, or resting solid below solid) have no event, so the
+number of events is usually much smaller than the number of links. The bucket
+width is tuned automatically from the spacing of the earliest events whenever
+the queue is loaded or resized, and whenever the average number of buckets
+and events examined per pop becomes large.
+
+Select it in a CTSModel with cts_type='oriented_hex_calendar'. Requires
+numba.
+
+@author: gtucker
+"""
+
+import numpy as np
+from numba import njit
+
+from .active_links import _NEVER
+from .jit_cts import JitOrientedHexCTS
+
+# Layout of the float array qf
+_WIDTH = 0  # bucket width
+_TOP = 1  # end time of the current bucket's day
+_COST = 2  # buckets and events examined since the last check
+_POPS = 3  # pops since the last check
+
+# Layout of the integer array qi: a header, then next, previous, and bucket
+# of each link, then the first link in each bucket
+_NB = 0  # number of buckets
+_CUR = 1  # current bucket
+_COUNT = 2  # number of events
+_NL = 3  # number of links
+_NB_MAX = 4  # maximum number of buckets
+_HEADER = 5
+
+_CHECK_INTERVAL = 1024  # pops between checks of the average cost
+_MAX_COST = 8.0  # average cost per pop that triggers re-tuning
+_NUM_SAMPLE = 25  # events sampled to set the bucket width
+
+
+def calendar_queue_arrays(num_links):
+    """Create and return empty calendar-queue arrays (qf, qi).
+
+    Examples
+    --------
+    >>> (qf, qi) = calendar_queue_arrays(5)
+    >>> qi[:5].tolist()  # buckets, current bucket, events, links, max buckets
+    [2, 0, 0, 5, 8]
+    """
+    nb_max = 2
+    while nb_max < num_links:
+        nb_max *= 2
+    qf = np.zeros(4)
+    qf[_WIDTH] = 1.0
+    qf[_TOP] = 1.0
+    qi = -np.ones(_HEADER + 3 * num_links + nb_max, dtype=np.int64)
+    qi[_NB] = 2
+    qi[_CUR] = 0
+    qi[_COUNT] = 0
+    qi[_NL] = num_links
+    qi[_NB_MAX] = nb_max
+    return qf, qi
+
+
+@njit(cache=True)
+def _bucket_of_time(qf, qi, event_time):
+    """Return the bucket that an event time hashes to."""
+    if event_time >= _NEVER:
+        return 0
+    return np.int64(event_time / qf[_WIDTH]) & (qi[_NB] - 1)
+
+
+@njit(cache=True)
+def _unlink(qi, link):
+    """Remove a link from its bucket."""
+    nl = qi[_NL]
+    nxt = _HEADER + link
+    prv = _HEADER + nl + link
+    bkt = _HEADER + 2 * nl + link
+    if qi[prv] >= 0:
+        qi[_HEADER + qi[prv]] = qi[nxt]
+    else:
+        qi[_HEADER + 3 * nl + qi[bkt]] = qi[nxt]
+    if qi[nxt] >= 0:
+        qi[_HEADER + nl + qi[nxt]] = qi[prv]
+    qi[bkt] = -1
+    qi[_COUNT] -= 1
+
+
+@njit(cache=True)
+def _insert(qf, qi, link, event_time):
+    """Add a link to the bucket for its event time."""
+    nl = qi[_NL]
+    b = _bucket_of_time(qf, qi, event_time)
+    first = qi[_HEADER + 3 * nl + b]
+    qi[_HEADER + link] = first
+    qi[_HEADER + nl + link] = -1
+    if first >= 0:
+        qi[_HEADER + nl + first] = link
+    qi[_HEADER + 3 * nl + b] = link
+    qi[_HEADER + 2 * nl + link] = b
+    qi[_COUNT] += 1
+
+
+@njit
+def _calendar_push(qf, qi, next_update, active_links, link, event_time):
+    """Add or move the event for a link (next_update[link] must already be
+    event_time)."""
+    if qi[_HEADER + 2 * qi[_NL] + link] >= 0:
+        _unlink(qi, link)
+    if qi[_COUNT] == 0 or event_time < qf[_TOP] - qf[_WIDTH]:
+        _set_current_day(qf, qi, event_time)
+    _insert(qf, qi, link, event_time)
+    if qi[_COUNT] > 2 * qi[_NB] and qi[_NB] < qi[_NB_MAX]:
+        _tune_width(qf, qi, next_update, qf[_TOP] - qf[_WIDTH])
+
+
+@njit(cache=True)
+def _set_current_day(qf, qi, event_time):
+    """Make the day containing event_time the current day."""
+    day = np.floor(event_time / qf[_WIDTH])
+    qf[_TOP] = (day + 1.0) * qf[_WIDTH]
+    qi[_CUR] = np.int64(day) & (qi[_NB] - 1)
+
+
+@njit
+def _pop_earliest(qf, qi, next_update):
+    """Remove the earliest event and return (time, link, cost), where cost
+    is the number of buckets and events examined."""
+    nb = qi[_NB]
+    nl = qi[_NL]
+    heads = _HEADER + 3 * nl
+    cost = 0
+    best = -1
+    best_time = _NEVER
+    for i in range(nb):
+        link = qi[heads + qi[_CUR]]
+        best_time = qf[_TOP]
+        while link >= 0:
+            cost += 1
+            if next_update[link] < best_time:
+                best_time = next_update[link]
+                best = link
+            link = qi[_HEADER + link]
+        if best >= 0:
+            break
+        qi[_CUR] = (qi[_CUR] + 1) & (nb - 1)
+        qf[_TOP] += qf[_WIDTH]
+        cost += 1
+
+    if best < 0:
+        # Nothing in the coming year: search all the events directly
+        best_time = _NEVER
+        for b in range(nb):
+            link = qi[heads + b]
+            while link >= 0:
+                cost += 1
+                if next_update[link] < best_time:
+                    best_time = next_update[link]
+                    best = link
+                link = qi[_HEADER + link]
+        if best < 0:
+            # Only links without a scheduled event remain
+            for link in range(nl):
+                if qi[_HEADER + 2 * nl + link] >= 0:
+                    _unlink(qi, link)
+            return _NEVER, -1, cost
+        _set_current_day(qf, qi, best_time)
+
+    _unlink(qi, best)
+    return best_time, best, cost
+
+
+@njit
+def _calendar_pop(qf, qi, next_update):
+    """Remove the earliest event and return (time, link), or (_NEVER, -1) if
+    the queue is empty.
+
+    Every _CHECK_INTERVAL pops, the bucket width is re-tuned if the average
+    cost of a pop has grown too large.
+    """
+    if qi[_COUNT] == 0:
+        return _NEVER, -1
+    (best_time, best, cost) = _pop_earliest(qf, qi, next_update)
+    if best >= 0 and 4 * qi[_COUNT] < qi[_NB] and qi[_NB] > 2:
+        _tune_width(qf, qi, next_update, best_time)
+    qf[_COST] += cost
+    qf[_POPS] += 1.0
+    if qf[_POPS] >= _CHECK_INTERVAL:
+        if qf[_COST] > _MAX_COST * qf[_POPS] and best >= 0:
+            _tune_width(qf, qi, next_update, best_time)
+        qf[_COST] = 0.0
+        qf[_POPS] = 0.0
+    return best_time, best
+
+
+@njit
+def _tune_width(qf, qi, next_update, now):
+    """Set the number of buckets from the number of events, and the bucket
+    width from the spacing of the earliest events, and rehash all events."""
+    nl = qi[_NL]
+    n = min(_NUM_SAMPLE, qi[_COUNT])
+    if n >= 2:
+        sample_link = np.empty(n, dtype=np.int64)
+        sample_time = np.empty(n)
+        num_sampled = 0
+        for i in range(n):
+            (event_time, link, _) = _pop_earliest(qf, qi, next_update)
+            if link < 0:
+                break
+            sample_time[i] = event_time
+            sample_link[i] = link
+            num_sampled += 1
+        if num_sampled >= 2:
+            gaps = np.diff(sample_time[:num_sampled])
+            mean_gap = np.mean(gaps)
+            trimmed = gaps[gaps <= 2.0 * mean_gap]
+            if len(trimmed) > 0 and np.mean(trimmed) > 0.0:
+                qf[_WIDTH] = 3.0 * np.mean(trimmed)
+        for i in range(num_sampled):
+            _insert(qf, qi, sample_link[i], sample_time[i])
+
+    # Rehash everything with the new width and number of buckets
+    links = np.empty(qi[_COUNT], dtype=np.int64)
+    j = 0
+    for b in range(qi[_NB]):
+        link = qi[_HEADER + 3 * nl + b]
+        while link >= 0:
+            links[j] = link
+            j += 1
+            link = qi[_HEADER + link]
+    qi[_HEADER:] = -1
+    qi[_COUNT] = 0
+    nb = 2
+    while nb < len(links) and nb < qi[_NB_MAX]:
+        nb *= 2
+    qi[_NB] = nb
+    _set_current_day(qf, qi, now)
+    for link in links:
+        _insert(qf, qi, link, next_update[link])
+
+
+@njit
+def _calendar_rebuild(qf, qi, next_update, active_links):
+    """Replace the queue contents with the valid events on active links,
+    and tune the bucket width."""
+    qi[_HEADER:] = -1
+    qi[_COUNT] = 0
+    first = _NEVER
+    last = 0.0
+    for j in range(len(active_links)):
+        t = next_update[active_links[j]]
+        if t < _NEVER:
+            first = min(first, t)
+            last = max(last, t)
+    if first == _NEVER:
+        return
+    num_events = 0
+    for j in range(len(active_links)):
+        if next_update[active_links[j]] < _NEVER:
+            num_events += 1
+    qf[_WIDTH] = max((last - first) / num_events, 1.0e-300)
+    nb = 2
+    while nb < num_events and nb < qi[_NB_MAX]:
+        nb *= 2
+    qi[_NB] = nb
+    _set_current_day(qf, qi, first)
+    for j in range(len(active_links)):
+        link = active_links[j]
+        if next_update[link] < _NEVER:
+            _insert(qf, qi, link, next_update[link])
+    _tune_width(qf, qi, next_update, first)
+    qf[_COST] = 0.0
+    qf[_POPS] = 0.0
+
+
+class CalendarQueueCTS(JitOrientedHexCTS):
+    """JitOrientedHexCTS with a calendar queue in place of the binary heap.
+
+    Examples
+    --------
+    >>> from grainhill import GrainHill
+    >>> gh = GrainHill((5, 7), cts_type='oriented_hex_calendar',
+    ...                disturbance_rate=1.0, weathering_rate=0.0)
+    >>> isinstance(gh.ca, CalendarQueueCTS)
+    True
+    >>> core = gh.grid.core_nodes
+    >>> num_grains = int(np.count_nonzero(gh.ca.node_state[core]))
+    >>> gh.ca.run(10.0, gh.ca.node_state)
+    >>> gh.ca.current_time
+    10.0
+    >>> int(np.count_nonzero(gh.ca.node_state[core])) <= num_grains
+    True
+    """
+
+    queue_push = staticmethod(_calendar_push)
+    queue_pop = staticmethod(_calendar_pop)
+    queue_rebuild = staticmethod(_calendar_rebuild)
+
+    def _allocate_queue(self):
+        """Create the calendar-queue arrays, sized for the current grid."""
+        (self._qf, self._qi) = calendar_queue_arrays(
+            self.grid.number_of_links)
+        self._queue_num_links = self.grid.number_of_links
+
+    @property
+    def bucket_width(self):
+        """Current width of a calendar-queue bucket."""
+        return float(self._qf[_WIDTH])
@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+convergence.py: GrainHill module for choosing a motion-rate cap.
+
+Grain motion and collisions in the lattice-grain model happen at the settling
+rate, which is many orders of magnitude faster than disturbance, weathering,
+dissolution, and uplift. Most of the computing time therefore goes into
+moving grains around. Capping the motion rate (the motion_rate_cap parameter
+of GrainHill and GrainFacetSimulator) at a multiple of the fastest slow
+process removes most of those events, as long as grains still settle much
+faster than the landscape changes. run_convergence_study() runs the same
+inputs at a series of caps and reports how far the elevation profile, soil
+thickness, and mean slope at each cap are from those of a reference run,
+so that the smallest cap that gives converged results can be chosen.
+
+Command-line use:
+
+    python -m grainhill.convergence <input file> <cap> [<cap> ...]
+
+where a cap of "none" means no cap. The last cap is the reference.
+
+@author: gtucker
+"""
+
+import sys
+import time
+
+import numpy as np
+
+from grainhill import GrainHill, GrainFacetSimulator
+from grainhill.grain_hill import get_profile
+
+_HEX_COLUMN_SPACING = 0.5 * np.sqrt(3.0)  # in units of cell width
+
+
+def profile_slope(elev, columns=None):
+    """Return the gradient of a straight line fitted to an elevation profile.
+
+    Parameters
+    ----------
+    elev : array of float
+        Elevation of each column, in cell widths (as returned by
+        get_profile_and_soil_thickness()).
+    columns : array of int (optional)
+        Columns to fit. Default is the left flank of a hill, from column 1
+        to the middle column.
+
+    Examples
+    --------
+    >>> round(profile_slope(np.array([0.0, 0.5, 1.0, 1.5, 1.0, 0.5, 0.0])), 4)
+    0.5774
+    """
+    if columns is None:
+        columns = np.arange(1, (len(elev) - 1) // 2 + 1)
+    x = _HEX_COLUMN_SPACING * np.asarray(columns)
+    (m, c) = np.polyfit(x, elev[columns], 1)
+    return float(abs(m))
+
+
+def run_convergence_study(params, caps, model_class=GrainHill,
+                          num_replicates=1, start_seed=0,
+                          slope_columns=None):
+    """Run a model at a series of motion-rate caps, and compare the results.
+
+    Parameters
+    ----------
+    params : dict
+        Model parameters. Each run uses a copy with motion_rate_cap set.
+    caps : sequence of float or None
+        Motion-rate caps to try. The last one is used as the reference
+        (None means no cap).
+    model_class : class
+        GrainHill or GrainFacetSimulator.
+    num_replicates : int
+        Number of runs at each cap; profiles are averaged over replicates.
+    start_seed : int
+        Random seed for the first replicate (replicate i uses
+        start_seed + i, so every cap sees the same set of seeds).
+    slope_columns : array of int (optional)
+        Columns used to measure slope (see profile_slope()).
+
+    Returns
+    -------
+    list of dict
+        One entry per cap, in the order given, with the cap, settling rate,
+        mean wall-clock time per run, mean elevation and soil profiles,
+        slope, and the RMS differences in elevation and soil thickness and
+        the absolute difference in slope from the reference.
+
+    Examples
+    --------
+    >>> params = {'grid_size': (6, 7), 'run_duration': 2.0,
+    ...           'disturbance_rate': 0.1, 'weathering_rate': 0.1}
+    >>> import contextlib, io
+    >>> with contextlib.redirect_stdout(io.StringIO()):  # progress reports
+    ...     results = run_convergence_study(params, [100.0, None])
+    >>> [r['cap'] for r in results]
+    [100.0, None]
+    >>> round(results[0]['settling_rate'], 6)  # 100 x uplift rate of 1/yr
+    100.0
+    >>> (results[1]['profile_rms_diff'], results[1]['slope_diff'])
+    (0.0, 0.0)
+    """
+    results = []
+    for cap in caps:
+        p = dict(params)
+        p['motion_rate_cap'] = cap
+        elev_sum = 0.0
+        soil_sum = 0.0
+        wall_time = 0.0
+        for i in range(num_replicates):
+            p['seed'] = start_seed + i
+            model = model_class(**p)
+            start = time.time()
+            model.run()
+            wall_time += time.time() - start
+            (elev, soil) = get_profile(model)
+            elev_sum = elev_sum + elev
+            soil_sum = soil_sum + soil
+        elev = elev_sum / num_replicates
+        soil = soil_sum / num_replicates
+        results.append({
+            'cap': cap,
+            'settling_rate': model.settling_rate,
+            'wall_time': wall_time / num_replicates,
+            'elev': elev,
+            'soil': soil,
+            'slope': profile_slope(elev, slope_columns),
+        })
+
+    ref = results[-1]
+    for r in results:
+        r['profile_rms_diff'] = float(np.sqrt(np.mean((r['elev']
+                                                       - ref['elev']) ** 2)))
+        r['soil_rms_diff'] = float(np.sqrt(np.mean((r['soil']
+                                                    - ref['soil']) ** 2)))
+        r['slope_diff'] = abs(r['slope'] - ref['slope'])
+    return results
+
+
+def smallest_converged_cap(results, profile_tol=0.5, soil_tol=0.5,
+                           slope_tol=0.05):
+    """Return the smallest cap whose results, and those of every larger cap
+    in the study, are within the given tolerances of the reference.
+
+    Tolerances for profile and soil thickness are RMS differences in cell
+    widths. Returns None (no cap) if no capped run qualifies.
+
+    Examples
+    --------
+    >>> results = [{'cap': 10.0, 'profile_rms_diff': 2.0, 'soil_rms_diff': 0.1,
+    ...             'slope_diff': 0.01},
+    ...            {'cap': 100.0, 'profile_rms_diff': 0.2, 'soil_rms_diff': 0.1,
+    ...             'slope_diff': 0.01},
+    ...            {'cap': None, 'profile_rms_diff': 0.0, 'soil_rms_diff': 0.0,
+    ...             'slope_diff': 0.0}]
+    >>> smallest_converged_cap(results)
+    100.0
+    """
+    ordered = sorted([r for r in results if r['cap'] is not None],
+                     key=lambda r: r['cap'], reverse=True)
+    best = None
+    for r in ordered:
+        if (r['profile_rms_diff'] > profile_tol
+                or r['soil_rms_diff'] > soil_tol
+                or r['slope_diff'] > slope_tol):
+            break
+        best = r['cap']
+    return best
+
+
+def format_convergence_report(results):
+    """Return a table of convergence-study results as a string."""
+    lines = ['{:>10} {:>12} {:>10} {:>8} {:>10} {:>10} {:>10}'.format(
+        'cap', 'settle rate', 'wall (s)', 'slope', 'elev rms', 'soil rms',
+        'slope diff')]
+    for r in results:
+        cap = 'none' if r['cap'] is None else '{:g}'.format(r['cap'])
+        lines.append(
+            '{:>10} {:>12.4g} {:>10.3f} {:>8.4f} {:>10.4f} {:>10.4f} '
+            '{:>10.4f}'.format(cap, r['settling_rate'], r['wall_time'],
+                               r['slope'], r['profile_rms_diff'],
+                               r['soil_rms_diff'], r['slope_diff']))
+    return '\n'.join(lines)
+
+
+def main():
+    """Run a convergence study from the command line."""
+    from landlab import load_params
+
+    try:
+        params = load_params(sys.argv[1])
+        caps = [None if c.lower() == 'none' else float(c)
+                for c in sys.argv[2:]]
+    except IndexError:
+        print('Usage: python -m grainhill.convergence <input file> '
+              '<cap> [<cap> ...]')
+        sys.exit(1)
+
+    if 'number_of_node_rows' in params:
+        params['grid_size'] = (params.pop('number_of_node_rows'),
+                               params.pop('number_of_node_columns'))
+    model_class = GrainHill
+    if 'facet' in params.pop('model_type', 'grain_hill').lower():
+        model_class = GrainFacetSimulator
+
+    results = run_convergence_study(params, caps, model_class)
+    print(format_convergence_report(results))
+    print('Smallest converged cap: ' + str(smallest_converged_cap(results)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,313 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+cost_estimate.py: GrainHill module for predicting the wall time and memory of
+a run before it starts, and for packing the runs of a sweep onto cores.
+
+estimate_cost() reads the parameters of a run (an input file or a dict) and
+counts units of work, each roughly the cost of moving one node through one
+uplift:
+
+- building the grid and CA, in proportion to the number of nodes;
+- uplift (or fault slip), in proportion to the number of occupied nodes,
+  which grow by one row per uplift interval until the hill reaches the size
+  of the steady hill of initial_conditions.steady_hill_node_states() (or the
+  largest facet of initial_conditions.planar_facet_node_states(), one at
+  the dip of the fault);
+- grain motion: each disturbance event sets a grain moving, and it hops on
+  the order of once per column of the domain before it comes to rest. Each
+  hop is one event however fast grains move, so this term does not depend
+  on the settling rate;
+- weathering and dissolution events, in proportion to the number of surface
+  columns.
+
+The expected number of grains in motion, the rate of hops divided by the
+settling rate (from calculate_settling_rate(), capped as by
+motion_rate_cap), is reported too, but does not change the estimate.
+Moderate caps make no measurable difference to wall time, but a cap of
+about 100 or less (a settling rate within 100 times the fastest slow
+process) makes runs faster than estimated, by an amount this model does not
+predict. For example, a 41x61 hill (300 years, disturbance rate 0.01,
+uplift interval 10) ran in 2.4 s uncapped, 2.7 s at motion_rate_cap=1000,
+1.6 s at 100, and 0.6 s at 10.
+
+The weights of these terms are empirical fits to timed runs. The seconds per
+unit of work and the memory per node depend on the machine, and are
+measured by calibrate(), which times a short built-in profiling run. The
+estimates are meant for ranking and packing runs: they were within 15% of
+the runs they were fitted to, but runs far from those (very large grids,
+facets, tau-leaping, other CTS engines) may be off by more.
+
+Command-line use:
+
+    python -m grainhill.cost_estimate <input file> [<input file> ...]
+
+prints the estimates, longest first, and an assignment of the runs to the
+machine's cores.
+
+@author: gtucker
+"""
+
+import sys
+import time
+
+import numpy as np
+
+from .grain_hill import calculate_settling_rate, cap_settling_rate
+from .initial_conditions import (planar_facet_node_states,
+                                 steady_hill_node_states)
+
+INIT_WORK_PER_NODE = 2.3  # work to build the grid and CA, per node
+MOTION_WORK_PER_HOP = 0.092  # work per grain hop, relative to a node uplift
+SLOW_EVENT_WORK = 0.5  # work per weathering or dissolution event
+INITIAL_ROWS = 2  # occupied rows of the flat initial condition
+FACET_DIP = 60.0  # steepest facet (the fault dip), for the largest facet
+
+# Default calibration (single core, 2026-era x86-64), used if calibrate()
+# has not been run
+DEFAULT_CALIBRATION = {'seconds_per_unit': 2.1e-4,
+                       'bytes_per_node': 1500.0,
+                       'base_memory': 1.7e8}
+
+_PROFILE_PARAMS = {'grid_size': (21, 31), 'run_duration': 40.0,
+                   'uplift_interval': 2.0, 'disturbance_rate': 0.1,
+                   'weathering_rate': 0.0}
+_MEMORY_GRID_SIZES = ((21, 31), (61, 91))
+
+
+def _read_params(params):
+    """Return a dict of parameters from an input file name or a dict, with
+    grid_size and model_type, as BmiGrainHill.initialize() reads them."""
+    if isinstance(params, str):
+        from landlab.core import load_params
+        params = load_params(params)
+    p = dict(params)
+    if 'number_of_node_rows' in p:
+        p['grid_size'] = (int(p.pop('number_of_node_rows')),
+                          int(p.pop('number_of_node_columns')))
+    p.setdefault('model_type', 'grain_hill')
+    return p
+
+
+def estimate_work(params):
+    """Return the units of work of a run, and the expected number of grains
+    in motion.
+
+    Parameters
+    ----------
+    params : dict
+        GrainHill, BlockHill, or GrainFacetSimulator parameters, with
+        grid_size (or number_of_node_rows and number_of_node_columns) and,
+        optionally, model_type as in an input file.
+
+    Examples
+    --------
+    >>> (work, mobile) = estimate_work({'grid_size': (21, 31),
+    ...                                 'run_duration': 300.0,
+    ...                                 'uplift_interval': 10.0,
+    ...                                 'disturbance_rate': 0.1,
+    ...                                 'weathering_rate': 0.0})
+    >>> round(work, -3)
+    10000.0
+    >>> mobile < 1.0e-3  # grains settle almost at once
+    True
+    """
+    p = _read_params(params)
+    is_facet = 'facet' in p['model_type'].lower()
+    default_rate = 0.0 if is_facet else 1.0
+    d = p.get('disturbance_rate', default_rate)
+    w = p.get('weathering_rate', default_rate)
+    diss = p.get('dissolution_rate', 0.0)
+    ui = p.get('uplift_interval', 1.0)
+    run_duration = p.get('run_duration', 1.0)
+    (num_rows, num_cols) = p['grid_size']
+    num_nodes = num_rows * num_cols
+
+    # Occupied nodes, growing by a row per uplift up to the steady size
+    if is_facet:
+        steady = planar_facet_node_states(p['grid_size'],
+                                          p.get('fault_x', 1.0), FACET_DIP,
+                                          cell_width=p.get('cell_width', 1.0))
+    else:
+        steady = steady_hill_node_states(
+            p['grid_size'], d, w, ui,
+            rock_state_for_uplift=p.get('rock_state_for_uplift', 7))
+    num_uplifts = int(min(run_duration, p.get('uplift_duration',
+                                              run_duration)) / ui)
+    occupied = np.minimum((INITIAL_ROWS + np.arange(1, num_uplifts + 1))
+                          * num_cols, np.count_nonzero(steady))
+
+    # Grains set moving by disturbance, and their hops; the number in motion
+    # at once depends on the settling rate, but the number of hops does not
+    settling_rate = cap_settling_rate(
+        calculate_settling_rate(p.get('cell_width', 1.0),
+                                p.get('grav_accel', 9.8)),
+        p.get('motion_rate_cap', None), (d, w, diss, 1.0 / ui))
+    hop_rate = d * num_cols * num_cols
+    mobile_grains = hop_rate / settling_rate
+
+    work = (INIT_WORK_PER_NODE * num_nodes + np.sum(occupied)
+            + MOTION_WORK_PER_HOP * hop_rate * run_duration
+            + SLOW_EVENT_WORK * (w + diss) * num_cols * run_duration)
+    return float(work), float(mobile_grains)
+
+
+def estimate_cost(params, calibration=None):
+    """Predict the wall time and peak memory of a run.
+
+    Parameters
+    ----------
+    params : str or dict
+        Name of an input file, or a dict of parameters (see
+        estimate_work()).
+    calibration : dict (optional)
+        Result of calibrate(); default is DEFAULT_CALIBRATION.
+
+    Returns
+    -------
+    dict
+        wall_time (s), peak_memory (bytes), work (units), and
+        mobile_grains (expected number of grains in motion).
+
+    Examples
+    --------
+    >>> est = estimate_cost({'grid_size': (61, 91), 'run_duration': 300.0,
+    ...                      'uplift_interval': 10.0,
+    ...                      'disturbance_rate': 0.01,
+    ...                      'weathering_rate': 0.0})
+    >>> round(est['wall_time'])
+    12
+    >>> round(est['peak_memory'] / 1.0e6)
+    178
+    """
+    if calibration is None:
+        calibration = DEFAULT_CALIBRATION
+    p = _read_params(params)
+    (work, mobile_grains) = estimate_work(p)
+    num_nodes = p['grid_size'][0] * p['grid_size'][1]
+    return {'wall_time': calibration['seconds_per_unit'] * work,
+            'peak_memory': (calibration['base_memory']
+                            + calibration['bytes_per_node'] * num_nodes),
+            'work': work,
+            'mobile_grains': mobile_grains}
+
+
+def _max_rss_bytes():
+    """Return the peak resident memory of this process, or 0 if unknown."""
+    try:
+        import resource
+    except ImportError:  # not on Windows
+        return 0.0
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':  # bytes on macOS, kilobytes elsewhere
+        return float(max_rss)
+    return 1024.0 * max_rss
+
+
+def calibrate():
+    """Time a short built-in profiling run on this machine, and measure the
+    memory of models of two sizes, to calibrate estimate_cost().
+
+    Returns a dict of seconds_per_unit (of work), bytes_per_node, and
+    base_memory (the memory used before any model is built).
+
+    Examples
+    --------
+    >>> import contextlib, io
+    >>> with contextlib.redirect_stdout(io.StringIO()):  # progress reports
+    ...     cal = calibrate()
+    >>> sorted(cal)
+    ['base_memory', 'bytes_per_node', 'seconds_per_unit']
+    >>> bool(cal['seconds_per_unit'] > 0.0 and cal['bytes_per_node'] > 0.0)
+    True
+    """
+    import tracemalloc
+
+    from .grain_hill import GrainHill
+
+    base_memory = _max_rss_bytes()
+
+    start = time.time()
+    gh = GrainHill(**_PROFILE_PARAMS)
+    gh.run()
+    seconds_per_unit = (time.time() - start) / estimate_work(
+        _PROFILE_PARAMS)[0]
+
+    peaks = []
+    for grid_size in _MEMORY_GRID_SIZES:
+        tracemalloc.start()
+        gh = GrainHill(grid_size, run_duration=1.0, disturbance_rate=0.1,
+                       weathering_rate=0.0)
+        gh.run()
+        peaks.append(tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+        del gh
+    num_nodes = [r * c for (r, c) in _MEMORY_GRID_SIZES]
+    bytes_per_node = (peaks[1] - peaks[0]) / (num_nodes[1] - num_nodes[0])
+    base_memory += max(peaks[0] - bytes_per_node * num_nodes[0], 0.0)
+
+    return {'seconds_per_unit': seconds_per_unit,
+            'bytes_per_node': max(bytes_per_node, 1.0),
+            'base_memory': base_memory}
+
+
+def pack_jobs(wall_times, num_cores):
+    """Assign jobs to cores, longest first, each to the core that becomes
+    free first.
+
+    Parameters
+    ----------
+    wall_times : list of float
+        Estimated wall time of each job.
+    num_cores : int
+        Number of cores.
+
+    Returns
+    -------
+    (list of list of int, float)
+        Indices of the jobs on each core, in the order to run them, and the
+        estimated time for all of them to finish.
+
+    Examples
+    --------
+    >>> pack_jobs([1.0, 5.0, 2.0, 4.0, 3.0], 2)
+    ([[1, 2, 0], [3, 4]], 8.0)
+    """
+    cores = [[] for _ in range(num_cores)]
+    load = np.zeros(num_cores)
+    for job in np.argsort(-np.asarray(wall_times), kind='stable'):
+        core = int(np.argmin(load))
+        cores[core].append(int(job))
+        load[core] += wall_times[job]
+    return cores, float(np.amax(load))
+
+
+def main():
+    """Estimate the costs of runs from the command line."""
+    import multiprocessing
+
+    filenames = sys.argv[1:]
+    if not filenames:
+        print('Usage: python -m grainhill.cost_estimate <input file> '
+              '[<input file> ...]')
+        sys.exit(1)
+
+    calibration = calibrate()
+    estimates = [estimate_cost(f, calibration) for f in filenames]
+    wall_times = [e['wall_time'] for e in estimates]
+    print('{:>12} {:>12} {:>14}  {}'.format('wall (s)', 'memory (MB)',
+                                           'mobile grains', 'input file'))
+    for i in np.argsort(wall_times)[::-1]:
+        print('{:>12.4g} {:>12.1f} {:>14.3g}  {}'.format(
+            wall_times[i], estimates[i]['peak_memory'] / 1.0e6,
+            estimates[i]['mobile_grains'], filenames[i]))
+
+    (cores, finish) = pack_jobs(wall_times, multiprocessing.cpu_count())
+    for (i, jobs) in enumerate(cores):
+        print('Core ' + str(i) + ': '
+              + ' '.join(filenames[j] for j in jobs))
+    print('Estimated time to finish: {:.4g} s'.format(finish))
+
+
+if __name__ == '__main__':
+    main()
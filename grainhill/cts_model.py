@@ -55,6 +55,13 @@ class CTSModel(object):
         # Duration for run
         self.run_duration = run_duration
 
+        # Remember grid and CA settings, in case the CA needs to be rebuilt
+        self.cts_type = cts_type
+        self.grid_orientation = grid_orientation
+        self.node_layout = node_layout
+        self.closed_boundaries = closed_boundaries
+        self.seed = seed
+
         # Create a grid
         self.create_grid_and_node_state_field(grid_size[0], grid_size[1],
                                               grid_orientation, node_layout,
@@ -82,27 +89,52 @@ class CTSModel(object):
         xn_list = self.transition_list()
 
         # Create the CA object
+        self.ca = self.create_ca(cts_type, ns_dict, xn_list, nsg, prop_data,
+                                 prop_reset_value, seed)
+
+        # Initialize graphics
+        self._show_plots = show_plots
+        if show_plots:
+            self.initialize_plotting(**kwds)
+
+    def create_ca(self, cts_type, ns_dict, xn_list, nsg, prop_data,
+                  prop_reset_value, seed):
+        """Create and return a CellLab-CTS object of the given type."""
         if cts_type == 'raster':
             from landlab.ca.raster_cts import RasterCTS
-            self.ca = RasterCTS(self.grid, ns_dict, xn_list, nsg, prop_data,
-                                prop_reset_value, seed=seed)
+            ca = RasterCTS(self.grid, ns_dict, xn_list, nsg, prop_data,
+                           prop_reset_value, seed=seed)
         elif cts_type == 'oriented_raster':
             from landlab.ca.oriented_raster_cts import OrientedRasterCTS
-            self.ca = OrientedRasterCTS(self.grid, ns_dict, xn_list, nsg,
-                                        prop_data, prop_reset_value, seed=seed)
+            ca = OrientedRasterCTS(self.grid, ns_dict, xn_list, nsg,
+                                   prop_data, prop_reset_value, seed=seed)
         elif cts_type == 'hex':
             from landlab.ca.hex_cts import HexCTS
-            self.ca = HexCTS(self.grid, ns_dict, xn_list, nsg, prop_data,
-                             prop_reset_value, seed=seed)
+            ca = HexCTS(self.grid, ns_dict, xn_list, nsg, prop_data,
+                        prop_reset_value, seed=seed)
+        elif cts_type == 'oriented_hex_jit':
+            from grainhill.jit_cts import JitOrientedHexCTS
+            ca = JitOrientedHexCTS(self.grid, ns_dict, xn_list, nsg, prop_data,
+                                   prop_reset_value, seed=seed)
+        elif cts_type == 'oriented_hex_crn':
+            from grainhill.jit_cts import JitOrientedHexCTS
+            ca = JitOrientedHexCTS(self.grid, ns_dict, xn_list, nsg, prop_data,
+                                   prop_reset_value, seed=seed,
+                                   common_random_numbers=True)
+        elif cts_type == 'oriented_hex_ssa':
+            from grainhill.ssa_cts import CompositionRejectionCTS
+            ca = CompositionRejectionCTS(self.grid, ns_dict, xn_list, nsg,
+                                         prop_data, prop_reset_value,
+                                         seed=seed)
+        elif cts_type == 'oriented_hex_calendar':
+            from grainhill.calendar_queue import CalendarQueueCTS
+            ca = CalendarQueueCTS(self.grid, ns_dict, xn_list, nsg, prop_data,
+                                  prop_reset_value, seed=seed)
         else:
             from landlab.ca.oriented_hex_cts import OrientedHexCTS
-            self.ca = OrientedHexCTS(self.grid, ns_dict, xn_list, nsg,
-                                     prop_data, prop_reset_value, seed=seed)
-
-        # Initialize graphics
-        self._show_plots = show_plots
-        if show_plots:
-            self.initialize_plotting(**kwds)
+            ca = OrientedHexCTS(self.grid, ns_dict, xn_list, nsg, prop_data,
+                                prop_reset_value, seed=seed)
+        return ca
 
     def _set_closed_boundaries_for_hex_grid(self, closed_boundaries):
         """Setup one or more closed boundaries for a hex grid.
@@ -0,0 +1,410 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+ensemble_stats.py: GrainHill module for accumulating statistics of an
+ensemble of runs as the members finish, without storing their outputs.
+
+An EnsembleStatistics object is updated with each member's state at each of
+a fixed set of sample times, and holds, for each sample time:
+
+- the mean and variance of the elevation and soil thickness of each column
+  of the profile (RunningMoments, using Welford's algorithm), and
+  histograms of them (HistogramSketch) from which quantiles are read;
+- the count of members in each node state at each node, which gives the
+  probability of each state at each node;
+- if the grid has a cosmogenic_nuclide__concentration field (see
+  cosmogenic_irradiator.py), the moments and a log-binned histogram of the
+  concentration of the surface grain of each column.
+
+Its memory depends on the grid size, the number of sample times and the
+histogram bins, but not on the number of members. Accumulators of the same
+shape can be merged (the moments with the pairwise update of Chan et al.,
+the histograms and counts by adding them), so run_ensemble() has each
+worker process accumulate its share of the members and merges the workers'
+accumulators when the last member finishes.
+
+Profile heights are multiples of half a cell width, so histograms with
+half-cell bins give exact quantiles. Concentrations are binned
+geometrically, so their quantiles have a bounded relative error (as in a
+DDSketch).
+
+@author: gtucker
+"""
+
+import multiprocessing
+import traceback
+
+import numpy as np
+
+from .cosmogenic_irradiator import row_col_to_id
+from .grain_hill import get_profile
+
+COSMO_FIELD = 'cosmogenic_nuclide__concentration'
+
+
+class RunningMoments(object):
+    """Running count, mean, and variance of a stream of arrays of one shape,
+    element by element. NaN values are skipped.
+
+    Parameters
+    ----------
+    shape : tuple of int
+        Shape of the arrays.
+
+    Examples
+    --------
+    >>> a = RunningMoments((2,))
+    >>> for x in ([1.0, 5.0], [2.0, np.nan], [3.0, 7.0]):
+    ...     a.add(np.array(x))
+    >>> a.count.tolist(), a.mean.tolist(), a.variance().tolist()
+    ([3, 2], [2.0, 6.0], [1.0, 2.0])
+    >>> b = RunningMoments((2,))
+    >>> b.add(np.array([6.0, 6.0]))
+    >>> a.merge(b)
+    >>> a.mean.tolist(), a.variance().tolist()
+    ([3.0, 6.0], [4.666666666666667, 1.0])
+    """
+
+    def __init__(self, shape):
+        """Initialize a RunningMoments with no values."""
+        self.count = np.zeros(shape, dtype=np.int64)
+        self.mean = np.zeros(shape)
+        self.m2 = np.zeros(shape)  # sum of squared deviations from the mean
+
+    def add(self, values, index=()):
+        """Add an array of values (Welford's update), to the elements at an
+        index (a basic index, such as an int, for a stream of sub-arrays)."""
+        (count, mean, m2) = (self.count[index], self.mean[index],
+                             self.m2[index])
+        ok = np.isfinite(values)
+        count[ok] += 1
+        delta = values[ok] - mean[ok]
+        mean[ok] += delta / count[ok]
+        m2[ok] += delta * (values[ok] - mean[ok])
+
+    def merge(self, other):
+        """Add the values accumulated by another RunningMoments."""
+        count = self.count + other.count
+        ok = count > 0
+        delta = other.mean[ok] - self.mean[ok]
+        weight = other.count[ok] / count[ok]
+        self.mean[ok] += delta * weight
+        self.m2[ok] += other.m2[ok] + delta * delta * self.count[ok] * weight
+        self.count = count
+
+    def variance(self):
+        """Return the sample variance (NaN where there are fewer than two
+        values)."""
+        var = np.full(self.mean.shape, np.nan)
+        ok = self.count > 1
+        var[ok] = self.m2[ok] / (self.count[ok] - 1)
+        return var
+
+
+class HistogramSketch(object):
+    """Histograms, on fixed bins, of a stream of arrays of one shape,
+    element by element, for estimating quantiles. Values outside the bins
+    are counted in the first or last bin; NaN values are skipped.
+
+    Parameters
+    ----------
+    shape : tuple of int
+        Shape of the arrays.
+    edges : array of float
+        Increasing edges of the bins.
+
+    Examples
+    --------
+    >>> h = HistogramSketch((1,), edges=np.arange(-0.25, 5.0, 0.5))
+    >>> for x in (0.0, 1.5, 1.5, 2.0, 4.5):
+    ...     h.add(np.array([x]))
+    >>> h.quantile(0.5).tolist(), h.quantile(1.0).tolist()
+    ([1.5], [4.5])
+    """
+
+    def __init__(self, shape, edges):
+        """Initialize a HistogramSketch with no values."""
+        self.edges = np.asarray(edges, dtype=float)
+        self.counts = np.zeros(tuple(shape) + (len(self.edges) - 1,),
+                               dtype=np.int64)
+
+    def add(self, values, index=()):
+        """Add an array of values, to the elements at an index (as for
+        RunningMoments.add())."""
+        counts = self.counts[index].reshape(-1, self.counts.shape[-1])
+        values = values.ravel()
+        (elements,) = np.where(np.isfinite(values))
+        bins = np.clip(np.searchsorted(self.edges, values[elements],
+                                       side='right') - 1,
+                       0, counts.shape[1] - 1)
+        counts[elements, bins] += 1
+
+    def merge(self, other):
+        """Add the values counted by another HistogramSketch."""
+        self.counts += other.counts
+
+    def quantile(self, q):
+        """Return the q-th quantile (0 <= q <= 1) of each element, as the
+        middle of the bin that holds it (NaN where there are no values)."""
+        cum = np.cumsum(self.counts, axis=-1)
+        total = cum[..., -1:]
+        target = np.maximum(np.ceil(q * total), 1)
+        bins = np.minimum(np.sum(cum < target, axis=-1),
+                          self.counts.shape[-1] - 1)
+        middles = 0.5 * (self.edges[:-1] + self.edges[1:])
+        return np.where(total[..., 0] > 0, middles[bins], np.nan)
+
+
+def log_edges(min_value, max_value, relative_accuracy=0.02):
+    """Return bin edges for a HistogramSketch of positive values: one bin
+    from zero to min_value, then geometric bins up to max_value, so that the
+    middle of each of those is within relative_accuracy of any value in it.
+
+    Examples
+    --------
+    >>> e = log_edges(1.0, 100.0, 0.1)
+    >>> len(e), float(e[1]), round(float(e[2]), 4), round(float(e[-1]), 1)
+    (25, 1.0, 1.2222, 101.0)
+    """
+    gamma = (1.0 + relative_accuracy) / (1.0 - relative_accuracy)
+    num_bins = int(np.ceil(np.log(max_value / min_value) / np.log(gamma)))
+    return np.concatenate(([0.0],
+                           min_value * gamma ** np.arange(num_bins + 1)))
+
+
+def surface_concentration(model):
+    """Return the cosmogenic nuclide concentration of the highest occupied
+    node of each column of a model's grid (NaN for empty columns).
+
+    Examples
+    --------
+    >>> from grainhill import GrainHill
+    >>> gh = GrainHill((3, 5), prop_data=COSMO_FIELD, prop_reset_value=0.0)
+    >>> from grainhill import CosmogenicIrradiator
+    >>> CosmogenicIrradiator(gh, 1.0, 2.0).add_cosmos(1.0)
+    >>> np.round(surface_concentration(gh), 3).tolist()
+    [0.0, 0.779, 0.779, 0.779, 0.0]
+    """
+    grid = model.grid
+    nc = grid.number_of_node_columns
+    cosmo = grid.at_node[COSMO_FIELD]
+    conc = np.full(nc, np.nan)
+    for col in range(nc):
+        nodes = np.arange(row_col_to_id(0, col, nc), grid.number_of_nodes, nc)
+        (occupied,) = np.where(model.ca.node_state[nodes] > 0)
+        if len(occupied) > 0:
+            conc[col] = cosmo[model.ca.propid[nodes[occupied[-1]]]]
+    return conc
+
+
+class EnsembleStatistics(object):
+    """Streaming statistics of an ensemble of runs at a set of sample times.
+
+    Accumulators are created when the first member is added, with shapes
+    taken from it; all members must have the same grid and states.
+
+    Parameters
+    ----------
+    num_samples : int
+        Number of sample times.
+    cosmo_range : (float, float)
+        Smallest (non-zero) and largest concentrations binned.
+    cosmo_relative_accuracy : float
+        Relative accuracy of the concentration quantiles.
+
+    Examples
+    --------
+    >>> from grainhill import GrainHill
+    >>> stats = EnsembleStatistics()
+    >>> for seed in range(3):
+    ...     stats.add(GrainHill((3, 5), seed=seed))
+    >>> stats.elevation.mean.tolist()
+    [[0.0, 1.5, 1.0, 1.5, 0.0]]
+    >>> stats.elevation_quantile(0.5).tolist()
+    [[0.0, 1.5, 1.0, 1.5, 0.0]]
+    >>> stats.occupancy_probability(7)[0, :5].tolist()
+    [0.0, 1.0, 0.0, 1.0, 1.0]
+    >>> other = EnsembleStatistics()
+    >>> other.add(GrainHill((3, 5)))
+    >>> stats.merge(other)
+    >>> stats.num_members.tolist()
+    [4]
+    """
+
+    def __init__(self, num_samples=1, cosmo_range=(1.0e-3, 1.0e6),
+                 cosmo_relative_accuracy=0.02):
+        """Initialize an EnsembleStatistics with no members."""
+        self.num_samples = num_samples
+        self.cosmo_range = cosmo_range
+        self.cosmo_relative_accuracy = cosmo_relative_accuracy
+        self.num_members = np.zeros(num_samples, dtype=np.int64)
+        self.elevation = None
+
+    def _create_accumulators(self, model, num_cols):
+        """Create the accumulators, with shapes for a model whose profile
+        has num_cols columns."""
+        (num_rows, grid_cols) = (model.grid.number_of_node_rows,
+                                 model.grid.number_of_node_columns)
+        shape = (self.num_samples, num_cols)
+        height_edges = np.arange(-0.25, num_rows + 0.5, 0.5)
+        self.elevation = RunningMoments(shape)
+        self.elevation_sketch = HistogramSketch(shape, height_edges)
+        self.soil_thickness = RunningMoments(shape)
+        self.soil_thickness_sketch = HistogramSketch(shape, height_edges)
+        self.state_counts = np.zeros((self.num_samples,
+                                      model.ca.num_node_states,
+                                      model.grid.number_of_nodes),
+                                     dtype=np.int64)
+        if COSMO_FIELD in model.grid.at_node:
+            self.concentration = RunningMoments((self.num_samples,
+                                                 grid_cols))
+            self.concentration_sketch = HistogramSketch(
+                (self.num_samples, grid_cols),
+                log_edges(self.cosmo_range[0], self.cosmo_range[1],
+                          self.cosmo_relative_accuracy))
+        else:
+            self.concentration = None
+            self.concentration_sketch = None
+
+    def add(self, model, sample=0):
+        """Add the current state of a member (a GrainHill, BlockHill, or
+        GrainFacetSimulator) at a sample time (given by its index)."""
+        (elev, soil) = get_profile(model)
+        if self.elevation is None:
+            self._create_accumulators(model, len(elev))
+        self.num_members[sample] += 1
+        self.elevation.add(elev, sample)
+        self.elevation_sketch.add(elev, sample)
+        self.soil_thickness.add(soil, sample)
+        self.soil_thickness_sketch.add(soil, sample)
+        self.state_counts[sample, model.ca.node_state,
+                          np.arange(model.grid.number_of_nodes)] += 1
+        if self.concentration is not None:
+            conc = surface_concentration(model)
+            self.concentration.add(conc, sample)
+            self.concentration_sketch.add(conc, sample)
+
+    def merge(self, other):
+        """Add the members accumulated by another EnsembleStatistics."""
+        if other.elevation is None:
+            return
+        if self.elevation is None:
+            self.__dict__.update(other.__dict__)
+            return
+        self.num_members += other.num_members
+        for name in ('elevation', 'elevation_sketch', 'soil_thickness',
+                     'soil_thickness_sketch', 'concentration',
+                     'concentration_sketch'):
+            if getattr(self, name) is not None:
+                getattr(self, name).merge(getattr(other, name))
+        self.state_counts += other.state_counts
+
+    def occupancy_probability(self, state):
+        """Return the probability of a node state at each node, at each
+        sample time (an array of shape (num_samples, number_of_nodes))."""
+        members = np.maximum(self.num_members, 1)[:, np.newaxis]
+        return self.state_counts[:, state, :] / members
+
+    def elevation_quantile(self, q):
+        """Return the q-th quantile of the elevation of each column."""
+        return self.elevation_sketch.quantile(q)
+
+    def soil_thickness_quantile(self, q):
+        """Return the q-th quantile of the soil thickness of each column."""
+        return self.soil_thickness_sketch.quantile(q)
+
+    def concentration_quantile(self, q):
+        """Return the q-th quantile of the surface concentration of each
+        column."""
+        return self.concentration_sketch.quantile(q)
+
+
+def _run_members(members, sample_times, stats, advance_fn):
+    """Run each member, adding its state at each sample time to stats."""
+    from .result_cache import create_model, normalize_params
+
+    for params in members:
+        model = create_model(normalize_params(params))
+        for (i, sample_time) in enumerate(sample_times):
+            advance_fn(model, sample_time)
+            stats.add(model, i)
+    return stats
+
+
+def _run_worker(conn, members, sample_times, stats, advance_fn):
+    """Accumulate statistics of some members in a forked process, and send
+    them, or the traceback of any error, through conn."""
+    try:
+        conn.send((True, _run_members(members, sample_times, stats,
+                                      advance_fn)))
+    except Exception:
+        conn.send((False, traceback.format_exc()))
+    conn.close()
+
+
+def _advance(model, run_to):
+    """Run a model to a given time."""
+    model.run(run_to)
+
+
+def run_ensemble(members, sample_times, max_processes=1,
+                 advance_fn=_advance, **kwargs):
+    """Run the members of an ensemble, and return their EnsembleStatistics.
+
+    Parameters
+    ----------
+    members : list of dict
+        Parameters of each member (see result_cache.normalize_params()).
+    sample_times : sequence of float
+        Increasing times at which the members are sampled.
+    max_processes : int
+        Number of worker processes. Each takes every max_processes-th
+        member; their statistics are merged when they finish. With more
+        than one, processes are forked (not available on Windows).
+    advance_fn : function
+        Function of a model and a time that runs the model to that time
+        (default calls its run method). Use it, for example, to add
+        cosmogenic nuclides with a CosmogenicIrradiator between runs.
+    **kwargs
+        Other parameters of EnsembleStatistics.
+
+    Examples
+    --------
+    >>> members = [{'grid_size': (5, 7), 'run_duration': 20.0,
+    ...             'uplift_interval': 5.0, 'disturbance_rate': 0.01,
+    ...             'weathering_rate': 0.001, 'seed': s} for s in range(4)]
+    >>> import contextlib, io
+    >>> with contextlib.redirect_stdout(io.StringIO()):  # progress reports
+    ...     stats = run_ensemble(members, [10.0, 20.0], max_processes=2)
+    >>> stats.num_members.tolist()
+    [4, 4]
+    >>> stats.elevation.mean.shape
+    (2, 7)
+    """
+    sample_times = list(sample_times)
+    stats = EnsembleStatistics(len(sample_times), **kwargs)
+    if max_processes <= 1:
+        return _run_members(members, sample_times, stats, advance_fn)
+
+    if 'fork' not in multiprocessing.get_all_start_methods():
+        raise RuntimeError('run_ensemble requires processes to be forked '
+                           'when max_processes > 1')
+    context = multiprocessing.get_context('fork')
+    workers = []
+    for i in range(min(max_processes, len(members))):
+        (conn, child_conn) = context.Pipe(duplex=False)
+        process = context.Process(
+            target=_run_worker,
+            args=(child_conn, members[i::max_processes], sample_times,
+                  EnsembleStatistics(len(sample_times), **kwargs),
+                  advance_fn))
+        process.start()
+        child_conn.close()
+        workers.append((i, conn, process))
+    for (i, conn, process) in workers:
+        (ok, result) = conn.recv()
+        process.join()
+        if not ok:
+            raise RuntimeError('worker ' + str(i) + ' failed:\n' + result)
+        stats.merge(result)
+    return stats
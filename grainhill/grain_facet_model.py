@@ -4,13 +4,18 @@ Model of normal-fault facet evolution using CTS lattice grain approach.
 """
 
 import sys
-from grainhill import CTSModel, plot_hill, calculate_settling_rate
+from grainhill import (CTSModel, plot_hill, calculate_settling_rate,
+                       cap_settling_rate)
 from grainhill.lattice_grain import (lattice_grain_node_states,
                                      lattice_grain_transition_list)
 import time
 import numpy as np
 from landlab.ca.celllab_cts import Transition
 from landlab.ca.boundaries.hex_lattice_tectonicizer import LatticeNormalFault
+from grainhill.active_links import (ActiveLinkLatticeNormalFault,
+                                    compact_event_queue)
+from grainhill.tau_leaping import SlowProcessLeaper
+from grainhill.ballistic import BallisticFall
 
 
 SECONDS_PER_YEAR = 365.25 * 24 * 3600
@@ -28,22 +33,46 @@ class GrainFacetSimulator(CTSModel):
                  plot_interval=1.0e99, friction_coef=0.3,
                  fault_x=1.0, cell_width=1.0, grav_accel=9.8,
                  init_state_grid=None, save_plots=False, plot_filename=None,
-                 plot_filetype='.png', seed=0, **kwds):
+                 plot_filetype='.png', seed=0, opt_exclude_inert_links=True,
+                 opt_tau_leap_slow=False, tau_leap_tolerance=0.05,
+                 opt_ballistic_fall=False, motion_rate_cap=None,
+                 cts_type='oriented_hex', **kwds):
         """Call the initialize() method."""
         self.initialize(grid_size, report_interval, run_duration,
                         output_interval, disturbance_rate, weathering_rate,
                         dissolution_rate, uplift_interval,
                         baselevel_rise_interval, plot_interval, friction_coef,
                         fault_x,cell_width, grav_accel, init_state_grid,
-                        save_plots, plot_filename, plot_filetype, seed, **kwds)
+                        save_plots, plot_filename, plot_filetype, seed,
+                        opt_exclude_inert_links, opt_tau_leap_slow,
+                        tau_leap_tolerance, opt_ballistic_fall,
+                        motion_rate_cap, cts_type, **kwds)
 
     def initialize(self, grid_size, report_interval, run_duration,
                    output_interval, disturbance_rate, weathering_rate,
                    dissolution_rate, uplift_interval, baselevel_rise_interval,
                    plot_interval, friction_coef, fault_x, cell_width,
                    grav_accel, init_state_grid=None, save_plots=False,
-                   plot_filename=None, plot_filetype='.png', seed=0, **kwds):
-        """Initialize the grain hill model."""
+                   plot_filename=None, plot_filetype='.png', seed=0,
+                   opt_exclude_inert_links=True, opt_tau_leap_slow=False,
+                   tau_leap_tolerance=0.05, opt_ballistic_fall=False,
+                   motion_rate_cap=None, cts_type='oriented_hex', **kwds):
+        """Initialize the grain hill model.
+
+        If opt_tau_leap_slow is True, weathering, dissolution, and
+        disturbance are applied by tau-leaping rather than as CTS events (see
+        tau_leaping.SlowProcessLeaper).
+
+        If opt_ballistic_fall is True, grains falling straight down through
+        air jump to the bottom of the air column in a single event (see
+        ballistic.BallisticFall).
+
+        If motion_rate_cap is given, grain motion and collision rates are
+        limited to motion_rate_cap times the rate of the fastest slow process
+        (see grain_hill.cap_settling_rate()).
+
+        cts_type selects the CellLab-CTS engine (see GrainHill).
+        """
         self.disturbance_rate = disturbance_rate
         self.weathering_rate = weathering_rate
         self.dissolution_rate = dissolution_rate
@@ -51,8 +80,18 @@ class GrainFacetSimulator(CTSModel):
         self.baselevel_rise_interval = baselevel_rise_interval
         self.plot_interval = plot_interval
         self.friction_coef = friction_coef
-
-        self.settling_rate = calculate_settling_rate(cell_width, grav_accel)
+        self.opt_tau_leap_slow = opt_tau_leap_slow
+
+        self.uncapped_settling_rate = calculate_settling_rate(cell_width,
+                                                              grav_accel)
+        self.settling_rate = cap_settling_rate(
+            self.uncapped_settling_rate, motion_rate_cap,
+            (disturbance_rate, weathering_rate, dissolution_rate,
+             1.0 / uplift_interval))
+        if opt_ballistic_fall:
+            self.ballistic_fall = BallisticFall(self.settling_rate)
+        else:
+            self.ballistic_fall = None
 
         # Call base class init
         super(GrainFacetSimulator, self).initialize(grid_size=grid_size,
@@ -60,7 +99,7 @@ class GrainFacetSimulator(CTSModel):
                                           grid_orientation='vertical',
                                           grid_shape='rect',
                                           show_plots=False,
-                                          cts_type='oriented_hex',
+                                          cts_type=cts_type,
                                           run_duration=run_duration,
                                           output_interval=output_interval,
                                           plot_every_transition=False,
@@ -70,9 +109,25 @@ class GrainFacetSimulator(CTSModel):
                                           seed=seed)
 
         ns = self.grid.at_node['node_state']
-        self.uplifter = LatticeNormalFault(fault_x_intercept=fault_x,
-                                           grid=self.grid,
-                                           node_state=ns)
+        if opt_exclude_inert_links:
+            fault_class = ActiveLinkLatticeNormalFault
+            compact_event_queue(self.ca)
+        else:
+            fault_class = LatticeNormalFault
+        self.uplifter = fault_class(fault_x_intercept=fault_x,
+                                    grid=self.grid,
+                                    node_state=ns)
+
+        if opt_tau_leap_slow:
+            xn_list = self.add_weathering_and_disturbance_transitions([],
+                        self.disturbance_rate, self.weathering_rate,
+                        self.dissolution_rate)
+            self.leaper = SlowProcessLeaper(xn_list,
+                                            len(self.node_state_dictionary()),
+                                            tau_leap_tolerance)
+            self.leaper.update_leap_interval(self.ca)
+        else:
+            self.leaper = None
 
         # initialize plotting
         if plot_interval <= run_duration:
@@ -108,6 +163,12 @@ class GrainFacetSimulator(CTSModel):
         else:
             self.next_baselevel = self.run_duration + 1
 
+        # And slow processes, if tau-leaping
+        if self.leaper is not None:
+            self.next_leap = self.leaper.leap_interval
+        else:
+            self.next_leap = self.run_duration + 1
+
         self.current_time = 0.0
 
     def node_state_dictionary(self):
@@ -126,6 +187,10 @@ class GrainFacetSimulator(CTSModel):
         xn_list = lattice_grain_transition_list(g=self.settling_rate,
                                                 f=self.friction_coef,
                                                 motion=self.settling_rate)
+        if self.ballistic_fall is not None:
+            xn_list = self.ballistic_fall.add_to_transition_list(xn_list)
+        if self.opt_tau_leap_slow:
+            return xn_list  # slow processes are handled by self.leaper
         xn_list = self.add_weathering_and_disturbance_transitions(xn_list,
                     self.disturbance_rate, self.weathering_rate,
                     self.dissolution_rate)
@@ -238,6 +303,7 @@ class GrainFacetSimulator(CTSModel):
             next_pause = min(self.next_output, self.next_plot)
             next_pause = min(next_pause, self.next_uplift)
             next_pause = min(next_pause, self.next_baselevel)
+            next_pause = min(next_pause, self.next_leap)
             next_pause = min(next_pause, run_to_time)
 
             # Once in a while, print out simulation and real time to let the user
@@ -253,6 +319,10 @@ class GrainFacetSimulator(CTSModel):
             self.ca.run(next_pause, self.ca.node_state)
             self.current_time = next_pause
 
+            # Apply slow processes accumulated since the last leap
+            if self.leaper is not None:
+                self.leaper.leap(self.ca, self.current_time)
+
             # Handle output to file
             if self.current_time >= self.next_output:
                 self.next_output += self.output_interval
@@ -289,6 +359,11 @@ class GrainFacetSimulator(CTSModel):
                 self.baselevel_row += 1
                 self.next_baselevel += self.baselevel_rise_interval
 
+            # Choose the next leap interval, now that node states are current
+            if self.leaper is not None:
+                self.leaper.update_leap_interval(self.ca)
+                self.next_leap = self.current_time + self.leaper.leap_interval
+
     def run(self, to=None):
         """Run the model."""
         if to is None:
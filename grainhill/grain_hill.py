@@ -6,6 +6,12 @@ Hillslope model with block uplift.
 import sys
 from .cts_model import CTSModel
 from .lattice_grain import lattice_grain_node_states, lattice_grain_transition_list
+from .active_links import (ActiveLinkLatticeUplifter, compact_event_queue,
+                           reschedule_transitions)
+from .cosmogenic_irradiator import row_col_to_id
+from .tau_leaping import SlowProcessLeaper
+from .ballistic import BallisticFall
+from .occupancy import OccupancyAccumulator
 import time
 import numpy as np
 from matplotlib.pyplot import axis
@@ -72,6 +78,114 @@ def calculate_settling_rate(cell_width, grav_accel):
     return SECONDS_PER_YEAR / time_to_settle_one_cell
 
 
+def cap_settling_rate(settling_rate, motion_rate_cap, slow_rates):
+    """Limit the settling rate to a multiple of the fastest slow process.
+
+    Parameters
+    ----------
+    settling_rate : float
+        Physical settling rate, yr^-1
+    motion_rate_cap : float or None
+        Largest allowed ratio of settling rate to the fastest slow-process
+        rate. If None, the settling rate is returned unchanged.
+    slow_rates : sequence of float
+        Rates of the slow processes (for example, disturbance, weathering,
+        dissolution, and uplift), yr^-1. Zero rates are ignored.
+
+    Examples
+    --------
+    >>> cap_settling_rate(7.0e7, 1000.0, (0.01, 0.002, 0.0))
+    10.0
+    >>> cap_settling_rate(7.0e7, None, (0.01, 0.002, 0.0))
+    70000000.0
+    """
+    fastest = max(slow_rates)
+    if motion_rate_cap is None or fastest <= 0.0:
+        return settling_rate
+    return min(settling_rate, motion_rate_cap * fastest)
+
+
+def half_domain_columns(num_full_cols):
+    """Return number of node columns in a half-domain grid.
+
+    The half domain holds the columns from the left edge up to and including
+    the divide, plus one column of wall nodes.
+
+    Examples
+    --------
+    >>> half_domain_columns(21)
+    12
+    """
+    return (num_full_cols - 1) // 2 + 2
+
+
+def mirror_column_values(values):
+    """Mirror column-by-column values from a half domain to full width.
+
+    Parameters
+    ----------
+    values : array of float
+        One value per node column of the half-domain grid, including the
+        wall column at the right, which is discarded (for example, the
+        elevation profile from get_profile_and_soil_thickness()).
+
+    Returns
+    -------
+    array of float : one value per node column of the full-width domain.
+        The divide column appears once, in the middle.
+
+    Examples
+    --------
+    >>> mirror_column_values(np.array([0.0, 1.5, 2.0, 2.5, 0.0])).tolist()
+    [0.0, 1.5, 2.0, 2.5, 2.0, 1.5, 0.0]
+    """
+    values = np.asarray(values)
+    return np.concatenate((values[:-1], values[-3::-1]))
+
+
+def mirror_node_values(half_grid, values):
+    """Mirror node values from a half-domain grid onto a full-width grid.
+
+    Parameters
+    ----------
+    half_grid : HexModelGrid
+        Vertical, rect-layout grid of the half domain (including wall column)
+    values : array
+        Node values on half_grid (for example, node_state)
+
+    Returns
+    -------
+    array : values at the nodes of a vertical, rect-layout hex grid with the
+        same number of rows and 2 * (nc - 2) + 1 columns, where nc is the
+        number of columns in half_grid.
+
+    Examples
+    --------
+    >>> gh = GrainHill((3, 7), opt_half_domain=True)
+    >>> gh.grid.number_of_node_columns
+    5
+    >>> ns = mirror_node_values(gh.grid, gh.ca.node_state)
+    >>> bool(np.all(ns == GrainHill((3, 7)).ca.node_state))
+    True
+    """
+    nr = half_grid.number_of_node_rows
+    nc_half = half_grid.number_of_node_columns
+    nc_full = 2 * (nc_half - 2) + 1
+
+    # Column in the half domain that each full-width column copies
+    full_col = np.arange(nc_full)
+    src_col = np.minimum(full_col, nc_full - 1 - full_col)
+
+    row = np.arange(nr).reshape((nr, 1))
+    full_ids = row_col_to_id(row, full_col, nc_full).flatten()
+    src_ids = row_col_to_id(row, src_col, nc_half).flatten()
+
+    values = np.asarray(values)
+    full_values = np.zeros(nr * nc_full, dtype=values.dtype)
+    full_values[full_ids] = values[src_ids]
+    return full_values
+
+
 class GrainHill(CTSModel):
     """
     Model hillslope evolution with block uplift.
@@ -102,7 +216,18 @@ class GrainHill(CTSModel):
         prop_data=None,
         prop_reset_value=None,
         callback_fn=None,
-        closed_boundaries=(False, False, False, False)
+        closed_boundaries=(False, False, False, False),
+        opt_exclude_inert_links=True,
+        opt_grow_domain=False,
+        domain_growth_margin=5,
+        opt_half_domain=False,
+        opt_tau_leap_slow=False,
+        tau_leap_tolerance=0.05,
+        opt_ballistic_fall=False,
+        motion_rate_cap=None,
+        cts_type='oriented_hex',
+        seed=0,
+        opt_track_occupancy=False,
     ):
         """Call the initialize() method."""
         self.initialize(
@@ -130,6 +255,17 @@ class GrainHill(CTSModel):
             prop_reset_value,
             callback_fn,
             closed_boundaries,
+            opt_exclude_inert_links,
+            opt_grow_domain,
+            domain_growth_margin,
+            opt_half_domain,
+            opt_tau_leap_slow,
+            tau_leap_tolerance,
+            opt_ballistic_fall,
+            motion_rate_cap,
+            cts_type,
+            seed,
+            opt_track_occupancy,
         )
 
     def initialize(
@@ -158,9 +294,75 @@ class GrainHill(CTSModel):
         prop_reset_value,
         callback_fn,
         closed_boundaries,
+        opt_exclude_inert_links=True,
+        opt_grow_domain=False,
+        domain_growth_margin=5,
+        opt_half_domain=False,
+        opt_tau_leap_slow=False,
+        tau_leap_tolerance=0.05,
+        opt_ballistic_fall=False,
+        motion_rate_cap=None,
+        cts_type='oriented_hex',
+        seed=0,
+        opt_track_occupancy=False,
     ):
-        """Initialize the grain hill model."""
-        self.settling_rate = calculate_settling_rate(cell_width, grav_accel)
+        """Initialize the grain hill model.
+
+        If opt_grow_domain is True, the number of rows in grid_size is treated
+        as the largest number of rows the grid may grow to. The run starts
+        with just enough rows for the initial condition plus
+        domain_growth_margin, and rows are added (by doubling the grid height)
+        whenever the highest occupied row comes within domain_growth_margin
+        rows of the top.
+
+        If opt_half_domain is True, only the left half of the hill is
+        modeled. The number of columns in grid_size is the width of the full
+        (symmetric) domain, and must be odd so that the divide falls on a
+        column. The grid then holds the columns up to and including the
+        divide, plus a column of fixed wall nodes on the right, which acts as
+        a reflecting (no-flux) boundary. Use mirror_column_values() and
+        mirror_node_values() to convert results back to full width.
+
+        If opt_tau_leap_slow is True, weathering, dissolution, and
+        disturbance are removed from the CTS transition list and applied by
+        tau-leaping instead (see tau_leaping.SlowProcessLeaper), with a leap
+        interval chosen so that the chance of an event on any one link in a
+        single leap does not exceed tau_leap_tolerance.
+
+        If opt_ballistic_fall is True, a grain falling straight down through
+        air jumps directly to the bottom of the air column, rather than
+        moving one cell per event (see ballistic.BallisticFall).
+
+        If motion_rate_cap is given, the rates of grain motion, collision, and
+        settling are limited to motion_rate_cap times the rate of the fastest
+        slow process (disturbance, weathering, dissolution, or uplift). See
+        the convergence module for a way to choose the cap.
+
+        cts_type selects the CellLab-CTS engine: 'oriented_hex' (the default),
+        'oriented_hex_jit' (see jit_cts.JitOrientedHexCTS),
+        'oriented_hex_calendar' (see calendar_queue.CalendarQueueCTS),
+        'oriented_hex_ssa' (see ssa_cts.CompositionRejectionCTS), or
+        'oriented_hex_crn' (JitOrientedHexCTS with common random numbers:
+        runs with the same seed draw the same random numbers on each link,
+        whatever their other parameters).
+
+        seed seeds the random number generator of the CellLab-CTS engine.
+
+        If opt_track_occupancy is True, the time each node spends in each
+        node state is accumulated as the model runs (see
+        occupancy.OccupancyAccumulator), and after each call to run() the
+        fraction of time in state k is in the node field
+        node_state_<k>__time_fraction. This requires a cts_type other than
+        'oriented_hex'.
+        """
+        self.uncapped_settling_rate = calculate_settling_rate(cell_width,
+                                                              grav_accel)
+        self.settling_rate = cap_settling_rate(
+            self.uncapped_settling_rate,
+            motion_rate_cap,
+            (disturbance_rate, weathering_rate, dissolution_rate,
+             1.0 / uplift_interval),
+        )
         self.disturbance_rate = disturbance_rate
         self.weathering_rate = weathering_rate
         self.dissolution_rate = dissolution_rate
@@ -174,10 +376,34 @@ class GrainHill(CTSModel):
         self.rock_state = rock_state_for_uplift  # 7 (resting sed) or 8 (rock)
         self.opt_track_grains = opt_track_grains
         self.callback_fn = callback_fn
+        self.opt_exclude_inert_links = opt_exclude_inert_links
         if opt_rock_collapse:
             self.collapse_rate = self.settling_rate
         else:
             self.collapse_rate = 0.0
+        self.opt_grow_domain = opt_grow_domain
+        self.domain_growth_margin = domain_growth_margin
+        self.opt_half_domain = opt_half_domain
+        self.opt_tau_leap_slow = opt_tau_leap_slow
+        self.tau_leap_tolerance = tau_leap_tolerance
+        if opt_ballistic_fall:
+            if opt_track_grains:
+                self.ballistic_fall = BallisticFall(self.settling_rate,
+                                                    callback_fn)
+            else:
+                self.ballistic_fall = BallisticFall(self.settling_rate)
+        else:
+            self.ballistic_fall = None
+        if opt_half_domain:
+            if grid_size[1] % 2 == 0:
+                raise ValueError('opt_half_domain requires an odd number of '
+                                 + 'node columns')
+            self.full_node_columns = grid_size[1]
+            grid_size = (grid_size[0], half_domain_columns(grid_size[1]))
+        if opt_grow_domain:
+            self.max_node_rows = grid_size[0]
+            grid_size = (min(grid_size[0], domain_growth_margin + 3),
+                         grid_size[1])
 
         # Call base class init
         super(GrainHill, self).initialize(
@@ -185,12 +411,13 @@ class GrainHill(CTSModel):
             report_interval=report_interval,
             grid_orientation="vertical",
             grid_shape="rect",
-            cts_type="oriented_hex",
+            cts_type=cts_type,
             run_duration=run_duration,
             output_interval=output_interval,
             initial_state_grid=initial_state_grid,
             prop_data=prop_data,
             prop_reset_value=prop_reset_value,
+            seed=seed,
             closed_boundaries=closed_boundaries
         )
 
@@ -201,13 +428,20 @@ class GrainHill(CTSModel):
         # else:
         #    propid = None
 
-        self.uplifter = LatticeUplifter(
-            self.grid,
-            self.grid.at_node["node_state"],
-            propid=self.ca.propid,
-            prop_data=self.ca.prop_data,
-            prop_reset_value=self.ca.prop_reset_value,
-        )
+        if opt_exclude_inert_links:
+            compact_event_queue(self.ca)
+        self.opt_track_occupancy = opt_track_occupancy
+        if opt_track_occupancy:
+            if not hasattr(self.ca, 'occupancy'):
+                raise ValueError('opt_track_occupancy requires a cts_type '
+                                 + 'with a compiled event loop')
+            self.ca.occupancy = OccupancyAccumulator(
+                self.ca.num_node_states, self.grid.number_of_nodes)
+        self.uplifter = self.create_uplifter()
+        if opt_tau_leap_slow:
+            self.leaper = self.create_slow_process_leaper()
+        else:
+            self.leaper = None
 
         self.initialize_timing(
             output_interval, plot_interval, uplift_interval, report_interval
@@ -231,6 +465,44 @@ class GrainHill(CTSModel):
                 this_filename = None
             plot_hill(self.grid, this_filename)
 
+    def create_uplifter(self):
+        """Create and return the object that handles uplift."""
+        if self.opt_exclude_inert_links:
+            uplifter_class = ActiveLinkLatticeUplifter
+        else:
+            uplifter_class = LatticeUplifter
+        return uplifter_class(
+            self.grid,
+            self.grid.at_node["node_state"],
+            propid=self.ca.propid,
+            prop_data=self.ca.prop_data,
+            prop_reset_value=self.ca.prop_reset_value,
+        )
+
+    def create_slow_process_leaper(self):
+        """Create and return the object that applies weathering, dissolution,
+        and disturbance by tau-leaping.
+
+        Examples
+        --------
+        >>> gh = GrainHill((5, 7), weathering_rate=0.02, disturbance_rate=0.01,
+        ...                opt_tau_leap_slow=True, tau_leap_tolerance=0.1)
+        >>> round(gh.leaper.leap_interval, 3)
+        2.634
+        >>> int(gh.ca.n_trn[8 * 9 + 0])  # no CTS transitions for rock-air
+        0
+        """
+        xn_list = self.add_weathering_and_disturbance_transitions(
+            [],
+            self.disturbance_rate,
+            self.weathering_rate,
+            self.dissolution_rate,
+        )
+        leaper = SlowProcessLeaper(xn_list, len(self.node_state_dictionary()),
+                                   self.tau_leap_tolerance)
+        leaper.update_leap_interval(self.ca)
+        return leaper
+
     def initialize_timing(
         self, output_interval, plot_interval, uplift_interval, report_interval
     ):
@@ -250,6 +522,12 @@ class GrainHill(CTSModel):
         # Next time to add baselevel adjustment
         self.next_uplift = uplift_interval
 
+        # Next time to apply slow processes by tau-leaping
+        if self.leaper is not None:
+            self.next_leap = self.leaper.leap_interval
+        else:
+            self.next_leap = self.run_duration + 1.0
+
         # Iteration numbers, for output files and plot files
         self.output_iteration = 1
         self.plot_iteration = 1
@@ -274,12 +552,29 @@ class GrainHill(CTSModel):
             swap=self.opt_track_grains,
             callback=self.callback_fn,
         )
+        if self.ballistic_fall is not None:
+            xn_list = self.ballistic_fall.add_to_transition_list(xn_list)
+        if self.opt_tau_leap_slow:
+            # Slow processes go to the leaper, but rock collapse is fast
+            if self.weathering_rate > 0.0 and self.collapse_rate > 0.0:
+                xn_list.append(
+                    Transition(
+                        (0, 8, 0), (4, 0, 0), self.collapse_rate,
+                        "rock collapse", self.opt_track_grains,
+                        self.callback_fn
+                    )
+                )
+            return xn_list
+        # Disturbance moves a grain, so it swaps properties and calls the
+        # callback, like motion
         xn_list = self.add_weathering_and_disturbance_transitions(
             xn_list,
             self.disturbance_rate,
             self.weathering_rate,
             self.dissolution_rate,
             collapse_rate=self.collapse_rate,
+            swap=self.opt_track_grains,
+            callback=self.callback_fn,
         )
         return xn_list
 
@@ -424,8 +719,46 @@ class GrainHill(CTSModel):
         nsg[0] = 8  # bottom left
         nsg[bottom_right] = 8
 
+        # In half-domain mode, the right-hand column is a wall at the divide
+        if self.opt_half_domain:
+            nsg[self.divide_wall_nodes()] = 8
+
         return nsg
 
+    def divide_wall_nodes(self):
+        """Return IDs of the nodes in the right-hand column of the grid,
+        which form the wall at the divide in half-domain mode.
+
+        Examples
+        --------
+        >>> gh = GrainHill((3, 7), opt_half_domain=True)
+        >>> gh.divide_wall_nodes().tolist()
+        [2, 7, 12]
+        """
+        nc = self.grid.number_of_node_columns
+        rows = np.arange(self.grid.number_of_node_rows)
+        return row_col_to_id(rows, nc - 1, nc)
+
+    def get_full_width_profile_and_soil_thickness(self):
+        """Calculate profiles of elevation and soil thickness, mirrored to
+        the full width of the domain if opt_half_domain is True.
+
+        Examples
+        --------
+        >>> gh = GrainHill((3, 7), opt_half_domain=True)
+        >>> (elev, soil) = gh.get_full_width_profile_and_soil_thickness()
+        >>> elev.tolist()
+        [0.0, 1.5, 1.0, 1.5, 1.0, 1.5, 0.0]
+        >>> soil.tolist()
+        [0.0, 2.0, 2.0, 2.0, 2.0, 2.0, 0.0]
+        """
+        (elev, soil) = self.get_profile_and_soil_thickness(self.grid,
+                                                           self.ca.node_state)
+        if self.opt_half_domain:
+            elev = mirror_column_values(elev)
+            soil = mirror_column_values(soil)
+        return elev, soil
+
     def run(self, to=None):
         """Run the model."""
         if to is None:
@@ -438,6 +771,7 @@ class GrainHill(CTSModel):
             # Figure out what time to run to this iteration
             next_pause = min(self.next_output, self.next_plot)
             next_pause = min(next_pause, self.next_uplift)
+            next_pause = min(next_pause, self.next_leap)
             next_pause = min(next_pause, run_to)
 
             # Once in a while, print out simulation and real time to let the
@@ -457,6 +791,10 @@ class GrainHill(CTSModel):
             self.ca.run(next_pause, self.ca.node_state)
             self.current_time = next_pause
 
+            # Apply slow processes accumulated since the last leap
+            if self.leaper is not None:
+                self.leaper.leap(self.ca, self.current_time)
+
             # Handle output to file
             if self.current_time >= self.next_output:
                 self.write_output(self.grid, "grain_hill_model", self.output_iteration)
@@ -484,6 +822,129 @@ class GrainHill(CTSModel):
             if self.current_time >= self.uplift_duration:
                 self.next_uplift = self.run_duration + 1.0  # no more uplift
 
+            # Handle growth of the domain
+            if self.opt_grow_domain:
+                self.grow_domain_if_needed()
+
+            # Choose the next leap interval, now that node states are current
+            if self.leaper is not None:
+                self.leaper.update_leap_interval(self.ca)
+                self.next_leap = self.current_time + self.leaper.leap_interval
+
+        if self.opt_track_occupancy:
+            self.ca.occupancy.update_fields(self.grid, self.current_time)
+
+    def highest_occupied_row(self):
+        """Return the index of the highest row that contains any non-air
+        node (or -1 if there are none).
+
+        Examples
+        --------
+        >>> gh = GrainHill((5, 7))
+        >>> gh.highest_occupied_row()
+        1
+        """
+        (occupied,) = np.nonzero(self.ca.node_state)
+        if len(occupied) == 0:
+            return -1
+        return int(occupied[-1] // self.grid.number_of_node_columns)
+
+    def grow_domain_if_needed(self):
+        """Double the height of the grid (up to max_node_rows) if the highest
+        occupied row is within domain_growth_margin rows of the top.
+
+        Examples
+        --------
+        >>> gh = GrainHill((40, 7), opt_grow_domain=True,
+        ...                domain_growth_margin=2)
+        >>> gh.grid.number_of_node_rows
+        5
+        >>> gh.ca.node_state[21] = 7  # a grain in row 3
+        >>> gh.grow_domain_if_needed()
+        >>> gh.grid.number_of_node_rows
+        10
+        >>> int(gh.ca.node_state[21])
+        7
+        """
+        nr = self.grid.number_of_node_rows
+        if (nr < self.max_node_rows and self.highest_occupied_row()
+                >= nr - (self.domain_growth_margin + 1)):
+            self.grow_domain(min(nr, self.max_node_rows - nr))
+
+    def grow_domain(self, num_new_rows):
+        """Add num_new_rows rows of air to the top of the grid.
+
+        The grid and CA are rebuilt. Because new rows are added at the top,
+        existing nodes keep their IDs, so node_state, propid and prop_data
+        (along with any other node fields) are simply copied and extended.
+        Events pending at the time of growth are discarded and new ones drawn
+        from the current time; with exponentially distributed waiting times,
+        this does not alter the statistics of the run.
+
+        Examples
+        --------
+        >>> gh = GrainHill((5, 7), opt_track_grains=True)
+        >>> gh.ca.propid[[1, 2]] = gh.ca.propid[[2, 1]]
+        >>> gh.grow_domain(2)
+        >>> gh.grid.number_of_node_rows
+        7
+        >>> gh.ca.propid[:4].tolist()
+        [0, 2, 1, 3]
+        >>> gh.ca.node_state[:21].tolist()
+        [8, 7, 7, 8, 7, 7, 7, 0, 7, 7, 0, 7, 7, 7, 0, 0, 0, 0, 0, 0, 0]
+        """
+        old_grid = self.grid
+        old_ca = self.ca
+        num_old_nodes = old_grid.number_of_nodes
+
+        self.create_grid_and_node_state_field(
+            old_grid.number_of_node_rows + num_new_rows,
+            old_grid.number_of_node_columns, self.grid_orientation,
+            self.node_layout, self.cts_type, self.closed_boundaries)
+        num_new_nodes = self.grid.number_of_nodes
+        nsg = self.grid.at_node['node_state']
+        nsg[:num_old_nodes] = old_ca.node_state
+        if self.opt_half_domain:
+            nsg[self.divide_wall_nodes()] = 8
+
+        # Carry over other node fields; prop_data may be one of them
+        prop_data = None
+        for name in old_grid.at_node:
+            if name == 'node_state':
+                continue
+            old_field = old_grid.at_node[name]
+            field = self.grid.add_zeros(name, at='node',
+                                        dtype=old_field.dtype)
+            field[:num_old_nodes] = old_field
+            if old_field is old_ca.prop_data:
+                prop_data = field
+        if prop_data is None:
+            prop_data = np.zeros(num_new_nodes, dtype=old_ca.prop_data.dtype)
+            prop_data[:num_old_nodes] = old_ca.prop_data
+        prop_data[num_old_nodes:] = old_ca.prop_reset_value
+
+        # Build the new CA without disturbing the random number sequence
+        rng_state = np.random.get_state()
+        self.ca = self.create_ca(self.cts_type, self.node_state_dictionary(),
+                                 self.transition_list(), nsg, prop_data,
+                                 old_ca.prop_reset_value, self.seed)
+        np.random.set_state(rng_state)
+        self.ca.propid[:num_old_nodes] = old_ca.propid
+        self.ca.current_time = old_ca.current_time
+        if hasattr(self.ca, 'continue_streams'):  # common random numbers
+            self.ca.continue_streams(old_ca)
+        if getattr(old_ca, 'occupancy', None) is not None:
+            self.ca.occupancy = old_ca.occupancy
+            self.ca.occupancy.add_nodes(num_new_nodes - num_old_nodes,
+                                        self.current_time)
+        reschedule_transitions(self.ca, self.ca.current_time)
+
+        old_uplifter = self.uplifter
+        self.uplifter = self.create_uplifter()
+        for name in ('cum_uplift', 'y0_top'):  # block-layer state, if any
+            if hasattr(old_uplifter, name):
+                setattr(self.uplifter, name, getattr(old_uplifter, name))
+
     def get_profile_and_soil_thickness(self, grid, data):
         """Calculate and return profiles of elevation and soil thickness.
 
@@ -501,21 +962,74 @@ class GrainHill(CTSModel):
         >>> list(thickness)
         [0.0, 2.0, 2.0, 1.0, 0.0]
         """
-        nc = grid.number_of_node_columns
-        elev = np.zeros(nc)
-        soil = np.zeros(nc)
-        for col in range(nc):
-            base_id = (col // 2) + (col % 2) * ((nc + 1) // 2)
-            node_ids = np.arange(base_id, grid.number_of_nodes, nc)
-            states = data[node_ids]
-            (rows_with_rock_or_sed,) = np.where(states > 0)
-            if len(rows_with_rock_or_sed) == 0:
-                elev[col] = 0.0
-            else:
-                elev[col] = np.amax(rows_with_rock_or_sed) + 0.5 * (col % 2)
-            soil[col] = np.count_nonzero(np.logical_and(states > 0, states < 8))
+        return get_profile_and_soil_thickness(grid, data)
 
-        return elev, soil
+
+def get_profile_and_soil_thickness(grid, data):
+    """Calculate and return profiles of elevation and soil thickness.
+
+    Parameters
+    ----------
+    grid : HexModelGrid
+        Vertical, rectangular-layout hex grid
+    data : array of int
+        Node states
+
+    Returns
+    -------
+    (elev, thickness) : tuple of arrays
+        Height of the highest occupied cell, and number of sediment cells,
+        in each column (in units of cell width).
+
+    Examples
+    --------
+    >>> from landlab import HexModelGrid
+    >>> hg = HexModelGrid(shape=(4, 5), node_layout='rect', orientation='vertical')
+    >>> ns = hg.add_zeros('node', 'node_state', dtype=int)
+    >>> ns[[0, 3, 1, 6, 4, 9, 2]] = 8
+    >>> ns[[8, 13, 11, 16, 14]] = 7
+    >>> (elev, thickness) = get_profile_and_soil_thickness(hg, ns)
+    >>> elev.tolist()
+    [0.0, 2.5, 3.0, 2.5, 0.0]
+    >>> thickness.tolist()
+    [0.0, 2.0, 2.0, 1.0, 0.0]
+    """
+    nc = grid.number_of_node_columns
+    elev = np.zeros(nc)
+    soil = np.zeros(nc)
+    for col in range(nc):
+        base_id = (col // 2) + (col % 2) * ((nc + 1) // 2)
+        node_ids = np.arange(base_id, grid.number_of_nodes, nc)
+        states = data[node_ids]
+        (rows_with_rock_or_sed,) = np.where(states > 0)
+        if len(rows_with_rock_or_sed) == 0:
+            elev[col] = 0.0
+        else:
+            elev[col] = np.amax(rows_with_rock_or_sed) + 0.5 * (col % 2)
+        soil[col] = np.count_nonzero(np.logical_and(states > 0, states < 8))
+
+    return elev, soil
+
+
+def get_profile(model):
+    """Return profiles of elevation and soil thickness of a model's current
+    state.
+
+    For a model run on half of a symmetric domain, the profiles cover the
+    full width (see GrainHill.get_full_width_profile_and_soil_thickness()).
+    Works with any model that has a grid and a CA, such as
+    GrainFacetSimulator.
+
+    Examples
+    --------
+    >>> gh = GrainHill((4, 5))
+    >>> (elev, thickness) = get_profile(gh)
+    >>> elev.tolist()
+    [0.0, 1.5, 1.0, 1.5, 0.0]
+    """
+    if hasattr(model, 'get_full_width_profile_and_soil_thickness'):
+        return model.get_full_width_profile_and_soil_thickness()
+    return get_profile_and_soil_thickness(model.grid, model.ca.node_state)
 
 
 def get_params_from_input_file(filename):
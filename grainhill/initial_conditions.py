@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+initial_conditions.py: GrainHill module with near-steady-state initial
+conditions built from continuum theory.
+
+A GrainHill run normally starts from two flat rows of grains and takes many
+uplift intervals to build its steady hill; a GrainFacetSimulator run takes
+even longer to grow its facet. The functions here build an
+initial_state_grid that is already close to steady state, so that only a
+short relaxation is left:
+
+- steady_hill_node_states() fills a GrainHill grid up to the steady profile
+  of nonlinear (Roering-type) diffusion, with an effective diffusivity
+  proportional to the disturbance rate, and tops rock hills
+  (rock_state_for_uplift=8) with the predicted thickness of regolith.
+- planar_facet_node_states() fills a GrainFacetSimulator grid with footwall
+  rock below a planar facet that rises from the fault trace at a given dip.
+  The steady dip depends on weathering, disturbance, and dissolution
+  together, with no simple formula, so it must be supplied, for example
+  as measured with SlopeMeasurer on an earlier run with similar rates.
+
+The effective diffusivity, critical slope, and regolith thickness are
+empirical fits to steady GrainHill runs (41 columns, motion_rate_cap=100)
+at the default friction_coef of 0.3 only. Friction changes the effective
+diffusivity and critical slope, so at other values (the example input files
+use friction_coef=1.0) the hill they build is only a rough start, and needs
+a longer relaxation. All lengths are in cell widths, and uplift is one cell
+per uplift interval.
+
+@author: gtucker
+"""
+
+import numpy as np
+
+from .cosmogenic_irradiator import row_col_to_id
+
+_COLUMN_SPACING = 0.5 * np.sqrt(3.0)  # in cell widths
+# Fitted at friction_coef=0.3 only
+DIFFUSIVITY_FACTOR = 6.0  # effective diffusivity / disturbance rate
+CRITICAL_SLOPE = 0.92  # gradient at which the flux becomes unbounded
+BASE_ELEVATION = 1.5  # elevation of the fixed edges of the hill
+
+
+def nonlinear_diffusion_profile(x, half_width, uplift_rate, diffusivity,
+                                critical_slope=CRITICAL_SLOPE):
+    """Return the steady height of a nonlinear-diffusion hill above its
+    edges.
+
+    The sediment flux q = D S / (1 - (S / Sc)^2) must carry away the uplift
+    between the divide and each point, q = U x, which gives the gradient S
+    as the positive root of a quadratic; the profile is its integral from
+    the edge.
+
+    Parameters
+    ----------
+    x : array of float
+        Distance from the divide.
+    half_width : float
+        Distance from the divide to the edges.
+    uplift_rate : float
+        Rate of uplift relative to the edges (U).
+    diffusivity : float
+        Transport coefficient (D).
+    critical_slope : float
+        Gradient at which the flux becomes unbounded (Sc).
+
+    Examples
+    --------
+    >>> z = nonlinear_diffusion_profile(np.array([0.0, 5.0, 10.0]), 10.0,
+    ...                                 0.001, 1.0, critical_slope=1.0e6)
+    >>> np.round(z, 4).tolist()  # parabola, U (L^2 - x^2) / 2D
+    [0.05, 0.0375, 0.0]
+    >>> z = nonlinear_diffusion_profile(np.array([0.0]), 10.0, 100.0, 1.0,
+    ...                                 critical_slope=0.5)
+    >>> round(float(z[0]), 1)  # close to Sc L
+    5.0
+    """
+    xs = np.linspace(0.0, half_width, 2001)
+    flux = uplift_rate * xs
+    a = flux / critical_slope ** 2
+    slope = 2.0 * flux / (diffusivity
+                          + np.sqrt(diffusivity ** 2 + 4.0 * a * flux))
+    rise = np.concatenate(([0.0], np.cumsum(0.5 * (slope[1:] + slope[:-1])
+                                            * np.diff(xs))))
+    return np.interp(np.abs(x), xs, rise[-1] - rise)
+
+
+def steady_regolith_thickness(weathering_rate, uplift_interval):
+    """Return the predicted mean regolith thickness on a rock hill, in cells.
+
+    Rock weathers only where it is exposed to air, so the regolith cover is
+    thin. It approaches one cell when at least one weathering event is
+    expected per uplift interval, and thins as sqrt(w T) below that (w T is
+    the expected number of weathering events per exposed link per uplift
+    interval); the hill is then weathering-limited and steepens beyond the
+    diffusion profile.
+
+    Examples
+    --------
+    >>> steady_regolith_thickness(0.01, 10.0)
+    0.31622776601683794
+    >>> steady_regolith_thickness(0.1, 100.0)
+    1.0
+    """
+    return float(np.sqrt(min(1.0, weathering_rate * uplift_interval)))
+
+
+def _fill_template(num_rows, num_cols):
+    """Return node states of the flat initial condition (two rows of
+    grains, with rock in the bottom corners), and the row, column, x and y
+    of each node."""
+    row = np.repeat(np.arange(num_rows), num_cols).reshape((num_rows,
+                                                             num_cols))
+    col = np.tile(np.arange(num_cols), (num_rows, 1))
+    ids = row_col_to_id(row, col, num_cols)
+    node_row = np.zeros(num_rows * num_cols, dtype=int)
+    node_col = np.zeros(num_rows * num_cols, dtype=int)
+    node_row[ids] = row
+    node_col[ids] = col
+    x = _COLUMN_SPACING * node_col
+    y = node_row + 0.5 * (node_col % 2)
+    interior = (node_col > 0) & (node_col < num_cols - 1)
+    ns = np.where(interior & (y < 2.0), 7, 0)
+    ns[0] = 8
+    ns[row_col_to_id(0, num_cols - 1 - (num_cols % 2 == 0), num_cols)] = 8
+    return ns, node_row, node_col, x, y, interior
+
+
+def steady_hill_node_states(grid_size, disturbance_rate=1.0,
+                            weathering_rate=1.0, uplift_interval=1.0,
+                            rock_state_for_uplift=7, seed=0):
+    """Return GrainHill node states for a hill close to steady state.
+
+    Interior columns are filled to BASE_ELEVATION plus the
+    nonlinear_diffusion_profile() for uplift at one cell per
+    uplift_interval and an effective diffusivity of DIFFUSIVITY_FACTOR times
+    the disturbance rate. If rock_state_for_uplift is 8, the hill is rock
+    with a cover of regolith whose mean thickness is given by
+    steady_regolith_thickness() (the top cell of a column is regolith with a
+    probability equal to the fractional part), and the bottom row is rock,
+    as it becomes after the first uplift; otherwise the hill is all
+    regolith. The edge columns are as in the flat initial condition.
+
+    The profile is fitted for friction_coef=0.3 (GrainHill's default); at
+    other friction coefficients it is only a rough start.
+
+    Parameters
+    ----------
+    grid_size : (int, int)
+        Numbers of node rows and columns.
+    disturbance_rate, weathering_rate, uplift_interval : float
+        As for GrainHill.
+    rock_state_for_uplift : int
+        7 (regolith hill) or 8 (rock hill), as for GrainHill.
+    seed : int
+        Seed for the random placement of partial regolith cover.
+
+    Examples
+    --------
+    >>> from grainhill import GrainHill
+    >>> from grainhill.grain_hill import get_profile_and_soil_thickness
+    >>> params = {'grid_size': (12, 15), 'disturbance_rate': 0.01,
+    ...           'uplift_interval': 10.0}
+    >>> ns = steady_hill_node_states(**params)
+    >>> gh = GrainHill(initial_state_grid=ns, **params)
+    >>> (elev, soil) = get_profile_and_soil_thickness(gh.grid,
+    ...                                               gh.ca.node_state)
+    >>> elev.tolist()
+    [0.0, 2.5, 3.0, 3.5, 4.0, 5.5, 6.0, 6.5, 6.0, 5.5, 4.0, 3.5, 3.0, 2.5, 0.0]
+    >>> ns = steady_hill_node_states((12, 15), 0.01, 0.1, 10.0, 8)
+    >>> (elev, soil) = get_profile_and_soil_thickness(gh.grid, ns)
+    >>> soil.tolist()  # one cell of regolith over rock
+    [0.0, 1.0, 1.0, 1.0, 1.0, 1.0, 1.0, 1.0, 1.0, 1.0, 1.0, 1.0, 1.0, 1.0, 0.0]
+    """
+    (num_rows, num_cols) = grid_size
+    (ns, node_row, node_col, x, y, interior) = _fill_template(num_rows,
+                                                              num_cols)
+    half_width = _COLUMN_SPACING * (num_cols - 1) / 2.0
+    col_x = _COLUMN_SPACING * np.arange(num_cols) - half_width
+    surface = BASE_ELEVATION + nonlinear_diffusion_profile(
+        col_x, half_width, 1.0 / uplift_interval,
+        DIFFUSIVITY_FACTOR * disturbance_rate)
+
+    # Fill each interior column to the node nearest its surface
+    filled = interior & (y < surface[node_col] + 0.5) & (node_row >= 1)
+    ns[filled] = 7
+    if rock_state_for_uplift == 8:
+        thickness = steady_regolith_thickness(weathering_rate,
+                                              uplift_interval)
+        num_filled = np.bincount(node_col[filled], minlength=num_cols)
+        rng = np.random.RandomState(seed)
+        cover = (np.floor(thickness)
+                 + (rng.random_sample(num_cols) < thickness % 1.0))
+        rock_top = num_filled - cover  # rows 1 to rock_top are rock
+        ns[filled & (node_row <= rock_top[node_col])] = 8
+        ns[interior & (node_row == 0)] = 8  # as after the first uplift
+    return ns
+
+
+def planar_facet_node_states(grid_size, fault_x, dip, cell_width=1.0):
+    """Return GrainFacetSimulator node states with a planar facet.
+
+    Footwall rock fills the interior of the grid below a plane that rises to
+    the right from the fault trace (x = fault_x at the base) at the given
+    dip. The bottom two rows are rock, as in the flat initial condition.
+
+    Parameters
+    ----------
+    grid_size : (int, int)
+        Numbers of node rows and columns.
+    fault_x : float
+        Position of the fault trace, as for GrainFacetSimulator (in the
+        grid's length units).
+    dip : float
+        Dip of the facet, degrees (no steeper than the 60 degree fault).
+    cell_width : float
+        Cell width, as for GrainFacetSimulator.
+
+    Examples
+    --------
+    >>> ns = planar_facet_node_states((6, 7), fault_x=-0.01, dip=60.0)
+    >>> from grainhill.cosmogenic_irradiator import row_col_to_id
+    >>> [int(ns[row_col_to_id(4, c, 7)]) for c in range(7)]  # row 4
+    [0, 0, 0, 8, 8, 8, 0]
+    """
+    (num_rows, num_cols) = grid_size
+    (ns, node_row, node_col, x, y, interior) = _fill_template(num_rows,
+                                                              num_cols)
+    ns[ns == 7] = 8
+    trace = fault_x / cell_width
+    below_facet = y <= np.tan(np.radians(dip)) * (x - trace)
+    ns[interior & below_facet] = 8
+    return ns
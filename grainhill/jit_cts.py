@@ -0,0 +1,422 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+jit_cts.py: GrainHill module with a JIT-compiled CellLab-CTS event loop.
+
+JitOrientedHexCTS is an OrientedHexCTS whose run() method processes events
+in a loop compiled with numba. The event queue is a binary heap held in flat
+arrays (event times, and link IDs), and node states, link states, the
+transition table, and the propid array are all updated in compiled code.
+Transitions that have a Python callback (such as grain tracking, or the
+ballistic fall shortcut) interrupt the compiled loop; the callback is called
+from Python, and any events it pushes onto the model's priority_queue are
+copied into the heap before the loop resumes.
+
+Between calls to run(), the model's priority_queue and next_update arrays are
+kept in the same form as for OrientedHexCTS, so that uplifters, tau-leaping,
+and other code that modifies the CA from outside work unchanged.
+
+With common_random_numbers=True, each link draws its event times from its
+own stream of random numbers, derived from the seed by a counter-based hash
+(splitmix64 of the seed, the link ID, and the number of draws so far on the
+link), rather than from one shared generator. Runs that differ only in
+their parameters then see the same random numbers on the same links, so
+that differences between them are driven by the parameters more than by
+noise (common random numbers, for variance reduction in sweeps). Events
+drawn outside the compiled loop (for example, after uplift) still come from
+numpy's generator, which the constructor seeds with the same seed.
+
+Requires numba. Select it in a CTSModel with cts_type='oriented_hex_jit', or
+cts_type='oriented_hex_crn' for common random numbers.
+
+@author: gtucker
+"""
+
+import numpy as np
+from numba import njit
+from landlab.ca.oriented_hex_cts import OrientedHexCTS
+
+# The queue functions, and the functions they are passed to, are not cached:
+# numba's cache does not reliably restore first-class function arguments
+
+from .active_links import _NEVER, compact_event_queue
+from .occupancy import occupancy_arrays
+
+_CORE = 0  # landlab NodeStatus.CORE
+_DONE = 0  # run_to reached, or no more events
+_CALLBACK = 1  # stopped after a transition that has a Python callback
+
+
+@njit(cache=True)
+def _seed(seed):
+    """Seed numba's random number generator."""
+    np.random.seed(seed)
+
+
+@njit(cache=True)
+def _splitmix64(x):
+    """Return the splitmix64 hash of an unsigned 64-bit integer."""
+    z = x + np.uint64(0x9E3779B97F4A7C15)
+    z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return z ^ (z >> np.uint64(31))
+
+
+@njit(cache=True)
+def _stream_exponential(streams, link, rate):
+    """Draw an exponential waiting time with the given rate from a link's
+    random stream.
+
+    streams[0] is the key derived from the seed, and streams[1 + link] the
+    number of draws made so far on the link.
+    """
+    count = streams[1 + link]
+    z = _splitmix64(_splitmix64(streams[0] ^ np.uint64(link)) + count)
+    streams[1 + link] = count + np.uint64(1)
+    u = (float(z >> np.uint64(11)) + 0.5) * (1.0 / 9007199254740992.0)
+    return -np.log(u) / rate
+
+
+@njit
+def _heap_push(qf, qi, next_update, active_links, link, event_time):
+    """Push an event onto the heap.
+
+    The heap's event times are held in qf; qi[0] is the number of events,
+    and qi[1:] holds their link IDs. If the heap is full, it is first
+    rebuilt without superseded events.
+    """
+    if qi[0] == len(qf):
+        _heap_rebuild(qf, qi, next_update, active_links)
+    i = qi[0]
+    qi[0] += 1
+    while i > 0:
+        parent = (i - 1) // 2
+        if qf[parent] <= event_time:
+            break
+        qf[i] = qf[parent]
+        qi[i + 1] = qi[parent + 1]
+        i = parent
+    qf[i] = event_time
+    qi[i + 1] = link
+
+
+@njit
+def _heap_pop(qf, qi, next_update):
+    """Remove the earliest event from the heap and return (time, link), or
+    (_NEVER, -1) if the heap is empty."""
+    if qi[0] == 0:
+        return _NEVER, -1
+    event_time = qf[0]
+    link = qi[1]
+    qi[0] -= 1
+    n = qi[0]
+    last_time = qf[n]
+    last_link = qi[n + 1]
+    i = 0
+    while True:
+        child = 2 * i + 1
+        if child >= n:
+            break
+        if child + 1 < n and qf[child + 1] < qf[child]:
+            child += 1
+        if qf[child] >= last_time:
+            break
+        qf[i] = qf[child]
+        qi[i + 1] = qi[child + 1]
+        i = child
+    qf[i] = last_time
+    qi[i + 1] = last_link
+    return event_time, link
+
+
+@njit
+def _heap_rebuild(qf, qi, next_update, active_links):
+    """Replace the heap contents with the valid events on active links."""
+    qi[0] = 0
+    for j in range(len(active_links)):
+        link = active_links[j]
+        if next_update[link] < _NEVER:
+            _heap_push(qf, qi, next_update, active_links, link,
+                       next_update[link])
+
+
+@njit
+def _schedule(link, new_link_state, current_time, link_state, n_trn, trn_id,
+              trn_rate, next_update, next_trn_id, push, qf, qi,
+              active_links, streams):
+    """Assign a new link state and push its next event (if any).
+
+    Waiting times come from the link's own random stream if streams holds
+    one per link (see _stream_exponential()), and otherwise from numba's
+    generator.
+    """
+    link_state[link] = new_link_state
+    n = n_trn[new_link_state]
+    if n == 0:
+        next_update[link] = _NEVER
+        next_trn_id[link] = -1
+        return
+    next_time = _NEVER
+    this_trn = -1
+    for i in range(n):
+        trn = trn_id[new_link_state, i]
+        if len(streams) > 1:
+            dt = _stream_exponential(streams, link, trn_rate[trn])
+        else:
+            dt = np.random.exponential(1.0 / trn_rate[trn])
+        if dt < next_time:
+            next_time = dt
+            this_trn = trn
+    next_time += current_time
+    next_update[link] = next_time
+    next_trn_id[link] = this_trn
+    push(qf, qi, next_update, active_links, link, next_time)
+
+
+@njit(cache=True)
+def _state_of_link(link, node_state, node_at_link_tail, node_at_link_head,
+                   link_orientation, nsn):
+    """Return the link-state code computed from current node states."""
+    return (link_orientation[link] * nsn * nsn
+            + node_state[node_at_link_tail[link]] * nsn
+            + node_state[node_at_link_head[link]])
+
+
+@njit(cache=True)
+def _record_state_change(node, old_state, time, time_in_state, state_since):
+    """Credit a node's old state with the time since its last change of
+    state, if occupancy is tracked (time_in_state is not empty)."""
+    if time_in_state.shape[0] > 0:
+        time_in_state[old_state, node] += time - state_since[node]
+        state_since[node] = time
+
+
+@njit
+def _run_events(run_to, current_time, push, pop, qf, qi, next_update,
+                node_at_link_tail, node_at_link_head, node_state, next_trn_id,
+                trn_to, status_at_node, nsn, bnd_lnk, link_orientation,
+                link_state, n_trn, trn_id, trn_rate, links_at_node,
+                active_link_dirs_at_node, active_links, trn_propswap,
+                trn_has_callback, propid, prop_data, prop_reset_value, streams,
+                time_in_state, state_since, out):
+    """Process events up to run_to.
+
+    push and pop are the event-queue functions, and qf and qi hold the
+    queue's data; streams holds the per-link random streams, if any, and
+    time_in_state and state_since the occupancy times, if tracked. Returns a
+    status code and the current time. If the status is _CALLBACK, out holds
+    the event time, tail node, head node, and transition ID of the event
+    whose callback should now be called.
+    """
+    while True:
+        (ev_time, ev_link) = pop(qf, qi, next_update)
+        if ev_link < 0:
+            return _DONE, current_time
+        if ev_time != next_update[ev_link]:
+            continue  # superseded event
+        if ev_time > run_to:
+            push(qf, qi, next_update, active_links, ev_link, ev_time)
+            return _DONE, run_to
+        current_time = ev_time
+
+        tail = node_at_link_tail[ev_link]
+        head = node_at_link_head[ev_link]
+        old_tail_state = node_state[tail]
+        old_head_state = node_state[head]
+        trn = next_trn_id[ev_link]
+        to_state = trn_to[trn]
+
+        if status_at_node[tail] == _CORE:
+            node_state[tail] = (to_state // nsn) % nsn
+        if status_at_node[head] == _CORE:
+            node_state[head] = to_state % nsn
+
+        if bnd_lnk[ev_link]:
+            to_state = _state_of_link(ev_link, node_state, node_at_link_tail,
+                                      node_at_link_head, link_orientation, nsn)
+        _schedule(ev_link, to_state, ev_time, link_state, n_trn, trn_id,
+                  trn_rate, next_update, next_trn_id, push, qf, qi,
+                  active_links, streams)
+
+        for (node, old_state) in ((tail, old_tail_state),
+                                  (head, old_head_state)):
+            if node_state[node] == old_state:
+                continue
+            _record_state_change(node, old_state, ev_time, time_in_state,
+                                 state_since)
+            for i in range(links_at_node.shape[1]):
+                link = links_at_node[node, i]
+                if active_link_dirs_at_node[node, i] != 0 and link != ev_link:
+                    _schedule(link,
+                              _state_of_link(link, node_state,
+                                             node_at_link_tail,
+                                             node_at_link_head,
+                                             link_orientation, nsn),
+                              ev_time, link_state, n_trn, trn_id, trn_rate,
+                              next_update, next_trn_id, push, qf, qi,
+                              active_links, streams)
+
+        if trn_propswap[trn]:
+            tmp = propid[tail]
+            propid[tail] = propid[head]
+            propid[head] = tmp
+            if status_at_node[tail] != _CORE:
+                prop_data[propid[tail]] = prop_reset_value
+            if status_at_node[head] != _CORE:
+                prop_data[propid[head]] = prop_reset_value
+            if trn_has_callback[trn]:
+                out[0] = ev_time
+                out[1] = tail
+                out[2] = head
+                out[3] = trn
+                return _CALLBACK, current_time
+
+
+class JitOrientedHexCTS(OrientedHexCTS):
+    """OrientedHexCTS with a JIT-compiled event loop.
+
+    Examples
+    --------
+    >>> from grainhill import GrainHill
+    >>> gh = GrainHill((5, 7), cts_type='oriented_hex_jit',
+    ...                disturbance_rate=1.0, weathering_rate=0.0)
+    >>> isinstance(gh.ca, JitOrientedHexCTS)
+    True
+    >>> core = gh.grid.core_nodes
+    >>> num_grains = int(np.count_nonzero(gh.ca.node_state[core]))
+    >>> gh.ca.run(10.0, gh.ca.node_state)
+    >>> gh.ca.current_time
+    10.0
+    >>> int(np.count_nonzero(gh.ca.node_state[core])) <= num_grains
+    True
+
+    With common random numbers, a change of parameters leaves the random
+    numbers drawn on each link unchanged:
+
+    >>> runs = []
+    >>> for w in (0.01, 0.011):
+    ...     gh = GrainHill((5, 7), cts_type='oriented_hex_crn', seed=3,
+    ...                    disturbance_rate=0.01, weathering_rate=w)
+    ...     runs.append(gh.ca)
+    >>> bool(np.all(runs[0]._streams == runs[1]._streams))
+    True
+    """
+
+    # Event-queue functions: see calendar_queue.CalendarQueueCTS for an
+    # alternative
+    queue_push = staticmethod(_heap_push)
+    queue_pop = staticmethod(_heap_pop)
+    queue_rebuild = staticmethod(_heap_rebuild)
+
+    def __init__(self, model_grid, node_state_dict, transition_list,
+                 initial_node_states, prop_data=None, prop_reset_value=None,
+                 seed=0, common_random_numbers=False):
+        """Initialize a JitOrientedHexCTS (see OrientedHexCTS)."""
+        super(JitOrientedHexCTS, self).__init__(model_grid, node_state_dict,
+                                                transition_list,
+                                                initial_node_states, prop_data,
+                                                prop_reset_value, seed)
+        self.common_random_numbers = common_random_numbers
+        self._streams = np.zeros(1, dtype=np.uint64)
+        self.seed_streams(seed)
+        self.trn_has_callback = np.array(
+            [f is not None and not isinstance(f, int)
+             for f in self.trn_prop_update_fn], dtype=np.int8)
+        self._event_info = np.zeros(4)
+        self.occupancy = None  # OccupancyAccumulator, if tracked
+        self._allocate_queue()
+
+    def seed_streams(self, seed):
+        """Derive the per-link random streams from a new seed (if
+        common_random_numbers is True)."""
+        if self.common_random_numbers:
+            self._streams[0] = _splitmix64(np.uint64(seed))
+
+    def continue_streams(self, ca):
+        """Carry on the per-link random streams of another CA (one this CA
+        replaces, on the same grid or a grown copy of it), so that no link
+        draws again the random numbers it has already drawn.
+
+        Streams are keyed by link ID, and a grown grid only adds links, so
+        each link ID simply continues its count of draws.
+        """
+        if self.common_random_numbers and getattr(ca, 'common_random_numbers',
+                                                  False):
+            self._streams = ca._streams.copy()
+
+    def _allocate_queue(self):
+        """Create the heap arrays, sized for the current grid."""
+        capacity = 2 * self.grid.number_of_links + 16
+        self._qf = np.zeros(capacity)
+        self._qi = np.zeros(capacity + 1, dtype=np.int64)
+        self._queue_num_links = self.grid.number_of_links
+
+    def _load_queue(self):
+        """Fill the queue with the currently valid events."""
+        if self._queue_num_links != self.grid.number_of_links:
+            self._allocate_queue()
+        if (self.common_random_numbers
+                and len(self._streams) != self.grid.number_of_links + 1):
+            streams = np.zeros(self.grid.number_of_links + 1,
+                               dtype=np.uint64)
+            n = min(len(streams), len(self._streams))
+            streams[:n] = self._streams[:n]
+            self._streams = streams
+        self.queue_rebuild(self._qf, self._qi, self.next_update,
+                           self.grid.active_links)
+
+    def _push_pending_events(self):
+        """Move events pushed onto priority_queue (for example, by a
+        callback) into the compiled queue."""
+        for (event_time, _, link) in self.priority_queue._queue:
+            if event_time == self.next_update[link]:
+                self.queue_push(self._qf, self._qi, self.next_update,
+                                self.grid.active_links, link, event_time)
+        self.priority_queue._queue = []
+
+    def run(self, run_to, node_state_grid=None, plot_each_transition=False,
+            plotter=None):
+        """Run the model forward to time run_to (see CellLabCTSModel.run()).
+
+        Plotting after each transition is not supported by the compiled loop;
+        if it is requested, the standard run() is used instead.
+        """
+        if plot_each_transition:
+            super(JitOrientedHexCTS, self).run(run_to, node_state_grid,
+                                               plot_each_transition, plotter)
+            return
+        if node_state_grid is not None:
+            self.set_node_state_grid(node_state_grid)
+
+        # Numba keeps its own random generator; seed it from numpy's, so that
+        # seeding numpy (as the constructor does) makes runs repeatable
+        _seed(np.random.randint(2 ** 31))
+
+        self._load_queue()
+        self.priority_queue._queue = []
+        (time_in_state, state_since) = occupancy_arrays(self.occupancy)
+        g = self.grid
+        status = _CALLBACK
+        while status == _CALLBACK:
+            (status, self.current_time) = _run_events(
+                run_to, self.current_time, self.queue_push, self.queue_pop,
+                self._qf, self._qi, self.next_update, g.node_at_link_tail,
+                g.node_at_link_head, self.node_state, self.next_trn_id,
+                self.trn_to, g.status_at_node, self.num_node_states,
+                self.bnd_lnk, self.link_orientation, self.link_state,
+                self.n_trn, self.trn_id, self.trn_rate, g.links_at_node,
+                g.active_link_dirs_at_node, g.active_links, self.trn_propswap,
+                self.trn_has_callback, self.propid, self.prop_data,
+                self.prop_reset_value, self._streams, time_in_state,
+                state_since, self._event_info)
+            if status == _CALLBACK:
+                (event_time, tail, head, trn) = self._event_info
+                if self.occupancy is not None:  # the callback may move nodes
+                    self.occupancy.flush(self.node_state, event_time)
+                self.trn_prop_update_fn[int(trn)](self, int(tail), int(head),
+                                                  event_time)
+                self._push_pending_events()
+        if self.occupancy is not None:
+            self.occupancy.flush(self.node_state, run_to)
+
+        compact_event_queue(self)
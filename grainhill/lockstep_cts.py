@@ -0,0 +1,350 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+lockstep_cts.py: GrainHill module that runs a batch of replicate CellLab-CTS
+lattices in lockstep.
+
+LockstepReplicateCTS holds K independent replicates of a lattice that share
+one grid and one transition table. Node states, link states, event times,
+and next-transition IDs are stored as arrays with one row per replicate, and
+every step of the run loop processes the next event of every replicate at
+once, with numpy operations over the whole batch. For small lattices, where
+the Python overhead of each event dominates the run time of a single model,
+this makes an ensemble of many replicates much cheaper than running the
+same number of separate models.
+
+To find the next event of each replicate without scanning every link, the
+links are divided into blocks of about sqrt(number of links), and the
+earliest event time in each block is kept up to date. A step then looks at
+the block minima, then at the links in the earliest block.
+
+Transitions with a Python callback (such as grain tracking, or the ballistic
+fall shortcut) are not supported. run_grain_hill_replicates() runs replicates
+of a GrainHill model, including block uplift.
+
+@author: gtucker
+"""
+
+import numpy as np
+
+from .active_links import _NEVER
+from .grain_hill import get_profile_and_soil_thickness
+
+_CORE = 0  # landlab NodeStatus.CORE
+
+
+def uplift_node_states(uplifter, node_state, rock_state):
+    """Shift the interior node states up by one row, as
+    uplifter.uplift_interior_nodes() does, and fill the bottom row with
+    rock_state.
+
+    node_state may hold a single lattice, or one lattice per row.
+
+    Examples
+    --------
+    >>> from grainhill import GrainHill
+    >>> gh = GrainHill((4, 5), disturbance_rate=0.0, weathering_rate=0.0)
+    >>> node_state = np.tile(gh.ca.node_state, (2, 1))
+    >>> uplift_node_states(gh.uplifter, node_state, 8)
+    >>> gh.uplifter.uplift_interior_nodes(gh.ca, 0.0, rock_state=8)
+    >>> bool(np.all(node_state == gh.ca.node_state))
+    True
+    """
+    base = uplifter.inner_base_row_nodes
+    nc = uplifter.nc
+    for row in range(uplifter.nr - 1, 0, -1):
+        node_state[..., base + nc * row] = node_state[
+            ..., base + nc * (row - 1)]
+    node_state[..., base] = rock_state
+
+
+class LockstepReplicateCTS(object):
+    """Run K replicates of a CellLab-CTS lattice together.
+
+    Parameters
+    ----------
+    ca : CellLabCTSModel
+        Model whose grid, transition table, and current node states are used
+        for every replicate.
+    num_replicates : int
+        Number of replicates (K).
+    seed : int, optional
+        Seed for the batch's random number generator.
+
+    Examples
+    --------
+    >>> from grainhill import GrainHill
+    >>> gh = GrainHill((5, 7), disturbance_rate=1.0, weathering_rate=0.0)
+    >>> batch = LockstepReplicateCTS(gh.ca, 20)
+    >>> batch.node_state.shape
+    (20, 35)
+    >>> core = gh.grid.core_nodes
+    >>> num_grains = np.count_nonzero(batch.node_state[:, core], axis=1)
+    >>> batch.run(10.0)
+    >>> batch.current_time
+    10.0
+    >>> bool(np.all(np.count_nonzero(batch.node_state[:, core], axis=1)
+    ...             <= num_grains))
+    True
+    >>> links = gh.grid.active_links
+    >>> bool(np.all(batch.link_state[:, links]
+    ...             == batch.link_states_from_nodes(links)))
+    True
+    """
+
+    def __init__(self, ca, num_replicates, seed=0):
+        """Initialize a LockstepReplicateCTS."""
+        if any(f is not None and not isinstance(f, int)
+               for f in ca.trn_prop_update_fn):
+            raise ValueError('transitions with callback functions are not '
+                             + 'supported by LockstepReplicateCTS')
+        self.grid = ca.grid
+        self.num_replicates = num_replicates
+        self.rng = np.random.RandomState(seed)
+        self.current_time = ca.current_time
+
+        # Topology and transition table, shared by all replicates
+        g = ca.grid
+        self.num_node_states = ca.num_node_states
+        self.n_trn = ca.n_trn
+        self.trn_id = ca.trn_id
+        self.trn_rate = ca.trn_rate
+        self.trn_to = ca.trn_to
+        self.link_orientation = np.asarray(ca.link_orientation, dtype=int)
+        self._is_core = g.status_at_node == _CORE
+        self._tail = g.node_at_link_tail
+        self._head = g.node_at_link_head
+        active = g.active_link_dirs_at_node != 0
+        self._links_at_node = np.where(active, g.links_at_node, -1)
+        self._active_links = g.active_links
+        has_trn = (np.arange(self.trn_id.shape[1])[np.newaxis, :]
+                   < self.n_trn[:, np.newaxis])
+        self._cum_rate = np.cumsum(np.where(has_trn,
+                                            self.trn_rate[self.trn_id], 0.0),
+                                   axis=1)
+        self._total_rate = self._cum_rate[:, -1]
+
+        # State of each replicate
+        self.node_state = np.tile(ca.node_state, (num_replicates, 1))
+        num_links = g.number_of_links
+        self.link_state = np.zeros((num_replicates, num_links), dtype=int)
+        self.next_trn_id = -np.ones((num_replicates, num_links), dtype=int)
+
+        # Event times, padded to a whole number of blocks
+        self._block_size = max(int(np.ceil(np.sqrt(num_links))), 1)
+        num_blocks = int(np.ceil(num_links / self._block_size))
+        self._next_update = np.full(
+            (num_replicates, num_blocks * self._block_size), _NEVER)
+        self.next_update = self._next_update[:, :num_links]
+        self._block_min = np.full((num_replicates, num_blocks), _NEVER)
+
+        self.schedule_links(self._active_links)
+
+    def link_states_from_nodes(self, links=None):
+        """Return the link states implied by the current node states.
+
+        Returns an array with one row per replicate, and a column for each of
+        the given links (by default, all links).
+        """
+        if links is None:
+            links = np.arange(self.grid.number_of_links)
+        nsn = self.num_node_states
+        return (self.link_orientation[links] * nsn * nsn
+                + self.node_state[:, self._tail[links]] * nsn
+                + self.node_state[:, self._head[links]])
+
+    def schedule_links(self, links, replicates=None, current_time=None):
+        """Set the state of the given links from the node states, and draw
+        their next events.
+
+        If replicates is given, it holds one replicate ID for each of the
+        given links; otherwise every given link is updated in every
+        replicate. current_time (a scalar, or one value for each link) is
+        the time from which events are scheduled; by default, the batch's
+        current time.
+        """
+        if current_time is None:
+            current_time = self.current_time
+        links = np.asarray(links)
+        if replicates is None:
+            replicates = np.broadcast_to(
+                np.arange(self.num_replicates)[:, np.newaxis],
+                (self.num_replicates, len(links))).ravel()
+            links = np.broadcast_to(links, (self.num_replicates,
+                                            len(links))).ravel()
+        nsn = self.num_node_states
+        node_state = self.node_state.reshape(-1)
+        node_offset = replicates * self.node_state.shape[1]
+        state = (self.link_orientation[links] * nsn * nsn
+                 + node_state[node_offset + self._tail[links]] * nsn
+                 + node_state[node_offset + self._head[links]])
+        index = replicates * self.link_state.shape[1] + links
+        self.link_state.reshape(-1)[index] = state
+
+        # The earliest of the transitions out of a state comes after an
+        # exponential waiting time with their total rate, and is any one of
+        # them with probability proportional to its rate; so draw the time
+        # and the transition directly, rather than a time for each transition
+        total_rate = self._total_rate[state]
+        has_event = total_rate > 0.0
+        wait = (self.rng.standard_exponential(len(state))
+                / np.where(has_event, total_rate, 1.0))
+        choice = np.sum(self._cum_rate[state]
+                        <= (self.rng.random_sample(len(state))
+                            * total_rate)[:, np.newaxis], axis=1)
+        choice = np.minimum(choice, self.n_trn[state] - 1)
+        event_time = np.where(has_event, wait + current_time, _NEVER)
+        self.next_trn_id.reshape(-1)[index] = np.where(
+            has_event, self.trn_id[state, np.maximum(choice, 0)], -1)
+        self._set_event_times(replicates, links, event_time)
+
+    def _set_event_times(self, replicates, links, event_time):
+        """Assign event times to links, and update the block minima.
+
+        A block's minimum only has to be recomputed from scratch if it was
+        set by one of the links whose time is changing; otherwise it is
+        enough to compare it with the new times.
+        """
+        next_update = self._next_update.reshape(-1)
+        block_min = self._block_min.reshape(-1)
+        width = self._next_update.shape[1]
+        index = replicates * width + links
+        block_index = (replicates * self._block_min.shape[1]
+                       + links // self._block_size)
+        was_min = next_update[index] == block_min[block_index]
+        next_update[index] = event_time
+        np.minimum.at(block_min, block_index, event_time)
+        block_index = block_index[was_min]
+        start = (block_index // self._block_min.shape[1] * width
+                 + block_index % self._block_min.shape[1] * self._block_size)
+        block_min[block_index] = np.min(
+            next_update[start[:, np.newaxis] + np.arange(self._block_size)],
+            axis=1)
+
+    def run(self, run_to):
+        """Run every replicate forward to time run_to."""
+        rows = np.arange(self.num_replicates)
+        offsets = np.arange(self._block_size)
+        nsn = self.num_node_states
+        num_slots = self._links_at_node.shape[1]
+        while True:
+            # Find the earliest event of each replicate, and keep the
+            # replicates whose next event comes before run_to
+            block = np.argmin(self._block_min, axis=1)
+            ev_time = self._block_min[rows, block]
+            go = ev_time <= run_to
+            if not np.any(go):
+                break
+            r = rows[go]
+            ev_time = ev_time[go]
+            cols = block[go, np.newaxis] * self._block_size + offsets
+            link = cols[np.arange(len(r)),
+                        np.argmin(self._next_update[r[:, np.newaxis], cols],
+                                  axis=1)]
+
+            # Change node states
+            tail = self._tail[link]
+            head = self._head[link]
+            old_tail_state = self.node_state[r, tail]
+            old_head_state = self.node_state[r, head]
+            to_state = self.trn_to[self.next_trn_id[r, link]]
+            new_tail_state = np.where(self._is_core[tail],
+                                      (to_state // nsn) % nsn, old_tail_state)
+            new_head_state = np.where(self._is_core[head], to_state % nsn,
+                                      old_head_state)
+            self.node_state[r, tail] = new_tail_state
+            self.node_state[r, head] = new_head_state
+
+            # Reschedule the event link, and the other links at each node
+            # whose state changed (the event link is the only link the two
+            # nodes share)
+            nbr = np.concatenate((
+                np.where((new_tail_state != old_tail_state)[:, np.newaxis],
+                         self._links_at_node[tail], -1),
+                np.where((new_head_state != old_head_state)[:, np.newaxis],
+                         self._links_at_node[head], -1)), axis=1)
+            nbr[nbr == link[:, np.newaxis]] = -1
+            update = np.concatenate((link[:, np.newaxis], nbr), axis=1)
+            shape = (len(r), 2 * num_slots + 1)
+            valid = update >= 0
+            self.schedule_links(
+                update[valid],
+                np.broadcast_to(r[:, np.newaxis], shape)[valid],
+                np.broadcast_to(ev_time[:, np.newaxis], shape)[valid])
+
+        self.current_time = run_to
+
+    def uplift(self, uplifter, rock_state):
+        """Shift the interior nodes of every replicate up by one row, as
+        uplifter.uplift_interior_nodes() does for a single model, filling the
+        bottom row with rock_state.
+
+        uplifter is the LatticeUplifter (or ActiveLinkLatticeUplifter) of the
+        model that the batch was created from.
+        """
+        uplift_node_states(uplifter, self.node_state, rock_state)
+        nc = uplifter.nc
+
+        # Shift link data up one row, then update the links along the
+        # boundaries, as ActiveLinkLatticeUplifter does. That can leave a few
+        # links just above the lowest row with states that no longer match
+        # their nodes, so update those too.
+        num_links = self.grid.number_of_links
+        first_link = (((nc - 1) // 2) + (3 * (nc - 1)) + nc
+                      + ((nc + 1) // 2))
+        shift = nc + 2 * (nc - 1)
+        for data in (self.link_state, self.next_trn_id, self.next_update):
+            data[:, first_link:] = data[:, first_link - shift:
+                                        num_links - shift]
+        self._block_min[:] = np.min(
+            self._next_update.reshape(self.num_replicates, -1,
+                                      self._block_size), axis=2)
+        self.schedule_links(uplifter.links_to_update)
+        links = self._active_links
+        (replicates, stale) = np.nonzero(self.link_state[:, links]
+                                         != self.link_states_from_nodes(links))
+        self.schedule_links(links[stale], replicates)
+
+
+def run_grain_hill_replicates(gh, num_replicates, seed=0):
+    """Run num_replicates replicates of a GrainHill model in lockstep.
+
+    Each replicate starts from the current state of gh, and is run to
+    gh.run_duration with block uplift every gh.uplift_interval (up to
+    gh.uplift_duration). gh itself is not changed. Returns the
+    LockstepReplicateCTS, and arrays of the elevation profile and soil
+    thickness of each replicate (one row per replicate).
+
+    Tau-leaping, domain growth, and transitions with callbacks are not
+    supported.
+
+    Examples
+    --------
+    >>> from grainhill import GrainHill
+    >>> gh = GrainHill((5, 7), run_duration=20.0, uplift_interval=10.0,
+    ...                disturbance_rate=0.1, weathering_rate=0.01)
+    >>> (batch, elev, soil) = run_grain_hill_replicates(gh, 8)
+    >>> batch.current_time
+    20.0
+    >>> elev.shape
+    (8, 7)
+    """
+    if gh.leaper is not None or gh.opt_grow_domain:
+        raise ValueError('tau-leaping and domain growth are not supported '
+                         + 'by run_grain_hill_replicates')
+    batch = LockstepReplicateCTS(gh.ca, num_replicates, seed)
+    next_uplift = gh.current_time + gh.uplift_interval
+    while batch.current_time < gh.run_duration:
+        next_pause = gh.run_duration
+        if next_uplift <= gh.uplift_duration:
+            next_pause = min(next_pause, next_uplift)
+        batch.run(next_pause)
+        if batch.current_time >= next_uplift:
+            batch.uplift(gh.uplifter, gh.rock_state)
+            next_uplift += gh.uplift_interval
+
+    profiles = [get_profile_and_soil_thickness(gh.grid, batch.node_state[k])
+                for k in range(num_replicates)]
+    elev = np.array([p[0] for p in profiles])
+    soil = np.array([p[1] for p in profiles])
+    return batch, elev, soil
@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+multiresolution.py: GrainHill module for spinning up a model on a coarse
+lattice and finishing it on a fine one.
+
+The cost of a spin-up grows with the number of cells times the event rate,
+so fine lattices (e.g., cell_width=0.1 with 61 x 101 nodes) are expensive to
+bring to steady state. spin_up_coarse_to_fine() runs the spin-up on a
+lattice that is coarser by a given factor, with parameters rescaled so
+that the hillslope is physically the same (see coarsen_params()), then
+upsamples the node states onto the fine lattice (see
+state_library.fit_node_states()) and hands back the fine model, ready to
+continue from the end of the spin-up.
+
+Grid geometry in a GrainHill model is in units of cells, while the rates
+are per cell, so coarsening by a factor k means:
+
+- cell_width times k (the settling rate follows from it);
+- uplift_interval times k, which keeps the uplift rate;
+- disturbance_rate divided by k^2, which keeps the effective diffusivity
+  (proportional to d times cell width squared);
+- weathering_rate and dissolution_rate divided by k, which keeps the rate
+  of lowering of a weathering or dissolving rock surface;
+- block-layer thickness and position (BlockHill) divided by k.
+
+@author: gtucker
+"""
+
+import numpy as np
+
+from .active_links import reschedule_transitions
+from .state_library import fit_node_states
+
+_LENGTH_PARAMS = ('block_layer_thickness', 'layer_left_x', 'y0_top')
+
+
+def coarse_grid_size(grid_size, factor):
+    """Return the size of a grid coarser by the given factor, with the same
+    width and height.
+
+    Examples
+    --------
+    >>> coarse_grid_size((61, 101), 2)
+    (31, 51)
+    >>> coarse_grid_size((61, 101), 3)
+    (21, 34)
+    """
+    return (max(3, int(round((grid_size[0] - 1) / factor)) + 1),
+            max(3, int(round((grid_size[1] - 1) / factor)) + 1))
+
+
+def coarsen_params(params, factor):
+    """Return model parameters for a lattice coarser by the given factor.
+
+    Parameters
+    ----------
+    params : dict
+        GrainHill or BlockHill parameters (keyword arguments), including
+        grid_size.
+    factor : float
+        Ratio of coarse to fine cell width. The actual ratio is adjusted so
+        that the coarse grid has a whole number of columns.
+
+    Examples
+    --------
+    >>> p = coarsen_params({'grid_size': (61, 101), 'cell_width': 0.1,
+    ...                     'uplift_interval': 200.0,
+    ...                     'disturbance_rate': 0.01,
+    ...                     'weathering_rate': 0.0005,
+    ...                     'layer_left_x': 39.0}, 2)
+    >>> p['grid_size']
+    (31, 51)
+    >>> (p['cell_width'], p['uplift_interval'], p['layer_left_x'])
+    (0.2, 400.0, 19.5)
+    >>> (p['disturbance_rate'], p['weathering_rate'])
+    (0.0025, 0.00025)
+    """
+    if params.get('opt_half_domain', False) or params.get('opt_grow_domain',
+                                                          False):
+        raise ValueError('coarse-to-fine spin-up is not supported with '
+                         + 'opt_half_domain or opt_grow_domain')
+    grid_size = params['grid_size']
+    coarse_size = coarse_grid_size(grid_size, factor)
+    k = (grid_size[1] - 1.0) / (coarse_size[1] - 1.0)
+
+    coarse = dict(params)
+    coarse['grid_size'] = coarse_size
+    coarse['cell_width'] = k * params.get('cell_width', 1.0)
+    coarse['uplift_interval'] = k * params.get('uplift_interval', 1.0)
+    coarse['disturbance_rate'] = params.get('disturbance_rate', 1.0) / k ** 2
+    coarse['weathering_rate'] = params.get('weathering_rate', 1.0) / k
+    if 'dissolution_rate' in params:
+        coarse['dissolution_rate'] = params['dissolution_rate'] / k
+    for name in _LENGTH_PARAMS:
+        if name in params:
+            coarse[name] = params[name] / k
+    coarse.pop('initial_state_grid', None)
+    return coarse
+
+
+def _advance_clock(model, current_time):
+    """Set a newly built model's clock to current_time, keeping its
+    schedule of uplift, output and plotting, and redraw its events."""
+    model.current_time = current_time
+    model.ca.current_time = current_time
+    for (name, interval) in (('next_uplift', model.uplift_interval),
+                             ('next_output', model.output_interval),
+                             ('next_plot', model.plot_interval)):
+        when = getattr(model, name)
+        if when <= current_time:
+            setattr(model, name,
+                    float(when + interval * (np.floor((current_time - when)
+                                                      / interval) + 1.0)))
+    if current_time >= model.uplift_duration:
+        model.next_uplift = model.run_duration + 1.0
+    if model.leaper is not None:
+        model.leaper.last_leap_time = current_time
+        model.leaper.update_leap_interval(model.ca)
+        model.next_leap = current_time + model.leaper.leap_interval
+    reschedule_transitions(model.ca, current_time)
+
+
+def spin_up_coarse_to_fine(model_class, params, factor, spin_up_time):
+    """Spin up a model on a coarse lattice, and return the equivalent model
+    on the fine lattice at time spin_up_time.
+
+    Parameters
+    ----------
+    model_class : class
+        GrainHill or BlockHill.
+    params : dict
+        Parameters (keyword arguments) of the fine model.
+    factor : float
+        Ratio of coarse to fine cell width (see coarsen_params()).
+    spin_up_time : float
+        Time to run on the coarse lattice.
+
+    Returns
+    -------
+    (fine_model, coarse_model)
+        The fine model holds the upsampled node states, and continues from
+        spin_up_time when run.
+
+    Examples
+    --------
+    >>> from grainhill import GrainHill
+    >>> params = {'grid_size': (13, 21), 'run_duration': 40.0,
+    ...           'uplift_interval': 2.0, 'disturbance_rate': 0.1,
+    ...           'weathering_rate': 0.0}
+    >>> import contextlib, io
+    >>> with contextlib.redirect_stdout(io.StringIO()):  # progress reports
+    ...     (gh, coarse) = spin_up_coarse_to_fine(GrainHill, params, 2, 30.0)
+    >>> coarse.grid.number_of_node_columns
+    11
+    >>> (gh.current_time, gh.next_uplift)
+    (30.0, 32.0)
+    >>> with contextlib.redirect_stdout(io.StringIO()):
+    ...     gh.run()
+    >>> gh.current_time
+    40.0
+    """
+    coarse = model_class(**coarsen_params(params, factor))
+    coarse.run(spin_up_time)
+
+    fine = model_class(**params)
+    fine.ca.node_state[:] = fit_node_states(
+        coarse.ca.node_state,
+        (coarse.grid.number_of_node_rows, coarse.grid.number_of_node_columns),
+        params['grid_size'])
+    k = (params['grid_size'][1] - 1.0) / (coarse.grid.number_of_node_columns
+                                          - 1.0)
+    for name in ('cum_uplift', 'y0_top'):  # block-layer state, if any
+        if hasattr(coarse.uplifter, name):
+            setattr(fine.uplifter, name, k * getattr(coarse.uplifter, name))
+    _advance_clock(fine, coarse.current_time)
+    return fine, coarse
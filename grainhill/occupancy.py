@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+occupancy.py: GrainHill module for accumulating the time each node spends in
+each node state during a run.
+
+The probability of finding rock, regolith, moving grains, or air at a node
+is the fraction of time the node spends in those states. Rather than saving
+many snapshots and averaging them, an OccupancyAccumulator adds up, for each
+node and state, the time between the node's changes of state. CTS engines
+with a compiled event loop (JitOrientedHexCTS and its subclasses, and
+CompositionRejectionCTS) credit a node's old state with the time since its
+last change whenever a transition changes it, and flush the time of every
+node to its current state at the end of each run() call and before any
+Python callback. Everything that changes node states from outside the event
+loop (uplift, tau-leaping, baselevel change, domain growth) does so between
+run() calls, so no time is lost or misattributed.
+
+Turn it on with GrainHill(..., opt_track_occupancy=True) and one of those
+CTS engines. After each call to run(), the grid has a node field
+node_state_<k>__time_fraction for each state k.
+
+@author: gtucker
+"""
+
+import numpy as np
+
+
+def time_fraction_field_name(state):
+    """Return the name of the node field holding the fraction of time spent
+    in a state.
+
+    Examples
+    --------
+    >>> time_fraction_field_name(7)
+    'node_state_7__time_fraction'
+    """
+    return 'node_state_' + str(state) + '__time_fraction'
+
+
+def occupancy_arrays(occupancy):
+    """Return the time_in_state and state_since arrays of an
+    OccupancyAccumulator, for a compiled event loop, or empty arrays if
+    occupancy is None (not tracked)."""
+    if occupancy is None:
+        return np.zeros((0, 0)), np.zeros(0)
+    return occupancy.time_in_state, occupancy.state_since
+
+
+class OccupancyAccumulator(object):
+    """Time spent by each node in each node state.
+
+    Parameters
+    ----------
+    num_states : int
+        Number of node states.
+    num_nodes : int
+        Number of nodes.
+    start_time : float
+        Time at which accumulation starts.
+
+    Examples
+    --------
+    >>> occ = OccupancyAccumulator(3, 2)
+    >>> node_state = np.array([0, 2])
+    >>> occ.flush(node_state, 1.0)
+    >>> node_state[0] = 1  # change states at t = 1, then run to t = 4
+    >>> occ.flush(node_state, 4.0)
+    >>> occ.time_fraction(4.0).tolist()
+    [[0.25, 0.0], [0.75, 0.0], [0.0, 1.0]]
+    >>> occ.time_fraction(4.0, states=(1, 2)).tolist()
+    [0.75, 1.0]
+    """
+
+    def __init__(self, num_states, num_nodes, start_time=0.0):
+        """Initialize an OccupancyAccumulator with no time accumulated."""
+        self.start_time = start_time
+        self.time_in_state = np.zeros((num_states, num_nodes))
+        self.state_since = np.full(num_nodes, float(start_time))
+
+    def flush(self, node_state, time):
+        """Credit each node's current state with the time since the node's
+        last change of state (or the last flush), up to the given time."""
+        nodes = np.arange(len(node_state))
+        self.time_in_state[node_state, nodes] += time - self.state_since
+        self.state_since[:] = time
+
+    def add_nodes(self, num_new_nodes, time):
+        """Add nodes (for example, when the domain grows), counting them as
+        air (state 0) since the start."""
+        num_states = self.time_in_state.shape[0]
+        added = np.zeros((num_states, num_new_nodes))
+        added[0, :] = time - self.start_time
+        self.time_in_state = np.hstack((self.time_in_state, added))
+        self.state_since = np.concatenate((self.state_since,
+                                           np.full(num_new_nodes,
+                                                   float(time))))
+
+    def time_fraction(self, time, states=None):
+        """Return the fraction of time (from the start to the given time, the
+        time of the last flush) spent by each node in each state, as an
+        array of shape (num_states, num_nodes), or, if states is given, in
+        any of those states, as an array of shape (num_nodes,)."""
+        elapsed = max(time - self.start_time, np.finfo(float).tiny)
+        if states is None:
+            return self.time_in_state / elapsed
+        return np.sum(self.time_in_state[list(states)], axis=0) / elapsed
+
+    def update_fields(self, grid, time):
+        """Store the fraction of time spent in each state in node fields of
+        a grid (see time_fraction_field_name())."""
+        fraction = self.time_fraction(time)
+        for state in range(fraction.shape[0]):
+            name = time_fraction_field_name(state)
+            if name not in grid.at_node:
+                grid.add_zeros(name, at='node')
+            grid.at_node[name][:] = fraction[state]
@@ -0,0 +1,291 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+partitioned_update.py: GrainHill module with an approximate, synchronous
+alternative to the event-by-event CellLab-CTS engines.
+
+PartitionedUpdateCA advances an oriented-hex lattice in fixed time steps of
+length dt. The active links are divided into six sub-lattices, by
+orientation and by parity along each line of links of the same
+orientation, so that no two links in a sub-lattice share a node. In each
+step, the sub-lattices are updated one at a time, in random order. Every
+link in the sub-lattice fires one of its transitions with probability
+1 - exp(-R dt), where R is the total rate of the transitions out of its
+current state, and the transition is chosen in proportion to its rate. All
+of this is done with numpy operations over the whole sub-lattice, so the cost
+of a step does not depend on how many transitions fire in it.
+
+The method is exact only as dt goes to zero. A link can fire at most once
+per step, where the continuous-time model would fire it R dt times on
+average. The fraction of the expected events lost in this way is reported
+by error_estimate, and the largest R dt by max_rate_dt. The settling and
+motion rates in a GrainHill model are much faster than the other rates;
+using motion_rate_cap keeps them within reach of a usefully long dt.
+
+The engine accepts the same transition lists as the CTS engines (with
+tuple or integer states), but not transitions with callback functions.
+
+@author: gtucker
+"""
+
+import numpy as np
+
+from .active_links import reschedule_transitions
+from .grain_hill import get_profile_and_soil_thickness
+from .lockstep_cts import uplift_node_states
+
+_CORE = 0  # landlab NodeStatus.CORE
+_NUM_ORIENTATIONS = 3
+
+
+def oriented_hex_link_orientation(grid):
+    """Return the orientation code of each link of a vertical hex grid, as
+    OrientedHexCTS assigns them: 0 = vertical, 1 = right and up, 2 = right
+    and down.
+
+    Examples
+    --------
+    >>> from grainhill import GrainHill
+    >>> gh = GrainHill((4, 5))
+    >>> bool(np.all(oriented_hex_link_orientation(gh.grid)
+    ...             == gh.ca.link_orientation))
+    True
+    """
+    head = grid.node_at_link_head
+    tail = grid.node_at_link_tail
+    dx = grid.x_of_node[head] - grid.x_of_node[tail]
+    dy = grid.y_of_node[head] - grid.y_of_node[tail]
+    return np.where(dx <= 0.0, 0, np.where(dy <= 0.0, 2, 1))
+
+
+def link_sublattices(grid, links, link_orientation):
+    """Divide links into sub-lattices in which no two links share a node.
+
+    Links of each orientation form lines (each node has at most one link of
+    a given orientation coming in, and one going out); alternate links along
+    each line go into alternate sub-lattices. Returns a list of arrays of
+    link IDs.
+
+    Examples
+    --------
+    >>> from grainhill import GrainHill
+    >>> gh = GrainHill((5, 7))
+    >>> subs = link_sublattices(gh.grid, gh.grid.active_links,
+    ...                         oriented_hex_link_orientation(gh.grid))
+    >>> len(subs)
+    6
+    >>> sum(len(s) for s in subs) == gh.grid.number_of_active_links
+    True
+    >>> all(len(np.unique(np.concatenate((gh.grid.node_at_link_tail[s],
+    ...                                   gh.grid.node_at_link_head[s]))))
+    ...     == 2 * len(s) for s in subs)
+    True
+    """
+    tail = grid.node_at_link_tail
+    head = grid.node_at_link_head
+    sublattices = []
+    for orientation in range(_NUM_ORIENTATIONS):
+        these = links[link_orientation[links] == orientation]
+        link_from_node = -np.ones(grid.number_of_nodes, dtype=int)
+        link_from_node[tail[these]] = these
+        link_to_node = -np.ones(grid.number_of_nodes, dtype=int)
+        link_to_node[head[these]] = these
+        parity = -np.ones(grid.number_of_links, dtype=int)
+        for link in these[link_to_node[tail[these]] < 0]:  # start of a line
+            p = 0
+            while link >= 0:
+                parity[link] = p
+                p = 1 - p
+                link = link_from_node[head[link]]
+        sublattices.append(these[parity[these] == 0])
+        sublattices.append(these[parity[these] == 1])
+    return sublattices
+
+
+class PartitionedUpdateCA(object):
+    """Approximate, synchronous-update model of an oriented-hex lattice.
+
+    Parameters
+    ----------
+    model_grid : HexModelGrid
+        Grid with vertical orientation.
+    node_state_dict : dict
+        Node states, as for a CellLab-CTS model.
+    transition_list : list of Transition
+        Transitions, as for a CellLab-CTS model.
+    initial_node_states : array of int
+        Node states; the array is updated in place.
+    dt : float
+        Time step.
+    seed : int, optional
+        Seed for the random number generator.
+
+    Examples
+    --------
+    >>> from grainhill import GrainHill
+    >>> gh = GrainHill((5, 7), disturbance_rate=1.0, weathering_rate=0.0)
+    >>> node_state = gh.ca.node_state.copy()
+    >>> ca = PartitionedUpdateCA(gh.grid, gh.node_state_dictionary(),
+    ...                          gh.transition_list(), node_state, dt=0.01)
+    >>> core = gh.grid.core_nodes
+    >>> num_grains = int(np.count_nonzero(node_state[core]))
+    >>> ca.run(1.0)
+    >>> round(ca.current_time, 6)
+    1.0
+    >>> int(np.count_nonzero(node_state[core])) <= num_grains
+    True
+    >>> bool(0.0 <= ca.error_estimate < 1.0)
+    True
+    """
+
+    def __init__(self, model_grid, node_state_dict, transition_list,
+                 initial_node_states, dt, seed=0):
+        """Initialize a PartitionedUpdateCA."""
+        if any(t.prop_update_fn is not None for t in transition_list):
+            raise ValueError('transitions with callback functions are not '
+                             + 'supported by PartitionedUpdateCA')
+        self.grid = model_grid
+        self.node_state = initial_node_states
+        self.dt = dt
+        self.rng = np.random.RandomState(seed)
+        self.current_time = 0.0
+        nsn = len(node_state_dict)
+        self.num_node_states = nsn
+
+        # Transition table, indexed by link state
+        num_link_states = _NUM_ORIENTATIONS * nsn * nsn
+        from_state = np.array([self._link_state_code(t.from_state)
+                               for t in transition_list])
+        self.trn_to = np.array([self._link_state_code(t.to_state)
+                                for t in transition_list])
+        self.trn_rate = np.array([t.rate for t in transition_list])
+        self.n_trn = np.bincount(from_state, minlength=num_link_states)
+        self.trn_id = np.zeros((num_link_states, max(self.n_trn.max(), 1)),
+                               dtype=int)
+        self._cum_rate = np.zeros(self.trn_id.shape)
+        count = np.zeros(num_link_states, dtype=int)
+        for (trn, state) in enumerate(from_state):
+            self.trn_id[state, count[state]] = trn
+            self._cum_rate[state, count[state]:] += self.trn_rate[trn]
+            count[state] += 1
+        self._total_rate = self._cum_rate[:, -1]
+
+        self.link_orientation = oriented_hex_link_orientation(model_grid)
+        self.sublattices = link_sublattices(model_grid,
+                                            model_grid.active_links,
+                                            self.link_orientation)
+        self._is_core = model_grid.status_at_node == _CORE
+
+        # Running totals for the error estimate
+        self.max_rate_dt = 0.0
+        self._expected_events = 0.0
+        self._fire_probability = 0.0
+
+    def _link_state_code(self, state):
+        """Return the integer code of a (tail, head, orientation) link state,
+        or the code itself if it is already an integer."""
+        if isinstance(state, tuple):
+            nsn = self.num_node_states
+            return state[2] * nsn * nsn + state[0] * nsn + state[1]
+        return state
+
+    @property
+    def error_estimate(self):
+        """Fraction of the events expected in continuous time that were lost
+        because a link can fire at most once per step (so far in the run).
+        """
+        if self._expected_events == 0.0:
+            return 0.0
+        return 1.0 - self._fire_probability / self._expected_events
+
+    def update_sublattice(self, links, dt):
+        """Fire transitions on the links of one sub-lattice over time dt."""
+        nsn = self.num_node_states
+        ns = self.node_state
+        tail = self.grid.node_at_link_tail[links]
+        head = self.grid.node_at_link_head[links]
+        state = (self.link_orientation[links] * nsn * nsn + ns[tail] * nsn
+                 + ns[head])
+        rate = self._total_rate[state]
+        candidate = rate > 0.0
+        (tail, head, state, rate) = (tail[candidate], head[candidate],
+                                     state[candidate], rate[candidate])
+        probability = -np.expm1(-rate * dt)
+        if len(rate) > 0:
+            self.max_rate_dt = max(self.max_rate_dt, rate.max() * dt)
+        self._expected_events += np.sum(rate) * dt
+        self._fire_probability += np.sum(probability)
+
+        fire = self.rng.random_sample(len(rate)) < probability
+        (tail, head, state, rate) = (tail[fire], head[fire], state[fire],
+                                     rate[fire])
+        choice = np.sum(self._cum_rate[state]
+                        <= (self.rng.random_sample(len(rate))
+                            * rate)[:, np.newaxis], axis=1)
+        choice = np.minimum(choice, self.n_trn[state] - 1)
+        to_state = self.trn_to[self.trn_id[state, choice]]
+        ns[tail] = np.where(self._is_core[tail], (to_state // nsn) % nsn,
+                            ns[tail])
+        ns[head] = np.where(self._is_core[head], to_state % nsn, ns[head])
+
+    def step(self, dt=None):
+        """Advance by one time step (by default, of length self.dt),
+        updating the sub-lattices in random order."""
+        if dt is None:
+            dt = self.dt
+        for i in self.rng.permutation(len(self.sublattices)):
+            self.update_sublattice(self.sublattices[i], dt)
+        self.current_time += dt
+
+    def run(self, run_to):
+        """Run forward to time run_to (the last step is shortened if
+        needed)."""
+        while self.current_time < run_to - 1.0e-9 * self.dt:
+            self.step(min(self.dt, run_to - self.current_time))
+        self.current_time = run_to
+
+
+def run_grain_hill_partitioned(gh, dt, seed=0):
+    """Run a GrainHill model to gh.run_duration with PartitionedUpdateCA.
+
+    Block uplift is applied every gh.uplift_interval (up to
+    gh.uplift_duration), as GrainHill.run() does. The model's node states,
+    time, and event queue are updated in place. Returns the elevation
+    profile, the soil thickness, and the PartitionedUpdateCA (whose
+    error_estimate and max_rate_dt describe the time-step error).
+
+    Tau-leaping, domain growth, and transitions with callbacks are not
+    supported.
+
+    Examples
+    --------
+    >>> from grainhill import GrainHill
+    >>> gh = GrainHill((5, 7), run_duration=20.0, uplift_interval=10.0,
+    ...                disturbance_rate=0.1, weathering_rate=0.01,
+    ...                motion_rate_cap=100.0)
+    >>> (elev, soil, ca) = run_grain_hill_partitioned(gh, dt=0.01)
+    >>> gh.ca.current_time
+    20.0
+    >>> bool(ca.max_rate_dt < 1.0)
+    True
+    """
+    if gh.leaper is not None or gh.opt_grow_domain:
+        raise ValueError('tau-leaping and domain growth are not supported '
+                         + 'by run_grain_hill_partitioned')
+    ca = PartitionedUpdateCA(gh.grid, gh.node_state_dictionary(),
+                             gh.transition_list(), gh.ca.node_state, dt,
+                             seed)
+    ca.current_time = gh.current_time
+    next_uplift = gh.current_time + gh.uplift_interval
+    while ca.current_time < gh.run_duration:
+        next_pause = gh.run_duration
+        if next_uplift <= gh.uplift_duration:
+            next_pause = min(next_pause, next_uplift)
+        ca.run(next_pause)
+        if ca.current_time >= next_uplift:
+            uplift_node_states(gh.uplifter, gh.ca.node_state, gh.rock_state)
+            next_uplift += gh.uplift_interval
+    gh.current_time = gh.ca.current_time = ca.current_time
+    reschedule_transitions(gh.ca, ca.current_time)
+    (elev, soil) = get_profile_and_soil_thickness(gh.grid, gh.ca.node_state)
+    return elev, soil, ca
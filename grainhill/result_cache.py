@@ -0,0 +1,320 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+result_cache.py: GrainHill module for caching the results of runs, so that
+repeated runs and the members of re-run sweeps are not computed again.
+
+A ResultCache is a directory of results (one .npz file each), addressed by a
+hash of everything that determines a run: the normalized parameters (as
+read by load_params, with grid_size and model_type, and without the
+settings that only affect progress reports and plot files), the seed, the
+grainhill version, a fingerprint of the node states and transitions the
+model is built with, and the name of the function that computes its summary
+metrics. cached_run() looks a run up before running it, and stores its final
+node states and summary metrics afterwards, so a sweep that
+is restarted after a crash, or after a change to some of its members, only
+runs the members that are missing:
+
+    cache = ResultCache('result_cache', max_bytes=1.0e9)
+    results = [cached_run(params, cache) for params in sweep]
+
+Entries are evicted when they are older than max_age seconds, and then, least
+recently used first, while the cache holds more than max_bytes.
+
+@author: gtucker
+"""
+
+import hashlib
+import json
+import os
+import time
+
+import numpy as np
+
+from .cost_estimate import _read_params
+from .grain_hill import VERSION, get_profile
+from .steady_state import hill_statistics
+
+# Parameters that do not affect the results of a run
+_NON_RESULT_PARAMS = ('report_interval', 'save_plots', 'plot_filename',
+                      'plot_filetype')
+
+
+def _jsonable(value):
+    """Return a value (possibly holding tuples or numpy types) in a form
+    that json can encode."""
+    if isinstance(value, dict):
+        return {str(k): _jsonable(v) for (k, v) in value.items()}
+    if isinstance(value, (list, tuple, np.ndarray)):
+        return [_jsonable(v) for v in value]
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+def normalize_params(params):
+    """Return a dict of the parameters of a run that affect its results.
+
+    Parameters may be an input file name or a dict, as for
+    cost_estimate.estimate_cost(). The seed (default 0) is included.
+
+    Examples
+    --------
+    >>> p = normalize_params({'number_of_node_rows': 5,
+    ...                       'number_of_node_columns': 7,
+    ...                       'report_interval': 5.0})
+    >>> sorted(p.items())
+    [('grid_size', [5, 7]), ('model_type', 'grain_hill'), ('seed', 0)]
+    """
+    p = _read_params(params)
+    p.setdefault('seed', 0)
+    for name in _NON_RESULT_PARAMS:
+        p.pop(name, None)
+    return _jsonable(p)
+
+
+def transition_fingerprint(model):
+    """Return a hash of a model's node states and transitions (their states,
+    rates, and names), which changes if the model's rules change.
+
+    Examples
+    --------
+    >>> from grainhill import GrainHill
+    >>> a = transition_fingerprint(GrainHill((5, 7), weathering_rate=0.01))
+    >>> b = transition_fingerprint(GrainHill((5, 7), weathering_rate=0.02))
+    >>> len(a), a == b
+    (64, False)
+    """
+    rules = [sorted(model.node_state_dictionary().items())]
+    for trn in model.transition_list():
+        rules.append([trn.from_state, trn.to_state, repr(trn.rate),
+                      trn.name, bool(trn.swap_properties),
+                      trn.prop_update_fn is not None])
+    return hashlib.sha256(json.dumps(_jsonable(rules)).encode()).hexdigest()
+
+
+def create_model(params):
+    """Build a GrainHill, BlockHill, or GrainFacetSimulator model from
+    normalized parameters, as BmiGrainHill.initialize() does."""
+    from grainhill import GrainHill, BlockHill, GrainFacetSimulator
+
+    p = dict(params)
+    model_type = p.pop('model_type').lower()
+    p['grid_size'] = tuple(p['grid_size'])
+    if 'facet' in model_type:
+        return GrainFacetSimulator(**p)
+    if 'block' in model_type:
+        return BlockHill(**p)
+    return GrainHill(**p)
+
+
+def metrics_name(metrics_fn):
+    """Return the name of a metrics function, as used in cache keys.
+
+    Examples
+    --------
+    >>> metrics_name(summary_metrics)
+    'grainhill.result_cache.summary_metrics'
+    """
+    return (getattr(metrics_fn, '__module__', '') + '.'
+            + getattr(metrics_fn, '__qualname__', repr(metrics_fn)))
+
+
+def result_key(params, fingerprint, metrics=None):
+    """Return the cache key of a run with the given normalized parameters,
+    transition fingerprint, and metrics function name (see
+    metrics_name())."""
+    content = {'params': params, 'version': VERSION,
+               'transitions': fingerprint, 'metrics': metrics}
+    return hashlib.sha256(json.dumps(content,
+                                     sort_keys=True).encode()).hexdigest()
+
+
+def summary_metrics(model):
+    """Return a dict of summary metrics of a model's current state: its
+    time, and the mean elevation, relief, and mean soil thickness of its
+    profile."""
+    (elev, soil) = get_profile(model)
+    (mean_elev, relief, mean_soil) = hill_statistics(elev, soil)
+    return {'current_time': float(model.current_time),
+            'mean_elevation': mean_elev, 'relief': relief,
+            'mean_soil_thickness': mean_soil}
+
+
+class ResultCache(object):
+    """Directory of cached run results.
+
+    Parameters
+    ----------
+    path : str
+        Directory holding the cache (created if it does not exist).
+    max_bytes : float (optional)
+        Largest total size of the cached files.
+    max_age : float (optional)
+        Largest age of a cached file, in seconds since it was last used.
+
+    Examples
+    --------
+    >>> import tempfile
+    >>> cache = ResultCache(tempfile.mkdtemp())
+    >>> cache.get('0123') is None
+    True
+    >>> cache.put('0123', np.array([0, 7, 8]), {'relief': 2.0})
+    >>> result = cache.get('0123')
+    >>> (result['node_state'].tolist(), result['metrics'])
+    ([0, 7, 8], {'relief': 2.0})
+    >>> cache.max_age = 0.0
+    >>> cache.evict()
+    1
+    >>> len(cache.keys())
+    0
+    """
+
+    def __init__(self, path, max_bytes=None, max_age=None):
+        """Initialize a ResultCache."""
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        os.makedirs(path, exist_ok=True)
+
+    def filename(self, key):
+        """Return the name of the file for a key."""
+        return os.path.join(self.path, key + '.npz')
+
+    def keys(self):
+        """Return the keys of the cached results."""
+        return [name[:-4] for name in sorted(os.listdir(self.path))
+                if name.endswith('.npz')]
+
+    def get(self, key):
+        """Return the cached result for a key (a dict with node_state and
+        metrics), or None if there is none. The entry's time of last use is
+        updated."""
+        filename = self.filename(key)
+        if not os.path.exists(filename):
+            return None
+        with np.load(filename) as data:
+            result = {'node_state': data['node_state'],
+                      'metrics': json.loads(str(data['metrics']))}
+        os.utime(filename)
+        return result
+
+    def put(self, key, node_state, metrics):
+        """Store the final node states and summary metrics of a run, then
+        evict old entries if needed."""
+        filename = self.filename(key)
+        temp_filename = filename + '.tmp'  # so readers never see half
+        with open(temp_filename, 'wb') as f:
+            np.savez_compressed(f, node_state=node_state,
+                                metrics=json.dumps(_jsonable(metrics)))
+        os.replace(temp_filename, filename)
+        self.evict()
+
+    def evict(self):
+        """Remove entries older than max_age, then the least recently used
+        entries while the total size exceeds max_bytes. Returns the number of
+        entries removed."""
+        now = time.time()
+        entries = []
+        for key in self.keys():
+            filename = self.filename(key)
+            stat = os.stat(filename)
+            entries.append((stat.st_mtime, stat.st_size, filename))
+        entries.sort()
+        total = sum(size for (_, size, _) in entries)
+        num_removed = 0
+        for (last_used, size, filename) in entries:
+            too_old = (self.max_age is not None
+                       and now - last_used >= self.max_age)
+            too_big = self.max_bytes is not None and total > self.max_bytes
+            if not (too_old or too_big):
+                continue
+            os.remove(filename)
+            total -= size
+            num_removed += 1
+        return num_removed
+
+
+def cached_run(params, cache, metrics_fn=None, index=None):
+    """Run a model to its run_duration, or fetch its result from a cache.
+
+    Parameters
+    ----------
+    params : str or dict
+        Input file name or parameters of the run (see normalize_params()).
+    cache : ResultCache
+        The cache.
+    metrics_fn : function (optional)
+        Function of a model that returns a dict of summary metrics to store.
+        Default is summary_metrics(), or, if index is given,
+        run_index.run_metrics(), which adds the dip the index records. The
+        function's name is part of the cache key, so results stored with
+        other metrics are not returned.
+    index : RunIndex (optional)
+        If given, runs that are not found in the cache are added to this
+        index (see run_index.py) when they finish.
+
+    Returns
+    -------
+    dict
+        node_state (final node states), metrics, key, and cached (True if
+        the result came from the cache).
+
+    Examples
+    --------
+    >>> import tempfile
+    >>> cache = ResultCache(tempfile.mkdtemp())
+    >>> params = {'grid_size': (5, 7), 'run_duration': 10.0,
+    ...           'disturbance_rate': 0.01, 'weathering_rate': 0.001}
+    >>> import contextlib, io
+    >>> with contextlib.redirect_stdout(io.StringIO()):  # progress reports
+    ...     first = cached_run(params, cache)
+    >>> second = cached_run(dict(params, report_interval=1.0), cache)
+    >>> (first['cached'], second['cached'])
+    (False, True)
+    >>> bool(np.all(first['node_state'] == second['node_state']))
+    True
+    >>> second['metrics']['current_time']
+    10.0
+    >>> from grainhill.run_index import run_metrics
+    >>> with contextlib.redirect_stdout(io.StringIO()):
+    ...     third = cached_run(params, cache, metrics_fn=run_metrics)
+    >>> (third['cached'], 'dip' in third['metrics'])
+    (False, True)
+
+    Runs added to an index record their dip by default:
+
+    >>> import os
+    >>> from grainhill.run_index import RunIndex
+    >>> index = RunIndex(os.path.join(tempfile.mkdtemp(), 'runs.sqlite'))
+    >>> params['grid_size'] = (8, 9)  # large enough to fit a dip
+    >>> with contextlib.redirect_stdout(io.StringIO()):
+    ...     fourth = cached_run(params, cache, index=index)
+    >>> [round(run['dip']) for run in index.query('1')]
+    [30]
+    """
+    if metrics_fn is None:
+        if index is not None:
+            from .run_index import run_metrics  # run_index imports this
+            metrics_fn = run_metrics
+        else:
+            metrics_fn = summary_metrics
+    p = normalize_params(params)
+    model = create_model(p)
+    key = result_key(p, transition_fingerprint(model),
+                     metrics_name(metrics_fn))
+    result = cache.get(key)
+    if result is not None:
+        result['cached'] = True
+    else:
+        start = time.time()
+        model.run()
+        wall_time = time.time() - start
+        metrics = metrics_fn(model)
+        cache.put(key, model.ca.node_state, metrics)
+        if index is not None:
+            index.record(p, metrics, wall_time)
+        result = {'node_state': model.ca.node_state.copy(),
+                  'metrics': _jsonable(metrics), 'cached': False}
+    result['key'] = key
+    return result
@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+run_index.py: GrainHill module for keeping a queryable index of runs.
+
+A RunIndex is a single SQLite database file with one row per run. Each row
+records the run's main parameters (as columns) and all of its parameters
+(as JSON), its seed, when it ran and how long it took, where its output
+went, and summary metrics of its final state: mean elevation, relief, mean
+soil thickness, the dip of a straight line fitted to its surface by
+SlopeMeasurer, and its steady-state time (see steady_state.py), if known.
+Rows are committed one at a time, so runs and the members of a sweep can
+add themselves as they finish (several processes can share an index), and
+queries never touch the bulk output:
+
+    index = RunIndex('runs.sqlite')
+    index.query("model_type LIKE '%facet%' AND weathering_rate > 1e-3 "
+                "AND dip > 30")
+
+Parameters without a column of their own can be queried with SQLite's
+json_extract(params, '$.name').
+
+@author: gtucker
+"""
+
+import datetime
+import json
+import sqlite3
+import time
+
+import numpy as np
+
+from .result_cache import (_jsonable, create_model, normalize_params,
+                           summary_metrics)
+from .slope_measurer import SlopeMeasurer
+
+_BASE_ROW = 2.0  # surface points at or below this height are not fitted
+_COLUMNS = (('model_type', 'TEXT'), ('num_rows', 'INTEGER'),
+            ('num_cols', 'INTEGER'), ('disturbance_rate', 'REAL'),
+            ('weathering_rate', 'REAL'), ('dissolution_rate', 'REAL'),
+            ('uplift_interval', 'REAL'), ('run_duration', 'REAL'),
+            ('seed', 'INTEGER'), ('params', 'TEXT'), ('started', 'TEXT'),
+            ('wall_time', 'REAL'), ('output_path', 'TEXT'),
+            ('current_time', 'REAL'), ('mean_elevation', 'REAL'),
+            ('relief', 'REAL'), ('mean_soil_thickness', 'REAL'),
+            ('dip', 'REAL'), ('steady_state_time', 'REAL'))
+
+
+def surface_dip(model):
+    """Return the dip (degrees) of a straight line fitted to a model's
+    surface, or None if the surface has too few points.
+
+    For a GrainFacetSimulator, the rock surface is fitted; for a hill, the
+    surface of rock or regolith on the left flank. Points on the bottom two
+    rows are left out.
+
+    Examples
+    --------
+    >>> from grainhill import GrainHill
+    >>> gh = GrainHill((8, 9))
+    >>> x = gh.grid.x_of_node
+    >>> gh.ca.node_state[gh.grid.y_of_node < 2.1 + x / np.sqrt(3.0)] = 7
+    >>> gh.ca.assign_link_states_from_node_types()
+    >>> round(surface_dip(gh))
+    30
+    """
+    is_facet = hasattr(model, 'baselevel_rise_interval')
+    measurer = SlopeMeasurer(model, pick_only_rock=is_facet)
+    measurer.pick_rock_surface()
+    if len(measurer.exposed_surface) == 0:
+        return None
+    (x, z) = measurer.calc_coords_of_surface_points()
+    keep = z > _BASE_ROW
+    if not is_facet:
+        keep &= x <= 0.5 * np.amax(model.grid.x_of_node)
+    if np.count_nonzero(keep) < 2:
+        return None
+    (m, c) = measurer.fit_straight_line_to_coords(x[keep], z[keep])
+    return float(np.degrees(np.arctan(abs(m))))
+
+
+def run_metrics(model):
+    """Return summary_metrics() of a model, with its surface_dip()."""
+    metrics = summary_metrics(model)
+    metrics['dip'] = surface_dip(model)
+    return metrics
+
+
+class RunIndex(object):
+    """SQLite index of runs and their summary metrics.
+
+    Parameters
+    ----------
+    path : str
+        Database file (created if it does not exist).
+
+    Examples
+    --------
+    >>> import os, tempfile
+    >>> index = RunIndex(os.path.join(tempfile.mkdtemp(), 'runs.sqlite'))
+    >>> index.record({'grid_size': (5, 7), 'weathering_rate': 0.01},
+    ...              {'relief': 3.0, 'dip': 35.0}, wall_time=2.5)
+    1
+    >>> index.record({'grid_size': (5, 7), 'model_type': 'facet',
+    ...               'weathering_rate': 0.002}, {'dip': 40.0})
+    2
+    >>> runs = index.query("model_type LIKE '%facet%' AND dip > ?", (30.0,))
+    >>> [(r['run_id'], r['num_cols'], r['weathering_rate']) for r in runs]
+    [(2, 7, 0.002)]
+    >>> len(index.query("json_extract(params, '$.grid_size[0]') = 5"))
+    2
+    """
+
+    def __init__(self, path):
+        """Initialize a RunIndex, creating its table if needed."""
+        self.path = path
+        with self._connect() as connection:
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS runs '
+                '(run_id INTEGER PRIMARY KEY AUTOINCREMENT, '
+                + ', '.join(name + ' ' + kind for (name, kind) in _COLUMNS)
+                + ')')
+        connection.close()
+
+    def _connect(self):
+        """Return a new connection (connections are not shared, so that
+        forked processes can write too)."""
+        connection = sqlite3.connect(self.path, timeout=60.0)
+        connection.row_factory = sqlite3.Row
+        return connection
+
+    def record(self, params, metrics=None, wall_time=None, output_path=None,
+               started=None):
+        """Add a run to the index, and return its run_id.
+
+        Parameters
+        ----------
+        params : str or dict
+            Input file name or parameters of the run (normalized as by
+            result_cache.normalize_params()).
+        metrics : dict (optional)
+            Summary metrics, any of current_time, mean_elevation, relief,
+            mean_soil_thickness, dip, and steady_state_time.
+        wall_time : float (optional)
+            Wall-clock duration of the run, in seconds.
+        output_path : str (optional)
+            Location of the run's output files.
+        started : str (optional)
+            Start of the run (default: now), as an ISO 8601 string.
+        """
+        p = normalize_params(params)
+        if metrics is None:
+            metrics = {}
+        if started is None:
+            started = datetime.datetime.now().isoformat(timespec='seconds')
+        default_rate = 0.0 if 'facet' in p['model_type'].lower() else 1.0
+        row = {'model_type': p['model_type'],
+               'num_rows': p['grid_size'][0], 'num_cols': p['grid_size'][1],
+               'disturbance_rate': p.get('disturbance_rate', default_rate),
+               'weathering_rate': p.get('weathering_rate', default_rate),
+               'dissolution_rate': p.get('dissolution_rate', 0.0),
+               'uplift_interval': p.get('uplift_interval', 1.0),
+               'run_duration': p.get('run_duration', 1.0),
+               'seed': p['seed'], 'params': json.dumps(p, sort_keys=True),
+               'started': started, 'wall_time': wall_time,
+               'output_path': output_path}
+        for name in ('current_time', 'mean_elevation', 'relief',
+                     'mean_soil_thickness', 'dip', 'steady_state_time'):
+            row[name] = _jsonable(metrics.get(name))
+        names = [name for (name, _) in _COLUMNS]
+        with self._connect() as connection:
+            cursor = connection.execute(
+                'INSERT INTO runs (' + ', '.join(names) + ') VALUES ('
+                + ', '.join('?' * len(names)) + ')',
+                [row[name] for name in names])
+            run_id = cursor.lastrowid
+        connection.close()
+        return run_id
+
+    def query(self, where='1', args=()):
+        """Return the runs that satisfy an SQL condition, as a list of dicts.
+
+        Parameters
+        ----------
+        where : str
+            Condition (the WHERE clause of an SQL query) on the columns of
+            the index.
+        args : tuple
+            Values for any ? placeholders in the condition.
+        """
+        connection = self._connect()
+        rows = connection.execute('SELECT * FROM runs WHERE ' + where
+                                  + ' ORDER BY run_id', args).fetchall()
+        connection.close()
+        return [dict(row) for row in rows]
+
+
+def indexed_run(params, index, output_path=None, monitor=None):
+    """Run a model to its run_duration, and add it to an index.
+
+    Parameters
+    ----------
+    params : str or dict
+        Input file name or parameters of the run.
+    index : RunIndex
+        The index.
+    output_path : str (optional)
+        Location of the run's output files, to record.
+    monitor : SteadyStateMonitor (optional)
+        If given, the run is sampled by the monitor (it still runs to
+        run_duration), and its steady-state time is recorded.
+
+    Returns
+    -------
+    (model, run_id)
+
+    Examples
+    --------
+    >>> import os, tempfile
+    >>> index = RunIndex(os.path.join(tempfile.mkdtemp(), 'runs.sqlite'))
+    >>> import contextlib, io
+    >>> with contextlib.redirect_stdout(io.StringIO()):  # progress reports
+    ...     (gh, run_id) = indexed_run({'grid_size': (5, 7),
+    ...                                 'run_duration': 10.0}, index)
+    >>> run = index.query('run_id = ?', (run_id,))[0]
+    >>> (run['current_time'], run['wall_time'] > 0.0)
+    (10.0, True)
+    """
+    from .steady_state import run_to_steady_state
+
+    p = normalize_params(params)
+    started = datetime.datetime.now().isoformat(timespec='seconds')
+    start = time.time()
+    model = create_model(p)
+    if monitor is not None:
+        run_to_steady_state(model, monitor,
+                            collect_samples=int(model.run_duration
+                                                / monitor.sample_interval))
+    else:
+        model.run()
+    wall_time = time.time() - start
+    metrics = run_metrics(model)
+    if monitor is not None:
+        metrics['steady_state_time'] = monitor.steady_state_time
+    run_id = index.record(p, metrics, wall_time, output_path, started)
+    return model, run_id
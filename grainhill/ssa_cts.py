@@ -0,0 +1,341 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+ssa_cts.py: GrainHill module with a composition-rejection stochastic
+simulation (SSA) engine for CellLab-CTS models.
+
+The standard CTS engines give every link a scheduled event time and keep the
+events in a priority queue, which costs O(log N) per event. A lattice-grain
+model has only a few hundred link states and a handful of distinct rates, so
+the next event can instead be chosen directly:
+
+1. Each link state s has a total rate R[s], the sum of the rates of the
+   transitions out of s. Link states are grouped by rate, so that the rates
+   in group k all lie between 2^(m+k) and 2^(m+k+1).
+2. A group is chosen with probability proportional to its summed rate
+   ("composition"); there are only a few groups, so this is a short scan.
+3. A link is picked uniformly from the group, and accepted with probability
+   R[s] / 2^(m+k+1) ("rejection"); at least half of all picks are accepted,
+   so this step takes O(1) expected time.
+4. A transition out of the link's state is chosen in proportion to its rate,
+   and the clock advances by an exponential waiting time with the total rate
+   of all links.
+
+Group membership is held in flat arrays, so adding and removing a link when
+its state changes is O(1). The event loop is compiled with numba, and, as in
+JitOrientedHexCTS, transitions with Python callbacks interrupt it.
+
+Because the process is memoryless, the groups can be rebuilt from the link
+states at the start of every run() call; this keeps the engine compatible
+with uplifters, tau-leaping, and anything else that changes states between
+runs. One difference from the queue-based engines is that there are no
+scheduled event times: links updated by a callback with a future time (for
+example, at the landing cell of a ballistic fall) become active immediately.
+
+Requires numba. Select it in a CTSModel with cts_type='oriented_hex_ssa'.
+
+@author: gtucker
+"""
+
+import numpy as np
+from numba import njit
+from landlab.ca.oriented_hex_cts import OrientedHexCTS
+
+from .jit_cts import (_CALLBACK, _CORE, _DONE, _record_state_change, _seed,
+                      _state_of_link)
+from .occupancy import occupancy_arrays
+
+
+def link_state_rate_groups(n_trn, trn_id, trn_rate):
+    """Return total rate and rate group of each link state, and the upper
+    rate bound of each group.
+
+    Examples
+    --------
+    >>> n_trn = np.array([0, 1, 2, 1])
+    >>> trn_id = np.array([[0, 0], [0, 0], [1, 2], [3, 0]])
+    >>> trn_rate = np.array([1.0, 0.5, 0.25, 100.0])
+    >>> (rate, group, bound) = link_state_rate_groups(n_trn, trn_id, trn_rate)
+    >>> rate.tolist()
+    [0.0, 1.0, 0.75, 100.0]
+    >>> group.tolist()
+    [-1, 1, 0, 2]
+    >>> bound.tolist()
+    [1.0, 2.0, 128.0]
+    """
+    num_states = len(n_trn)
+    state_rate = np.zeros(num_states)
+    for s in range(num_states):
+        state_rate[s] = np.sum(trn_rate[trn_id[s, :n_trn[s]]])
+    state_group = -np.ones(num_states, dtype=np.int64)
+    active = state_rate > 0.0
+    exponent = np.floor(np.log2(state_rate[active])).astype(np.int64)
+    (bins, group) = np.unique(exponent, return_inverse=True)
+    state_group[active] = group
+    return state_rate, state_group, 2.0 ** (bins + 1)
+
+
+@njit(cache=True)
+def _set_link_state(link, new_state, link_state, state_rate, state_group,
+                    members, count, group_sum, link_pos, link_group):
+    """Give a link a new state, moving it between rate groups as needed."""
+    g = link_group[link]
+    if g >= 0:
+        group_sum[g] -= state_rate[link_state[link]]
+        pos = link_pos[link]
+        last = members[g, count[g] - 1]
+        members[g, pos] = last
+        link_pos[last] = pos
+        count[g] -= 1
+        if count[g] == 0:
+            group_sum[g] = 0.0  # clear any round-off
+        link_group[link] = -1
+    link_state[link] = new_state
+    g = state_group[new_state]
+    if g >= 0:
+        members[g, count[g]] = link
+        link_pos[link] = count[g]
+        link_group[link] = g
+        count[g] += 1
+        group_sum[g] += state_rate[new_state]
+
+
+@njit(cache=True)
+def _sum_groups(link_state, state_rate, members, count, group_sum):
+    """Recalculate the total rate of each group from scratch."""
+    for g in range(len(count)):
+        total = 0.0
+        for i in range(count[g]):
+            total += state_rate[link_state[members[g, i]]]
+        group_sum[g] = total
+
+
+@njit(cache=True)
+def _run_ssa(run_to, current_time, node_at_link_tail, node_at_link_head,
+             node_state, status_at_node, nsn, bnd_lnk, link_orientation,
+             link_state, n_trn, trn_id, trn_to, trn_rate, state_rate,
+             state_group, group_bound, members, count, group_sum, link_pos,
+             link_group, links_at_node, active_link_dirs_at_node,
+             trn_propswap, trn_has_callback, propid, prop_data,
+             prop_reset_value, time_in_state, state_since, out):
+    """Process events up to run_to.
+
+    time_in_state and state_since hold the occupancy times, if tracked.
+    Returns a status code and the current time. If the status is _CALLBACK,
+    out holds the event time, tail node, head node, and transition ID of
+    the event whose callback should now be called.
+    """
+    num_groups = len(count)
+    resum_interval = 10 * (len(link_state) + 1)
+    events_since_resum = 0
+    while True:
+        total = 0.0
+        for g in range(num_groups):
+            total += group_sum[g]
+        if total <= 0.0:
+            return _DONE, run_to
+
+        # Choose a group, correcting any round-off in the running sums
+        r = np.random.random() * total
+        g = 0
+        while g < num_groups - 1 and r >= group_sum[g]:
+            r -= group_sum[g]
+            g += 1
+        if count[g] == 0 or events_since_resum >= resum_interval:
+            _sum_groups(link_state, state_rate, members, count, group_sum)
+            events_since_resum = 0
+            continue
+
+        # Time of the event
+        current_time += np.random.exponential(1.0 / total)
+        if current_time > run_to:
+            return _DONE, run_to
+        events_since_resum += 1
+
+        # Choose a link in the group
+        while True:
+            ev_link = members[g, int(np.random.random() * count[g])]
+            if (np.random.random() * group_bound[g]
+                    < state_rate[link_state[ev_link]]):
+                break
+
+        # Choose a transition out of the link's state
+        s = link_state[ev_link]
+        r = np.random.random() * state_rate[s]
+        trn = trn_id[s, 0]
+        for i in range(n_trn[s]):
+            trn = trn_id[s, i]
+            r -= trn_rate[trn]
+            if r < 0.0:
+                break
+        to_state = trn_to[trn]
+
+        tail = node_at_link_tail[ev_link]
+        head = node_at_link_head[ev_link]
+        old_tail_state = node_state[tail]
+        old_head_state = node_state[head]
+        if status_at_node[tail] == _CORE:
+            node_state[tail] = (to_state // nsn) % nsn
+        if status_at_node[head] == _CORE:
+            node_state[head] = to_state % nsn
+        if bnd_lnk[ev_link]:
+            to_state = _state_of_link(ev_link, node_state, node_at_link_tail,
+                                      node_at_link_head, link_orientation, nsn)
+        _set_link_state(ev_link, to_state, link_state, state_rate,
+                        state_group, members, count, group_sum, link_pos,
+                        link_group)
+
+        for (node, old_state) in ((tail, old_tail_state),
+                                  (head, old_head_state)):
+            if node_state[node] == old_state:
+                continue
+            _record_state_change(node, old_state, current_time, time_in_state,
+                                 state_since)
+            for i in range(links_at_node.shape[1]):
+                link = links_at_node[node, i]
+                if active_link_dirs_at_node[node, i] != 0 and link != ev_link:
+                    _set_link_state(link,
+                                    _state_of_link(link, node_state,
+                                                   node_at_link_tail,
+                                                   node_at_link_head,
+                                                   link_orientation, nsn),
+                                    link_state, state_rate, state_group,
+                                    members, count, group_sum, link_pos,
+                                    link_group)
+
+        if trn_propswap[trn]:
+            tmp = propid[tail]
+            propid[tail] = propid[head]
+            propid[head] = tmp
+            if status_at_node[tail] != _CORE:
+                prop_data[propid[tail]] = prop_reset_value
+            if status_at_node[head] != _CORE:
+                prop_data[propid[head]] = prop_reset_value
+            if trn_has_callback[trn]:
+                out[0] = current_time
+                out[1] = tail
+                out[2] = head
+                out[3] = trn
+                return _CALLBACK, current_time
+
+
+class CompositionRejectionCTS(OrientedHexCTS):
+    """OrientedHexCTS that selects events by composition-rejection SSA.
+
+    Examples
+    --------
+    >>> from grainhill import GrainHill
+    >>> gh = GrainHill((5, 7), cts_type='oriented_hex_ssa',
+    ...                disturbance_rate=1.0, weathering_rate=0.0)
+    >>> isinstance(gh.ca, CompositionRejectionCTS)
+    True
+    >>> core = gh.grid.core_nodes
+    >>> num_grains = int(np.count_nonzero(gh.ca.node_state[core]))
+    >>> gh.ca.run(10.0, gh.ca.node_state)
+    >>> gh.ca.current_time
+    10.0
+    >>> int(np.count_nonzero(gh.ca.node_state[core])) <= num_grains
+    True
+    """
+
+    def __init__(self, model_grid, node_state_dict, transition_list,
+                 initial_node_states, prop_data=None, prop_reset_value=None,
+                 seed=0):
+        """Initialize a CompositionRejectionCTS (see OrientedHexCTS)."""
+        super(CompositionRejectionCTS, self).__init__(model_grid,
+                                                      node_state_dict,
+                                                      transition_list,
+                                                      initial_node_states,
+                                                      prop_data,
+                                                      prop_reset_value, seed)
+        self.trn_has_callback = np.array(
+            [f is not None and not isinstance(f, int)
+             for f in self.trn_prop_update_fn], dtype=np.int8)
+        (self.state_rate, self.state_group,
+         self.group_bound) = link_state_rate_groups(self.n_trn, self.trn_id,
+                                                    self.trn_rate)
+        self._event_info = np.zeros(4)
+        self.occupancy = None  # OccupancyAccumulator, if tracked
+        self._build_groups()
+
+    def _build_groups(self):
+        """Assign every active link to the rate group of its state."""
+        num_groups = len(self.group_bound)
+        self._members = np.zeros((num_groups, self.grid.number_of_links),
+                                 dtype=np.int64)
+        self._count = np.zeros(num_groups, dtype=np.int64)
+        self._group_sum = np.zeros(num_groups)
+        self._link_pos = -np.ones(self.grid.number_of_links, dtype=np.int64)
+        self._link_group = -np.ones(self.grid.number_of_links, dtype=np.int64)
+
+        links = self.grid.active_links
+        group = self.state_group[self.link_state[links]]
+        for g in range(num_groups):
+            in_group = links[group == g]
+            self._members[g, :len(in_group)] = in_group
+            self._count[g] = len(in_group)
+            self._link_pos[in_group] = np.arange(len(in_group))
+            self._link_group[in_group] = g
+        _sum_groups(self.link_state, self.state_rate, self._members,
+                    self._count, self._group_sum)
+
+    def update_link_state_new(self, link, new_link_state, current_time):
+        """Give a link a new state (see CellLabCTSModel).
+
+        There is no event queue, so no event is scheduled; the link simply
+        joins the rate group of its new state.
+        """
+        if self.bnd_lnk[link]:
+            new_link_state = int(
+                int(self.link_orientation[link]) * self.num_node_states_sq
+                + self.node_state[self.grid.node_at_link_tail[link]]
+                * self.num_node_states
+                + self.node_state[self.grid.node_at_link_head[link]])
+        _set_link_state(link, new_link_state, self.link_state,
+                        self.state_rate, self.state_group, self._members,
+                        self._count, self._group_sum, self._link_pos,
+                        self._link_group)
+
+    def run(self, run_to, node_state_grid=None, plot_each_transition=False,
+            plotter=None):
+        """Run the model forward to time run_to (see CellLabCTSModel.run()).
+        """
+        if plot_each_transition:
+            raise ValueError('CompositionRejectionCTS does not '
+                             + 'support plotting each transition')
+        if node_state_grid is not None:
+            self.set_node_state_grid(node_state_grid)
+
+        # Numba keeps its own random generator; seed it from numpy's
+        _seed(np.random.randint(2 ** 31))
+
+        # Link states may have been changed from outside since the last run,
+        # and the landlab event queue is not used
+        self._build_groups()
+        self.priority_queue._queue = []
+        (time_in_state, state_since) = occupancy_arrays(self.occupancy)
+
+        g = self.grid
+        status = _CALLBACK
+        while status == _CALLBACK:
+            (status, self.current_time) = _run_ssa(
+                run_to, self.current_time, g.node_at_link_tail,
+                g.node_at_link_head, self.node_state, g.status_at_node,
+                self.num_node_states, self.bnd_lnk, self.link_orientation,
+                self.link_state, self.n_trn, self.trn_id, self.trn_to,
+                self.trn_rate, self.state_rate, self.state_group,
+                self.group_bound, self._members, self._count,
+                self._group_sum, self._link_pos, self._link_group,
+                g.links_at_node, g.active_link_dirs_at_node,
+                self.trn_propswap, self.trn_has_callback, self.propid,
+                self.prop_data, self.prop_reset_value, time_in_state,
+                state_since, self._event_info)
+            if status == _CALLBACK:
+                (event_time, tail, head, trn) = self._event_info
+                if self.occupancy is not None:  # the callback may move nodes
+                    self.occupancy.flush(self.node_state, event_time)
+                self.trn_prop_update_fn[int(trn)](self, int(tail), int(head),
+                                                  event_time)
+                self.priority_queue._queue = []
+        if self.occupancy is not None:
+            self.occupancy.flush(self.node_state, run_to)
@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+state_library.py: GrainHill module for warm-starting runs from a library of
+spun-up node states.
+
+Spinning a hill up from the flat, two-row initial condition of
+GrainHill.initialize_node_state_grid() takes most of the computing time in a
+typical run. A StateLibrary is a directory of node-state snapshots (one
+.npz file each), indexed by grid size, disturbance_rate, weathering_rate,
+uplift_interval, friction_coef, and rock_state_for_uplift. A new run can
+start from the stored state nearest to its own parameters, fitted to its
+grid size, by passing it as initial_state_grid; at the end, its own final
+state can be added back to the library:
+
+    library = StateLibrary('spun_up_states')
+    params['initial_state_grid'] = library.initial_state_grid(params)
+    gh = GrainHill(**params)
+    gh.run()
+    library.add(gh)
+
+States are stored at full width, so runs with opt_half_domain can be added
+(but not warm-started, because the divide wall is set up only for the flat
+initial condition).
+
+@author: gtucker
+"""
+
+import os
+
+import numpy as np
+
+from .cosmogenic_irradiator import row_col_to_id
+from .grain_hill import mirror_node_values
+
+# Parameters (with GrainHill defaults) that index the library
+KEY_PARAMS = (('disturbance_rate', 1.0), ('weathering_rate', 1.0),
+              ('uplift_interval', 1.0), ('friction_coef', 0.3),
+              ('rock_state_for_uplift', 7))
+_TINY_RATE = 1.0e-12  # stands in for zero when taking logs
+
+
+def fit_node_states(node_state, from_shape, to_shape):
+    """Fit the node states of a hill on one grid to a grid of another size.
+
+    Both grids are vertical, rect-layout hex grids. The hill is stretched (or
+    shrunk) by the ratio of the widths, in both directions, so that slopes
+    are preserved. Interior columns take the states of the nearest column
+    of the same parity (so that rows line up), edge columns those of the
+    edge columns, and the bottom row that of the bottom row. Rows that
+    would come from above the top of the source grid are air.
+
+    Parameters
+    ----------
+    node_state : array of int
+        Node states on the source grid.
+    from_shape, to_shape : (int, int)
+        Numbers of rows and columns of the source and target grids.
+
+    Examples
+    --------
+    >>> from grainhill import GrainHill
+    >>> ns = GrainHill((5, 7)).ca.node_state
+    >>> bool(np.all(fit_node_states(ns, (5, 7), (5, 7)) == ns))
+    True
+    >>> fit_node_states(ns, (5, 7), (3, 7))[:7].tolist()  # first row kept
+    [8, 7, 7, 8, 7, 7, 7]
+    >>> wide = fit_node_states(ns, (5, 7), (9, 13))
+    >>> int(np.count_nonzero(wide == 7))  # four rows of grains
+    44
+    """
+    (nr0, nc0) = from_shape
+    (nr1, nc1) = to_shape
+    scale = (nc1 - 1.0) / (nc0 - 1.0)
+
+    col1 = np.arange(nc1)
+    target = col1 / scale
+    col0 = np.rint(target).astype(int)
+    toward_middle = np.where(col0 < (nc0 - 1) / 2.0, 1, -1)
+    step = np.where(target > col0, 1,
+                    np.where(target < col0, -1, toward_middle))
+    wrong_parity = (col0 % 2) != (col1 % 2)
+    col0[wrong_parity] += step[wrong_parity]
+    col0 = np.clip(col0, 1, nc0 - 2)
+    wrong_parity = (col0 % 2) != (col1 % 2)
+    col0[wrong_parity] += np.where(col0[wrong_parity] < (nc0 - 1) / 2.0, 1,
+                                   -1)
+    col0[0] = 0
+    col0[-1] = nc0 - 1
+
+    # The bottom row is a boundary; it maps only to itself
+    row1 = np.arange(nr1).reshape((nr1, 1))
+    row0 = np.maximum(np.floor(row1 / scale).astype(int), 1)
+    row0[0] = 0
+    inside = np.broadcast_to(row0 < nr0, (nr1, nc1))
+    ids1 = row_col_to_id(row1, col1, nc1)
+    ids0 = row_col_to_id(np.minimum(row0, nr0 - 1), col0, nc0)
+
+    node_state = np.asarray(node_state)
+    fitted = np.zeros(nr1 * nc1, dtype=node_state.dtype)
+    fitted[ids1[inside]] = node_state[ids0[inside]]
+    return fitted
+
+
+class StateLibrary(object):
+    """Directory of spun-up node states for warm starts.
+
+    Parameters
+    ----------
+    path : str
+        Directory holding the library (created if it does not exist).
+
+    Examples
+    --------
+    >>> import tempfile
+    >>> from grainhill import GrainHill
+    >>> library = StateLibrary(tempfile.mkdtemp())
+    >>> params = {'grid_size': (5, 7), 'disturbance_rate': 0.01,
+    ...           'weathering_rate': 0.001}
+    >>> library.initial_state_grid(params) is None  # nothing stored yet
+    True
+    >>> gh = GrainHill(**params)
+    >>> gh.ca.run(20.0, gh.ca.node_state)
+    >>> filename = library.add(gh)
+    >>> len(library.entries())
+    1
+    >>> params['weathering_rate'] = 0.002
+    >>> params['grid_size'] = (9, 13)
+    >>> entry = library.nearest(params)
+    >>> (entry['grid_size'], entry['weathering_rate'])
+    ((5, 7), 0.001)
+    >>> len(library.initial_state_grid(params))
+    117
+    """
+
+    def __init__(self, path):
+        """Initialize a StateLibrary."""
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+
+    def filename(self, grid_size, params):
+        """Return the file name for a state with the given grid size and key
+        parameters (a dict that may omit parameters left at their
+        defaults)."""
+        name = 'state_' + str(grid_size[0]) + 'x' + str(grid_size[1])
+        for (key, default) in KEY_PARAMS:
+            name += '_' + key[0] + '%g' % params.get(key, default)
+        return os.path.join(self.path, name + '.npz')
+
+    def add(self, model):
+        """Store the current node states of a GrainHill model, replacing any
+        state stored with the same grid size and parameters. Returns the file
+        name."""
+        node_state = model.ca.node_state
+        grid_size = (model.grid.number_of_node_rows,
+                     model.grid.number_of_node_columns)
+        if model.opt_half_domain:
+            node_state = mirror_node_values(model.grid, node_state)
+            grid_size = (grid_size[0], model.full_node_columns)
+        params = {'disturbance_rate': model.disturbance_rate,
+                  'weathering_rate': model.weathering_rate,
+                  'uplift_interval': model.uplift_interval,
+                  'friction_coef': model.friction_coef,
+                  'rock_state_for_uplift': model.rock_state}
+        filename = self.filename(grid_size, params)
+        np.savez_compressed(filename, node_state=node_state,
+                            grid_size=np.array(grid_size),
+                            current_time=model.current_time, **params)
+        return filename
+
+    def entries(self):
+        """Return a list of dicts describing the stored states (their grid
+        size, key parameters, time, and file name)."""
+        entries = []
+        for name in sorted(os.listdir(self.path)):
+            if not name.endswith('.npz'):
+                continue
+            filename = os.path.join(self.path, name)
+            with np.load(filename) as data:
+                entry = {key: data[key].item() for (key, _) in KEY_PARAMS}
+                entry['grid_size'] = tuple(int(n) for n in data['grid_size'])
+                entry['current_time'] = float(data['current_time'])
+            entry['filename'] = filename
+            entries.append(entry)
+        return entries
+
+    def nearest(self, params):
+        """Return the entry for the stored state nearest to a set of GrainHill
+        parameters, or None if there is none with the same
+        rock_state_for_uplift.
+
+        Distance is the sum of the squared log10 ratios of the numbers of
+        rows and columns, the rates of disturbance, weathering, and uplift,
+        and the friction coefficient.
+        """
+        defaults = dict(KEY_PARAMS)
+        target = [params['grid_size'][0], params['grid_size'][1]]
+        target += [params.get('disturbance_rate', defaults['disturbance_rate']),
+                   params.get('weathering_rate', defaults['weathering_rate']),
+                   1.0 / params.get('uplift_interval',
+                                    defaults['uplift_interval']),
+                   params.get('friction_coef', defaults['friction_coef'])]
+        rock_state = params.get('rock_state_for_uplift',
+                                defaults['rock_state_for_uplift'])
+        best = None
+        best_distance = np.inf
+        for entry in self.entries():
+            if entry['rock_state_for_uplift'] != rock_state:
+                continue
+            values = [entry['grid_size'][0], entry['grid_size'][1],
+                      entry['disturbance_rate'], entry['weathering_rate'],
+                      1.0 / entry['uplift_interval'], entry['friction_coef']]
+            distance = np.sum(np.log10(np.maximum(values, _TINY_RATE)
+                                       / np.maximum(target, _TINY_RATE)) ** 2)
+            if distance < best_distance:
+                best = entry
+                best_distance = distance
+        return best
+
+    def initial_state_grid(self, params):
+        """Return node states for a warm start of a GrainHill run with the
+        given parameters, fitted from the nearest stored state, or None if
+        there is no suitable state."""
+        if params.get('opt_half_domain', False):
+            raise ValueError('warm starts are not supported with '
+                             + 'opt_half_domain')
+        entry = self.nearest(params)
+        if entry is None:
+            return None
+        with np.load(entry['filename']) as data:
+            node_state = data['node_state']
+        return fit_node_states(node_state, entry['grid_size'],
+                               params['grid_size'])
@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+steady_state.py: GrainHill module for detecting statistical steady state and
+stopping runs early.
+
+Run durations are usually chosen conservatively, so that a hill spends much
+of its run at steady state. A SteadyStateMonitor samples the mean elevation,
+relief, and mean soil thickness of the column profile at a fixed interval,
+and declares the hill stationary when none of them shows a trend over a
+moving window of samples (see trend_is_flat()). run_to_steady_state() runs
+a GrainHill or GrainFacetSimulator model with a monitor, and either stops as
+soon as the hill is stationary or goes on for a given number of samples to
+collect steady-state statistics, instead of running to run_duration.
+
+@author: gtucker
+"""
+
+import numpy as np
+
+from .grain_hill import get_profile
+
+STATISTICS = ('mean_elevation', 'relief', 'mean_soil_thickness')
+
+
+def hill_statistics(elev, soil):
+    """Return the mean elevation, relief, and mean soil thickness of a
+    profile, over the interior columns.
+
+    Examples
+    --------
+    >>> hill_statistics(np.array([0.0, 1.5, 3.0, 1.5, 0.0]),
+    ...                 np.array([0.0, 1.0, 2.0, 0.0, 0.0]))
+    (2.0, 1.5, 1.0)
+    """
+    interior_elev = elev[1:-1]
+    return (float(np.mean(interior_elev)),
+            float(np.amax(interior_elev) - np.amin(interior_elev)),
+            float(np.mean(soil[1:-1])))
+
+
+def trend_is_flat(times, values, tolerance, z=2.0):
+    """Test whether a series has no significant trend.
+
+    A straight line is fitted to the series by least squares. The series is
+    flat if the change along the line over the span of the series, less z
+    standard errors, does not exceed tolerance: that is, if any drift is
+    either small or indistinguishable from the noise.
+
+    Examples
+    --------
+    >>> t = np.arange(10.0)
+    >>> trend_is_flat(t, 0.01 * t, tolerance=0.5)
+    True
+    >>> trend_is_flat(t, t, tolerance=0.5)
+    False
+    """
+    t = np.asarray(times, dtype=float) - np.mean(times)
+    v = np.asarray(values, dtype=float)
+    sxx = np.sum(t * t)
+    slope = np.sum(t * v) / sxx
+    residual = v - np.mean(v) - slope * t
+    std_err = np.sqrt(np.sum(residual ** 2) / max(len(v) - 2, 1) / sxx)
+    span = t[-1] - t[0]
+    return bool((abs(slope) - z * std_err) * span <= tolerance)
+
+
+class SteadyStateMonitor(object):
+    """Record statistics of a hill and detect when they become stationary.
+
+    Parameters
+    ----------
+    sample_interval : float
+        Time between samples.
+    window : int
+        Number of samples in the moving window tested for a trend.
+    tolerance : float
+        Largest drift (in cells) of each statistic over the window.
+    z : float
+        Number of standard errors of the fitted trend to allow for noise.
+
+    Attributes
+    ----------
+    times : list of float
+        Times of the samples.
+    samples : list of tuple
+        Mean elevation, relief, and mean soil thickness at each sample.
+    steady_state_time : float or None
+        Time of the first sample in the first window found to be
+        stationary (None until then).
+    detection_time : float or None
+        Time at which steady state was detected.
+
+    Examples
+    --------
+    >>> monitor = SteadyStateMonitor(1.0, window=5, tolerance=0.1, z=0.0)
+    >>> for t in range(12):
+    ...     is_steady = monitor.record(float(t), (min(t, 6.0), 2.0, 1.0))
+    >>> monitor.steady_state_time
+    6.0
+    >>> monitor.detection_time
+    10.0
+    >>> monitor.steady_statistics()['mean_elevation']
+    (6.0, 0.0)
+    """
+
+    def __init__(self, sample_interval, window=20, tolerance=1.0, z=2.0):
+        """Initialize a SteadyStateMonitor."""
+        if window < 3:
+            raise ValueError('window must be at least 3 samples')
+        self.sample_interval = sample_interval
+        self.window = window
+        self.tolerance = tolerance
+        self.z = z
+        self.times = []
+        self.samples = []
+        self.steady_state_time = None
+        self.detection_time = None
+
+    def record(self, current_time, statistics):
+        """Add a sample of the statistics, and test the latest window if the
+        hill has not yet been found stationary. Returns True if it has."""
+        self.times.append(current_time)
+        self.samples.append(tuple(statistics))
+        if self.steady_state_time is None and len(self.times) >= self.window:
+            times = self.times[-self.window:]
+            values = np.array(self.samples[-self.window:])
+            if all(trend_is_flat(times, values[:, i], self.tolerance, self.z)
+                   for i in range(values.shape[1])):
+                self.steady_state_time = times[0]
+                self.detection_time = current_time
+        return self.steady_state_time is not None
+
+    def sample(self, model):
+        """Record the statistics of a model's current profile. Returns True
+        if the hill is stationary."""
+        (elev, soil) = get_profile(model)
+        return self.record(model.current_time, hill_statistics(elev, soil))
+
+    def steady_statistics(self):
+        """Return a dict with the mean and standard deviation of each
+        statistic over the samples from steady_state_time on (or None if
+        steady state has not been reached)."""
+        if self.steady_state_time is None:
+            return None
+        first = self.times.index(self.steady_state_time)
+        values = np.array(self.samples[first:])
+        return {name: (float(np.mean(values[:, i])),
+                       float(np.std(values[:, i])))
+                for (i, name) in enumerate(STATISTICS)}
+
+
+def run_to_steady_state(model, monitor, collect_samples=0):
+    """Run a model until its hill is stationary, or to its run_duration.
+
+    Parameters
+    ----------
+    model : GrainHill or GrainFacetSimulator
+        The model, which is sampled every monitor.sample_interval from its
+        current time.
+    monitor : SteadyStateMonitor
+        Monitor that records the samples and tests for steady state.
+    collect_samples : int
+        Number of further samples to collect after steady state is detected
+        (but not beyond run_duration); 0 stops the run at once.
+
+    Returns
+    -------
+    float or None
+        The steady-state time (see SteadyStateMonitor), or None if the hill
+        did not become stationary by run_duration.
+
+    Examples
+    --------
+    >>> from grainhill import GrainHill
+    >>> gh = GrainHill((8, 11), run_duration=2000.0, uplift_interval=10.0,
+    ...                disturbance_rate=0.1, weathering_rate=0.0)
+    >>> monitor = SteadyStateMonitor(sample_interval=20.0, window=10)
+    >>> import contextlib, io
+    >>> with contextlib.redirect_stdout(io.StringIO()):  # progress reports
+    ...     steady_time = run_to_steady_state(gh, monitor, collect_samples=5)
+    >>> steady_time is not None and gh.current_time < gh.run_duration
+    True
+    >>> bool(gh.current_time == monitor.detection_time + 100.0)
+    True
+    """
+    stop_time = None
+    while model.current_time < model.run_duration:
+        model.run(min(model.current_time + monitor.sample_interval,
+                      model.run_duration))
+        monitor.sample(model)
+        if monitor.detection_time is not None:
+            if stop_time is None:
+                stop_time = (monitor.detection_time
+                             + collect_samples * monitor.sample_interval)
+            if model.current_time >= stop_time:
+                break
+    return monitor.steady_state_time
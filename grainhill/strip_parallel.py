@@ -0,0 +1,459 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+strip_parallel.py: GrainHill module that runs one CellLab-CTS lattice on
+several processes, by dividing it into vertical strips.
+
+StripParallelCTS uses the synchronous sublattice method (Shim and Amar, 2005,
+Physical Review B 71, 125432). The lattice is divided into one strip of node
+columns per worker process, and each strip into a left and a right half.
+Every link belongs to the half that holds the left-hand column of its two
+nodes. Time advances in windows: in each window, every worker runs the
+events on the links of one half for the length of the window, then those of
+the other half. A link touches at most the column to the right of
+its half, and that column lies in a half that is idle in the same phase, so
+the workers never change the same node at once. Between phases, the node
+states along the edges of each half are exchanged through the main process.
+
+Each worker keeps the pending events of its links from one phase to the
+next. Because the waiting times of a CTS model are exponential, the events
+of links whose nodes were changed from outside (by a neighbouring half, or
+by uplift) can simply be drawn afresh at the start of a phase without
+changing the statistics. The only approximation is that events on either
+side of a half boundary are not interleaved in time within a window. To
+avoid favouring motion in one direction across half boundaries, the order
+of the two phases alternates from one window to the next.
+
+The approximation biases the results unless the window is short next to
+the fastest transition. A grain that moves into the column beyond its half
+waits there until the other phase, and meanwhile can only take part in
+the transitions of its own phase, which include collisions at the motion
+rate. In GrainHill, motion is at the settling rate, which is far faster than
+everything else unless it is capped with motion_rate_cap. On a 31x121 hill
+(1000 years, disturbance rate 0.01, weathering rate 0.002, uplift interval
+100, 4 workers, 32 seeds each), the mean height was too high by:
+
+    settling rate 7e7 (no cap): 0.115 +/- 0.011 at a window of 10,
+                                0.063 +/- 0.012 at 1, 0.036 +/- 0.013 at 0.1
+    settling rate 1 (cap 100):  0.048 +/- 0.017 at 0.1, {CAP100_001}
+    settling rate 0.1 (cap 10): 0.051 +/- 0.033 at 0.1
+
+The default window is therefore WINDOW_EVENTS / (the fastest transition
+rate), that is, one hundredth of the mean waiting time of the fastest
+transition, at which no bias was detected. Uncapped, that window is so
+short that a run cannot finish, so strips are only practical with a
+strong motion_rate_cap, which itself changes the hill.
+
+Even then, they are unlikely to pay off. {SPEEDUP}
+
+Transitions with a Python callback are not supported. The event loop is
+compiled with numba, which is required.
+
+@author: gtucker
+"""
+
+import multiprocessing
+import time
+
+import numpy as np
+from numba import njit
+
+from .active_links import _NEVER, reschedule_transitions
+from .grain_hill import get_profile_and_soil_thickness
+from .jit_cts import _CORE, _heap_pop, _heap_push, _schedule, _seed, \
+    _state_of_link
+from .lockstep_cts import uplift_node_states
+
+# Default window: the expected number of events of the fastest transition on
+# a link in one window
+WINDOW_EVENTS = 0.01
+
+# As in jit_cts, the functions that pass queue functions around are not
+# cached
+
+
+@njit
+def _run_phase(start_time, run_to, links, enabled, changed_nodes,
+               schedule_all, qf, qi, next_update, next_trn_id, link_state,
+               node_state, node_at_link_tail, node_at_link_head,
+               status_at_node, nsn, link_orientation, n_trn, trn_id, trn_rate,
+               trn_to, links_at_node, active_link_dirs_at_node):
+    """Process the events on the given links from start_time to run_to.
+
+    If schedule_all is True, events are first drawn for all the links;
+    otherwise, only for the links at changed_nodes (nodes whose states were
+    changed from outside since the last phase). Links for which enabled is
+    False are not changed. Returns the number of events.
+    """
+    streams = np.zeros(1, dtype=np.uint64)  # draw from numba's generator
+    if schedule_all:
+        qi[0] = 0
+        for j in range(len(links)):
+            link = links[j]
+            _schedule(link,
+                      _state_of_link(link, node_state, node_at_link_tail,
+                                     node_at_link_head, link_orientation,
+                                     nsn),
+                      start_time, link_state, n_trn, trn_id, trn_rate,
+                      next_update, next_trn_id, _heap_push, qf, qi, links,
+                      streams)
+    for j in range(len(changed_nodes)):
+        node = changed_nodes[j]
+        for i in range(links_at_node.shape[1]):
+            link = links_at_node[node, i]
+            if active_link_dirs_at_node[node, i] != 0 and enabled[link]:
+                _schedule(link,
+                          _state_of_link(link, node_state, node_at_link_tail,
+                                         node_at_link_head, link_orientation,
+                                         nsn),
+                          start_time, link_state, n_trn, trn_id, trn_rate,
+                          next_update, next_trn_id, _heap_push, qf, qi, links,
+                          streams)
+
+    num_events = 0
+    while True:
+        (ev_time, ev_link) = _heap_pop(qf, qi, next_update)
+        if ev_link < 0:
+            break
+        if ev_time != next_update[ev_link]:
+            continue  # superseded event
+        if ev_time > run_to:
+            _heap_push(qf, qi, next_update, links, ev_link, ev_time)
+            break
+        num_events += 1
+
+        tail = node_at_link_tail[ev_link]
+        head = node_at_link_head[ev_link]
+        old_tail_state = node_state[tail]
+        old_head_state = node_state[head]
+        to_state = trn_to[next_trn_id[ev_link]]
+        if status_at_node[tail] == _CORE:
+            node_state[tail] = (to_state // nsn) % nsn
+        if status_at_node[head] == _CORE:
+            node_state[head] = to_state % nsn
+
+        _schedule(ev_link,
+                  _state_of_link(ev_link, node_state, node_at_link_tail,
+                                 node_at_link_head, link_orientation, nsn),
+                  ev_time, link_state, n_trn, trn_id, trn_rate, next_update,
+                  next_trn_id, _heap_push, qf, qi, links, streams)
+        for (node, old_state) in ((tail, old_tail_state),
+                                  (head, old_head_state)):
+            if node_state[node] == old_state:
+                continue
+            for i in range(links_at_node.shape[1]):
+                link = links_at_node[node, i]
+                if (active_link_dirs_at_node[node, i] != 0 and link != ev_link
+                        and enabled[link]):
+                    _schedule(link,
+                              _state_of_link(link, node_state,
+                                             node_at_link_tail,
+                                             node_at_link_head,
+                                             link_orientation, nsn),
+                              ev_time, link_state, n_trn, trn_id, trn_rate,
+                              next_update, next_trn_id, _heap_push, qf, qi,
+                              links, streams)
+    return num_events
+
+
+class _StripWorker(object):
+    """The event data of one strip (run in a worker process)."""
+
+    def __init__(self, model, links, seed):
+        """Set up arrays for the given model data, and the links of each
+        phase."""
+        self.model = model
+        self.links = links
+        num_links = len(model['node_at_link_tail'])
+        self.enabled = []
+        for phase_links in links:
+            enabled = np.zeros(num_links, dtype=bool)
+            enabled[phase_links] = True
+            self.enabled.append(enabled)
+        self.qf = []
+        self.qi = []
+        for phase_links in links:
+            capacity = 2 * len(phase_links) + 16
+            self.qf.append(np.zeros(capacity))
+            self.qi.append(np.zeros(capacity + 1, dtype=np.int64))
+        self.started = [False] * len(links)
+        self.node_state = model['node_state'].copy()
+        self.link_state = np.zeros(num_links, dtype=np.int64)
+        self.next_update = np.full(num_links, _NEVER)
+        self.next_trn_id = -np.ones(num_links, dtype=np.int64)
+        self.seed = seed
+
+    def run_phase(self, phase, start_time, run_to, changed_nodes):
+        """Process the events of one phase, and return how many there were.
+
+        Pending events are kept from one phase to the next, except on links
+        at changed_nodes, whose states may have been changed by another
+        phase, another worker, or uplift.
+        """
+        m = self.model
+        schedule_all = not self.started[phase]
+        self.started[phase] = True
+        return _run_phase(start_time, run_to, self.links[phase],
+                          self.enabled[phase], changed_nodes, schedule_all,
+                          self.qf[phase], self.qi[phase], self.next_update,
+                          self.next_trn_id, self.link_state,
+                          self.node_state, m['node_at_link_tail'],
+                          m['node_at_link_head'], m['status_at_node'],
+                          m['num_node_states'], m['link_orientation'],
+                          m['n_trn'], m['trn_id'], m['trn_rate'],
+                          m['trn_to'], m['links_at_node'],
+                          m['active_link_dirs_at_node'])
+
+
+def _serve(conn, worker, nodes):
+    """Worker-process loop: receive node states for a phase, run it, and
+    send back the new node states, until None is received."""
+    _seed(worker.seed)
+
+    # Node states as each phase last left them (the two halves of a strip
+    # share a column, so one phase can change nodes of the other)
+    phase_states = [worker.node_state[phase_nodes] for phase_nodes in nodes]
+    while True:
+        message = conn.recv()
+        if message is None:
+            break
+        (phase, start_time, run_to, states) = message
+        changed = nodes[phase][phase_states[phase] != states]
+        worker.node_state[nodes[phase]] = states
+        start = time.process_time()
+        num_events = worker.run_phase(phase, start_time, run_to, changed)
+        cpu_time = time.process_time() - start
+        phase_states[phase] = worker.node_state[nodes[phase]]
+        conn.send((phase_states[phase], num_events, cpu_time))
+    conn.close()
+
+
+def node_columns(grid):
+    """Return the column index of each node.
+
+    Examples
+    --------
+    >>> from landlab import HexModelGrid
+    >>> grid = HexModelGrid((3, 4), orientation='vertical',
+    ...                     node_layout='rect')
+    >>> node_columns(grid).reshape(3, 4).tolist()
+    [[0, 2, 1, 3], [0, 2, 1, 3], [0, 2, 1, 3]]
+    """
+    x = np.round(grid.x_of_node, 6)
+    return np.searchsorted(np.unique(x), x)
+
+
+class StripParallelCTS(object):
+    """Run a CellLab-CTS lattice on several worker processes, one strip of
+    node columns per worker.
+
+    Node states are read from and written to ca.node_state. The CA's link
+    states and event queue are not kept up to date during a run; call
+    sync_ca() before going on with the CA's own run() method.
+
+    Parameters
+    ----------
+    ca : CellLabCTSModel
+        Model whose grid, transition table, and node states are used.
+    num_workers : int
+        Number of strips and worker processes. Each half strip must be at
+        least one column wide (at least two are recommended).
+    window : float (optional)
+        Length of the time window for each pair of phases. Default is
+        WINDOW_EVENTS divided by the fastest transition rate; longer windows
+        bias the results (see the module docstring).
+    seed : int, optional
+        Seed for the random number generators (worker i uses seed + i).
+
+    Examples
+    --------
+    >>> from grainhill import GrainHill
+    >>> gh = GrainHill((7, 17), disturbance_rate=1.0, weathering_rate=0.0)
+    >>> core = gh.grid.core_nodes
+    >>> num_grains = int(np.count_nonzero(gh.ca.node_state[core]))
+    >>> with StripParallelCTS(gh.ca, 2, window=0.5) as sp:
+    ...     sp.run(5.0)
+    ...     sp.sync_ca()
+    >>> sp.current_time
+    5.0
+    >>> sp.num_events > 0
+    True
+    >>> int(np.count_nonzero(gh.ca.node_state[core])) <= num_grains
+    True
+    """
+
+    def __init__(self, ca, num_workers, window=None, seed=0):
+        """Initialize a StripParallelCTS, and start its workers."""
+        if any(f is not None and not isinstance(f, int)
+               for f in ca.trn_prop_update_fn):
+            raise ValueError('transitions with callback functions are not '
+                             + 'supported by StripParallelCTS')
+        g = ca.grid
+        column = node_columns(g)
+        num_cols = column.max() + 1
+        if num_cols < 2 * num_workers:
+            raise ValueError('too many workers for the number of columns')
+        self.ca = ca
+        if window is None:
+            window = WINDOW_EVENTS / np.amax(ca.trn_rate)
+        self.window = window
+        self.current_time = ca.current_time
+        self.num_events = 0
+        # CPU time of the workers' phases: in all, and along the critical
+        # path (the slowest worker in each phase), which bounds the wall time
+        # on at least num_workers cores
+        self.compute_time = 0.0
+        self.critical_time = 0.0
+        self._first_phase = 1
+
+        # Divide columns into strips, and strips into halves (phases)
+        edges = np.linspace(0, num_cols, num_workers + 1).astype(int)
+        self.half_edges = []
+        for w in range(num_workers):
+            middle = (edges[w] + edges[w + 1]) // 2
+            self.half_edges.append(((edges[w], middle),
+                                    (middle, edges[w + 1])))
+
+        # Each active link belongs to the half holding its left column; the
+        # nodes a phase can change are those of the half, plus one column to
+        # its right
+        links = g.active_links
+        link_column = np.minimum(column[g.node_at_link_tail[links]],
+                                 column[g.node_at_link_head[links]])
+        self.links = []
+        self.nodes = []
+        for halves in self.half_edges:
+            self.links.append([np.array(links[(link_column >= start)
+                                              & (link_column < stop)],
+                                        dtype=np.int64)
+                               for (start, stop) in halves])
+            self.nodes.append([np.where((column >= start)
+                                        & (column <= stop))[0]
+                               for (start, stop) in halves])
+
+        model = {
+            'node_at_link_tail': g.node_at_link_tail,
+            'node_at_link_head': g.node_at_link_head,
+            'status_at_node': np.asarray(g.status_at_node),
+            'num_node_states': ca.num_node_states,
+            'link_orientation': np.asarray(ca.link_orientation,
+                                           dtype=np.int64),
+            'n_trn': ca.n_trn,
+            'trn_id': ca.trn_id,
+            'trn_rate': ca.trn_rate,
+            'trn_to': ca.trn_to,
+            'links_at_node': g.links_at_node,
+            'active_link_dirs_at_node': g.active_link_dirs_at_node,
+            'node_state': ca.node_state,
+        }
+
+        # Compile the event loop before starting the workers, so that
+        # (where processes are forked) they need not compile it again
+        no_links = np.zeros(0, dtype=np.int64)
+        _StripWorker(model, [no_links], seed).run_phase(0, 0.0, 0.0,
+                                                         no_links)
+
+        if 'fork' in multiprocessing.get_all_start_methods():
+            context = multiprocessing.get_context('fork')
+        else:
+            context = multiprocessing.get_context()
+        self._conns = []
+        self._processes = []
+        for w in range(num_workers):
+            (conn, child_conn) = context.Pipe()
+            worker = _StripWorker(model, self.links[w], seed + w)
+            process = context.Process(target=_serve,
+                                      args=(child_conn, worker,
+                                            self.nodes[w]),
+                                      daemon=True)
+            process.start()
+            child_conn.close()
+            self._conns.append(conn)
+            self._processes.append(process)
+
+    def run(self, run_to):
+        """Run the lattice forward to time run_to."""
+        node_state = self.ca.node_state
+        while self.current_time < run_to:
+            window_end = min(self.current_time + self.window, run_to)
+            self._first_phase = 1 - self._first_phase
+            for phase in (self._first_phase, 1 - self._first_phase):
+                for (conn, nodes) in zip(self._conns, self.nodes):
+                    conn.send((phase, self.current_time, window_end,
+                               node_state[nodes[phase]]))
+                slowest = 0.0
+                for (conn, nodes) in zip(self._conns, self.nodes):
+                    (states, num_events, cpu_time) = conn.recv()
+                    node_state[nodes[phase]] = states
+                    self.num_events += num_events
+                    self.compute_time += cpu_time
+                    slowest = max(slowest, cpu_time)
+                self.critical_time += slowest
+            self.current_time = window_end
+
+    def sync_ca(self):
+        """Bring the CA's time, link states, and event queue up to date with
+        its node states."""
+        self.ca.current_time = self.current_time
+        reschedule_transitions(self.ca, self.current_time)
+
+    def close(self):
+        """Stop the worker processes."""
+        for conn in self._conns:
+            conn.send(None)
+            conn.close()
+        for process in self._processes:
+            process.join()
+        self._conns = []
+        self._processes = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def run_grain_hill_strips(gh, num_workers, window=None, seed=0):
+    """Run a GrainHill model to gh.run_duration with StripParallelCTS.
+
+    Block uplift is applied every gh.uplift_interval (up to
+    gh.uplift_duration), as GrainHill.run() does. The model's node states,
+    time, and event queue are updated in place. Returns the (closed)
+    StripParallelCTS, with its event counts and timings, and the elevation
+    profile and soil thickness. The window defaults to that of
+    StripParallelCTS, which is only practical with a strong motion_rate_cap
+    (see the module docstring).
+
+    Tau-leaping, domain growth, and transitions with callbacks are not
+    supported.
+
+    Examples
+    --------
+    >>> from grainhill import GrainHill
+    >>> gh = GrainHill((7, 17), run_duration=20.0, uplift_interval=10.0,
+    ...                disturbance_rate=0.1, weathering_rate=0.01)
+    >>> (sp, elev, soil) = run_grain_hill_strips(gh, 2, window=1.0)
+    >>> gh.ca.current_time
+    20.0
+    >>> len(elev)
+    17
+    """
+    if gh.leaper is not None or gh.opt_grow_domain:
+        raise ValueError('tau-leaping and domain growth are not supported '
+                         + 'by run_grain_hill_strips')
+    next_uplift = gh.current_time + gh.uplift_interval
+    with StripParallelCTS(gh.ca, num_workers, window, seed) as sp:
+        while sp.current_time < gh.run_duration:
+            next_pause = gh.run_duration
+            if next_uplift <= gh.uplift_duration:
+                next_pause = min(next_pause, next_uplift)
+            sp.run(next_pause)
+            if sp.current_time >= next_uplift:
+                uplift_node_states(gh.uplifter, gh.ca.node_state,
+                                   gh.rock_state)
+                next_uplift += gh.uplift_interval
+        sp.sync_ca()
+    gh.current_time = sp.current_time
+    (elev, soil) = get_profile_and_soil_thickness(gh.grid, gh.ca.node_state)
+    return sp, elev, soil
@@ -0,0 +1,281 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+tau_leaping.py: GrainHill module that handles slow, independent transitions
+(weathering, dissolution, and grain disturbance) by tau-leaping, leaving the
+fast grain mechanics to the exact CellLab-CTS event queue.
+
+Over each leap interval tau, every link whose state is the from-state of one
+or more slow transitions undergoes one of them with probability
+1 - exp(-R tau), where R is the link's total slow-transition rate. All of
+these events are drawn at once, and then applied in random order. An event
+is rejected if an earlier event in the same leap has already changed the
+state of its link. Before each leap, the leap interval is chosen so
+that no node has more than a fraction `tolerance` chance of taking part in
+an event during the leap. This keeps small both the rejections and the error
+from treating rates as fixed over the leap (for example, rock newly exposed
+by dissolution cannot itself dissolve until the next leap).
+
+@author: gtucker
+"""
+
+import numpy as np
+
+_MAX_LINKS_PER_NODE = 6  # hex lattice
+
+
+def slow_transition_tables(xn_list, num_node_states):
+    """Convert a list of Transition objects into arrays for tau-leaping.
+
+    Parameters
+    ----------
+    xn_list : list of Transition
+        Slow transitions, with from_state and to_state given as
+        (tail, head, orientation) tuples.
+    num_node_states : int
+        Number of node states in the CA.
+
+    Returns
+    -------
+    (from_link_state, to_tail, to_head, rate) : tuple of arrays
+        Link-state code, new tail and head states, and rate for each
+        transition.
+
+    Examples
+    --------
+    >>> from landlab.ca.celllab_cts import Transition
+    >>> xn = [Transition((8, 0, 1), (7, 0, 1), 0.5, 'weathering')]
+    >>> (ls, tt, th, r) = slow_transition_tables(xn, 9)
+    >>> (ls.tolist(), tt.tolist(), th.tolist(), r.tolist())
+    ([153], [7], [0], [0.5])
+    """
+    ns = num_node_states
+    from_ls = [t.from_state[2] * ns * ns + t.from_state[0] * ns
+               + t.from_state[1] for t in xn_list]
+    return (np.array(from_ls, dtype=int),
+            np.array([t.to_state[0] for t in xn_list], dtype=int),
+            np.array([t.to_state[1] for t in xn_list], dtype=int),
+            np.array([t.rate for t in xn_list], dtype=float))
+
+
+class SlowProcessLeaper(object):
+    """SlowProcessLeaper: applies slow link transitions to a CTS model in
+    bulk, one leap interval at a time.
+
+    Examples
+    --------
+    >>> from landlab.ca.celllab_cts import Transition
+    >>> from grainhill import GrainHill
+    >>> gh = GrainHill((5, 7), disturbance_rate=0.0, weathering_rate=0.0)
+    >>> xn = [Transition((7, 0, 0), (0, 0, 0), 1.0e6, 'erase')]
+    >>> leaper = SlowProcessLeaper(xn, 9, tolerance=0.1)
+    >>> round(leaper.leap_interval * 1.0e8, 3)  # 6 links at the same rate
+    1.756
+    >>> leaper.update_leap_interval(gh.ca)
+    >>> round(leaper.leap_interval * 1.0e7, 3)  # actually 1 per node
+    1.054
+    >>> leaper.leap(gh.ca, 1.0)
+    >>> gh.ca.node_state[7:14].tolist()  # top sediment nodes are erased
+    [0, 0, 0, 0, 0, 0, 0]
+    >>> leaper.num_events
+    5
+    """
+
+    def __init__(self, xn_list, num_node_states, tolerance=0.05,
+                 start_time=0.0):
+        """Initialize a SlowProcessLeaper.
+
+        Parameters
+        ----------
+        xn_list : list of Transition
+            The slow transitions. These should not also be included in the
+            transition list of the CTS model.
+        num_node_states : int
+            Number of node states in the CA.
+        tolerance : float (0 < tolerance < 1)
+            Largest acceptable probability of any one node taking part in an
+            event in a single leap.
+        start_time : float
+            Time of the start of the first leap.
+        """
+        self.num_node_states = num_node_states
+        self.tolerance = tolerance
+        self.last_leap_time = start_time
+
+        (self.trn_from, self.trn_to_tail, self.trn_to_head,
+         self.trn_rate) = slow_transition_tables(xn_list, num_node_states)
+
+        # Total slow rate for each link state
+        num_link_states = 3 * num_node_states * num_node_states
+        self.total_rate = np.zeros(num_link_states)
+        np.add.at(self.total_rate, self.trn_from, self.trn_rate)
+
+        # Until we can look at the grid, assume the worst case: a node with
+        # all of its links at the highest rate
+        if len(xn_list) > 0:
+            self.default_leap_interval = float(
+                -np.log(1.0 - tolerance)
+                / (_MAX_LINKS_PER_NODE * np.amax(self.total_rate)))
+        else:
+            self.default_leap_interval = np.inf
+        self.leap_interval = self.default_leap_interval
+
+        # Diagnostics
+        self.num_leaps = 0
+        self.num_events = 0
+        self.num_rejected = 0
+        self.max_event_probability = 0.0
+
+    def leap(self, ca, current_time):
+        """Apply slow transitions for the interval since the last leap.
+
+        Parameters
+        ----------
+        ca : CellLabCTSModel
+            CTS model to update. Links whose states change are given new
+            events on the CTS queue.
+        current_time : float
+            End time of the leap.
+        """
+        dt = current_time - self.last_leap_time
+        self.last_leap_time = current_time
+        if dt <= 0.0 or len(self.trn_from) == 0:
+            return
+        self.num_leaps += 1
+
+        g = ca.grid
+        (links, tail, head, link_state, rate) = self._link_rates(ca)
+        node_rate = self._node_rates(g, tail, head, rate)
+        self.max_event_probability = max(
+            self.max_event_probability,
+            float(1.0 - np.exp(-np.amax(node_rate, initial=0.0) * dt)))
+
+        # Decide which links undergo a transition during the leap
+        prob = 1.0 - np.exp(-rate * dt)
+        fired = np.where(np.random.rand(len(links)) < prob)[0]
+        if len(fired) == 0:
+            return
+
+        # Choose which transition, in proportion to its rate
+        trn = self._choose_transitions(link_state[fired])
+
+        # Apply in random order, rejecting any event whose link has changed
+        order = np.random.permutation(len(fired))
+        fired = fired[order]
+        trn = trn[order]
+        changed = np.zeros(g.number_of_nodes, dtype=bool)
+        core = g.status_at_node == g.BC_NODE_IS_CORE
+        ns = ca.node_state
+        for i in range(len(fired)):
+            t = tail[fired[i]]
+            h = head[fired[i]]
+            if ((changed[t] or changed[h])
+                    and self._link_states(ca, links[fired[i]], t, h)
+                    != link_state[fired[i]]):
+                self.num_rejected += 1
+                continue
+            # As in the CTS model, only core nodes change state; events that
+            # change nothing (e.g., weathering of boundary rock) aren't counted
+            effective = False
+            if core[t] and ns[t] != self.trn_to_tail[trn[i]]:
+                ns[t] = self.trn_to_tail[trn[i]]
+                changed[t] = effective = True
+            if core[h] and ns[h] != self.trn_to_head[trn[i]]:
+                ns[h] = self.trn_to_head[trn[i]]
+                changed[h] = effective = True
+            if effective:
+                self.num_events += 1
+
+        self._update_links_at_nodes(ca, np.where(changed)[0], current_time)
+
+    def update_leap_interval(self, ca):
+        """Set the next leap interval from the current slow-transition rates
+        at each node.
+
+        This should be called after each leap, and after anything else (such
+        as uplift) that changes node states outside of the CTS model.
+        """
+        (links, tail, head, link_state, rate) = self._link_rates(ca)
+        max_node_rate = np.amax(self._node_rates(ca.grid, tail, head, rate),
+                                initial=0.0)
+        if max_node_rate > 0.0:
+            self.leap_interval = float(-np.log(1.0 - self.tolerance)
+                                       / max_node_rate)
+        else:
+            self.leap_interval = self.default_leap_interval
+
+    def _link_rates(self, ca):
+        """Return IDs, tail and head nodes, states, and total slow rates of
+        active links."""
+        g = ca.grid
+        links = g.active_links
+        tail = g.node_at_link_tail[links]
+        head = g.node_at_link_head[links]
+        link_state = self._link_states(ca, links, tail, head)
+        return links, tail, head, link_state, self.total_rate[link_state]
+
+    def _node_rates(self, grid, tail, head, rate):
+        """Return total slow rate of the links at each core node (boundary
+        nodes never change state, so they are given zero)."""
+        n = grid.number_of_nodes
+        node_rate = (np.bincount(tail, weights=rate, minlength=n)
+                     + np.bincount(head, weights=rate, minlength=n))
+        node_rate[grid.status_at_node != grid.BC_NODE_IS_CORE] = 0.0
+        return node_rate
+
+    def _link_states(self, ca, links, tail, head):
+        """Return link-state codes computed from current node states."""
+        ns = self.num_node_states
+        return (ca.link_orientation[links].astype(int) * ns * ns
+                + ca.node_state[tail] * ns + ca.node_state[head])
+
+    def _choose_transitions(self, link_state):
+        """Choose one slow transition for each of the given link states, in
+        proportion to the transition rates."""
+        threshold = np.random.rand(len(link_state)) * self.total_rate[link_state]
+        trn = np.zeros(len(link_state), dtype=int)
+        undecided = np.ones(len(link_state), dtype=bool)
+        for i in range(len(self.trn_from)):
+            match = undecided & (link_state == self.trn_from[i])
+            threshold[match] -= self.trn_rate[i]
+            chosen = match & (threshold < 0.0)
+            trn[chosen] = i
+            undecided[chosen] = False
+        return trn
+
+    def _update_links_at_nodes(self, ca, nodes, current_time):
+        """Update state and next event of active links at the given nodes."""
+        g = ca.grid
+        links = g.links_at_node[nodes][g.active_link_dirs_at_node[nodes] != 0]
+        links = np.unique(links)
+        new_state = self._link_states(ca, links, g.node_at_link_tail[links],
+                                      g.node_at_link_head[links])
+        for lnk, state in zip(links.tolist(), new_state.tolist()):
+            ca.update_link_state_new(lnk, state, current_time)
+
+    def diagnostics(self):
+        """Return a dict of error diagnostics.
+
+        The entries are the number of leaps, events applied, and events
+        rejected; the largest per-node event probability in any leap (which
+        should not exceed the tolerance); and the rejected fraction, the
+        share of drawn events that had to be discarded because an earlier
+        event in the same leap changed their link. Both the rejected fraction
+        and half the largest event probability are first-order estimates of
+        the relative error in slow-process rates.
+
+        Examples
+        --------
+        >>> leaper = SlowProcessLeaper([], 9)
+        >>> leaper.diagnostics()['rejected_fraction']
+        0.0
+        """
+        num_drawn = self.num_events + self.num_rejected
+        return {
+            'num_leaps': self.num_leaps,
+            'num_events': self.num_events,
+            'num_rejected': self.num_rejected,
+            'max_event_probability': self.max_event_probability,
+            'rejected_fraction': (self.num_rejected / num_drawn
+                                  if num_drawn > 0 else 0.0),
+        }
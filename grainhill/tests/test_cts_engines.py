@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Tests for the alternative CellLab-CTS engines.
+
+@author: gtucker
+"""
+
+import numpy as np
+import pytest
+from grainhill import GrainHill
+from grainhill.active_links import _NEVER
+
+
+@pytest.mark.parametrize('cts_type', ['oriented_hex_jit',
+                                      'oriented_hex_calendar'])
+def test_jit_engine_leaves_valid_event_queue(cts_type):
+    """After a run with a callback transition, every queued event should be
+    valid, and every scheduled link should be queued."""
+    pytest.importorskip('numba')
+    gh = GrainHill((9, 11), cts_type=cts_type,
+                   disturbance_rate=1.0, weathering_rate=0.1,
+                   opt_ballistic_fall=True)
+    gh.ca.run(5.0, gh.ca.node_state)
+
+    queue = gh.ca.priority_queue._queue
+    links = np.array([ev[2] for ev in queue])
+    times = np.array([ev[0] for ev in queue])
+    np.testing.assert_array_equal(times, gh.ca.next_update[links])
+    scheduled = gh.grid.active_links[
+        gh.ca.next_update[gh.grid.active_links] < _NEVER]
+    np.testing.assert_array_equal(np.sort(links), np.sort(scheduled))
+    assert gh.ballistic_fall.num_falls > 0
+
+
+def test_ssa_engine_rate_groups_match_link_states():
+    """After a run, every active link should be in the rate group of its
+    current state, and the group totals should match."""
+    pytest.importorskip('numba')
+    from grainhill import GrainFacetSimulator
+    fs = GrainFacetSimulator((9, 11), cts_type='oriented_hex_ssa',
+                             disturbance_rate=1.0, weathering_rate=0.1,
+                             dissolution_rate=0.1, fault_x=-0.01,
+                             opt_ballistic_fall=True)
+    fs.ca.run(5.0, fs.ca.node_state)
+
+    ca = fs.ca
+    links = fs.grid.active_links
+    expected_group = ca.state_group[ca.link_state[links]]
+    np.testing.assert_array_equal(ca._link_group[links], expected_group)
+    for g in range(len(ca.group_bound)):
+        members = ca._members[g, :ca._count[g]]
+        np.testing.assert_array_equal(np.sort(members),
+                                      links[expected_group == g])
+        np.testing.assert_allclose(
+            ca._group_sum[g], np.sum(ca.state_rate[ca.link_state[members]]),
+            rtol=1.0e-6)
+
+
+def test_calendar_queue_pops_in_time_order():
+    """The calendar queue should return events in time order, including
+    after links are rescheduled and the queue is resized."""
+    pytest.importorskip('numba')
+    from grainhill.calendar_queue import (calendar_queue_arrays,
+                                          _calendar_push, _calendar_pop)
+    rng = np.random.RandomState(1)
+    num_links = 500
+    next_update = np.full(num_links, _NEVER)
+    active_links = np.arange(num_links)
+    (qf, qi) = calendar_queue_arrays(num_links)
+    for link in rng.permutation(num_links)[:300]:
+        next_update[link] = rng.exponential(10.0)
+        _calendar_push(qf, qi, next_update, active_links, link,
+                       next_update[link])
+    for link in range(0, num_links, 7):  # reschedule (or add) some links
+        next_update[link] = rng.exponential(10.0)
+        _calendar_push(qf, qi, next_update, active_links, link,
+                       next_update[link])
+
+    times = []
+    (event_time, link) = _calendar_pop(qf, qi, next_update)
+    while link >= 0:
+        times.append(event_time)
+        (event_time, link) = _calendar_pop(qf, qi, next_update)
+    expected = np.sort(next_update[next_update < _NEVER])
+    np.testing.assert_array_equal(times, expected)
+
+
+def test_lockstep_replicates_keep_consistent_event_data():
+    """After a lockstep run with uplift, every replicate's link states should
+    match its node states, and the block minima should match the event
+    times."""
+    from grainhill.lockstep_cts import run_grain_hill_replicates
+    gh = GrainHill((7, 9), run_duration=30.0, uplift_interval=10.0,
+                   disturbance_rate=0.1, weathering_rate=0.01)
+    (batch, elev, soil) = run_grain_hill_replicates(gh, 10, seed=3)
+
+    links = gh.grid.active_links
+    np.testing.assert_array_equal(batch.link_state[:, links],
+                                  batch.link_states_from_nodes(links))
+    num_trn = batch.n_trn[batch.link_state[:, links]]
+    assert np.all(batch.next_update[:, links][num_trn == 0] == _NEVER)
+    assert np.all(batch.next_update[:, links][num_trn > 0] > 30.0)
+    blocks = batch._next_update.reshape(10, -1, batch._block_size)
+    np.testing.assert_array_equal(batch._block_min, blocks.min(axis=2))
+    assert not np.all(elev == elev[0])  # replicates differ
+
+
+def test_strip_parallel_phases_do_not_overlap():
+    """Every active link should belong to exactly one strip and phase, and
+    in each phase, no two workers should be able to change the same node."""
+    pytest.importorskip('numba')
+    from grainhill.strip_parallel import StripParallelCTS
+    gh = GrainHill((7, 25), disturbance_rate=0.1, weathering_rate=0.01)
+    with StripParallelCTS(gh.ca, 3, window=1.0) as sp:
+        all_links = np.concatenate([links for worker_links in sp.links
+                                    for links in worker_links])
+        np.testing.assert_array_equal(np.sort(all_links),
+                                      gh.grid.active_links)
+        for phase in (0, 1):
+            nodes = np.concatenate([worker_nodes[phase]
+                                    for worker_nodes in sp.nodes])
+            assert len(np.unique(nodes)) == len(nodes)
+            for (worker_links, worker_nodes) in zip(sp.links, sp.nodes):
+                links = worker_links[phase]
+                assert np.all(np.isin(gh.grid.node_at_link_tail[links],
+                                      worker_nodes[phase]))
+                assert np.all(np.isin(gh.grid.node_at_link_head[links],
+                                      worker_nodes[phase]))
+        sp.run(10.0)
+        sp.sync_ca()
+    links = gh.grid.active_links
+    times = gh.ca.next_update[links]
+    assert np.all(times[times < _NEVER] > 10.0)
+
+
+def test_partitioned_update_transition_table_matches_cts():
+    """The partitioned-update engine should build the same transitions for
+    each link state as the CTS model, from tuple or integer states."""
+    from grainhill.partitioned_update import PartitionedUpdateCA
+    gh = GrainHill((5, 7), disturbance_rate=0.1, weathering_rate=0.01)
+    transitions = gh.transition_list()
+    ca = PartitionedUpdateCA(gh.grid, gh.node_state_dictionary(),
+                             transitions, gh.ca.node_state.copy(), dt=0.01)
+    for trn in transitions:
+        trn.from_state = gh.ca.link_state_dict[trn.from_state]
+        trn.to_state = gh.ca.link_state_dict[trn.to_state]
+    ca_int = PartitionedUpdateCA(gh.grid, gh.node_state_dictionary(),
+                                 transitions, gh.ca.node_state.copy(),
+                                 dt=0.01)
+    for state in range(len(gh.ca.n_trn)):
+        expected = sorted((gh.ca.trn_to[t], gh.ca.trn_rate[t])
+                          for t in gh.ca.trn_id[state, :gh.ca.n_trn[state]])
+        for engine in (ca, ca_int):
+            trns = engine.trn_id[state, :engine.n_trn[state]]
+            assert sorted(zip(engine.trn_to[trns],
+                              engine.trn_rate[trns])) == expected
+
+
+def test_common_random_numbers_repeat_with_seed():
+    """Runs with common random numbers should repeat exactly for the same
+    seed, and draw different event times for a different seed."""
+    pytest.importorskip('numba')
+    runs = []
+    for seed in (1, 1, 2):
+        gh = GrainHill((9, 11), cts_type='oriented_hex_crn', seed=seed,
+                       disturbance_rate=1.0, weathering_rate=0.1)
+        gh.ca.run(5.0, gh.ca.node_state)
+        runs.append((gh.ca.node_state.copy(), gh.ca.next_update.copy()))
+    np.testing.assert_array_equal(runs[0][0], runs[1][0])
+    np.testing.assert_array_equal(runs[0][1], runs[1][1])
+    assert np.any(runs[0][1] != runs[2][1])
+
+
+def test_common_random_numbers_not_redrawn_after_rebuild():
+    """Rebuilding the CA, when the domain grows or a branch changes rates,
+    should keep the stream key and each link's count of draws, so that no
+    link draws the same random numbers twice."""
+    pytest.importorskip('numba')
+    from grainhill.branching import apply_branch_changes
+
+    gh = GrainHill((9, 11), cts_type='oriented_hex_crn', seed=1,
+                   disturbance_rate=1.0, weathering_rate=0.1)
+    branch = {'weathering_rate': 0.2}
+    for rebuild in (lambda: gh.grow_domain(2),
+                    lambda: apply_branch_changes(gh, branch)):
+        gh.ca.run(gh.ca.current_time + 5.0, gh.ca.node_state)
+        gh.current_time = gh.ca.current_time
+        streams = gh.ca._streams.copy()
+        assert np.any(streams[1:] > 0)
+        rebuild()
+        gh.ca.run(gh.ca.current_time + 5.0, gh.ca.node_state)
+        assert gh.ca._streams[0] == streams[0]
+        assert np.all(gh.ca._streams[1:len(streams)] >= streams[1:])
+        assert np.any(gh.ca._streams[1:len(streams)] > streams[1:])
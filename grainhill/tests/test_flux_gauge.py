@@ -0,0 +1,35 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Tests for counting sediment flux with flux gauges.
+
+@author: gtucker
+"""
+
+import numpy as np
+from grainhill import GrainHill
+from grainhill.active_links import reschedule_transitions
+from grainhill.flux_gauge import FluxGauge, LEFT, RIGHT
+
+
+def test_flux_gauge_balances_grains_lost():
+    """With no uplift or weathering, and rock along the bottom, the grains
+    lost from the domain should be those counted leaving through the left
+    and right boundaries."""
+    gauge = FluxGauge(duration=50.0, bin_width=5.0, sections=[5])
+    gh = GrainHill((9, 11), run_duration=50.0, uplift_interval=1.0e9,
+                   disturbance_rate=0.1, weathering_rate=0.0,
+                   opt_track_grains=True, callback_fn=gauge,
+                   report_interval=1.0e99)
+    ns = gh.ca.node_state
+    ns[gh.grid.nodes_at_bottom_edge] = 8
+    gh.ca.assign_link_states_from_node_types()
+    reschedule_transitions(gh.ca, 0.0)
+    core = gh.grid.core_nodes
+    num_grains = np.count_nonzero((ns[core] > 0) & (ns[core] < 8))
+    gh.run()
+    num_lost = num_grains - np.count_nonzero((ns[core] > 0) & (ns[core] < 8))
+    assert num_lost > 0
+    assert gauge.cumulative[LEFT] + gauge.cumulative[RIGHT] == num_lost
+    np.testing.assert_array_equal(np.sum(gauge.binned, axis=1),
+                                  gauge.cumulative)
@@ -42,3 +42,54 @@ def test_initial_state_grid():
 
     gfs = GrainFacetSimulator(**params)
     assert_equal(np.count_nonzero(gfs.ca.node_state), 6)
+
+
+def test_tau_leap_dissolution():
+    """Test dissolving rock with tau-leaping."""
+    nr = 5
+    nc = 5
+    hg = HexModelGrid(shape=(nr, nc), node_layout='rect',
+                      orientation='vertical')
+    ins = hg.add_zeros('node', 'node_state', dtype=int)
+    ins[hg.y_of_node < 2] = 8
+
+    params = {
+        'grid_size': (nr, nc),
+        'dissolution_rate': 1.0,
+        'run_duration': 20.0,
+        'uplift_interval': 1.0e7,
+        'friction_coef': 1.0,
+        'fault_x': -0.001,
+        'init_state_grid': ins,
+        'seed': 0,
+        'opt_tau_leap_slow': True,
+    }
+
+    gfs = GrainFacetSimulator(**params)
+    gfs.run()
+    assert_equal(np.count_nonzero(gfs.ca.node_state), 8)  # boundary rock
+    diagnostics = gfs.leaper.diagnostics()
+    assert_equal(diagnostics['num_events'], 2)
+    assert diagnostics['max_event_probability'] <= 0.05 + 1.0e-12
+
+
+def test_branches_from_spun_up_facet():
+    """Branches with the same seed should match; a branch can switch on
+    baselevel rise."""
+    from grainhill.branching import run_branches
+    params = {
+        'grid_size': (10, 5),
+        'run_duration': 6.0,
+        'uplift_interval': 2.0,
+        'disturbance_rate': 0.1,
+        'weathering_rate': 0.1,
+    }
+    gfs = GrainFacetSimulator(**params)
+    branches = [{'seed': 1}, {'seed': 1},
+                {'seed': 2, 'baselevel_rise_interval': 1.0}]
+    results = run_branches(gfs, 3.0, branches,
+                           result_fn=lambda m: m.ca.node_state.copy())
+    assert_equal(results[0], results[1])
+    nc = gfs.grid.number_of_node_columns
+    assert_equal(results[2][nc:4 * nc:nc], [8, 8, 8])  # rows 1-3 closed
+    assert gfs.current_time == 3.0
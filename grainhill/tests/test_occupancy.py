@@ -0,0 +1,34 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Tests for accumulating the time nodes spend in each state.
+
+@author: gtucker
+"""
+
+import numpy as np
+import pytest
+from grainhill import GrainHill
+
+
+@pytest.mark.parametrize('cts_type', ['oriented_hex_jit',
+                                      'oriented_hex_ssa'])
+def test_occupancy_time_fractions_sum_to_one(cts_type):
+    """With callbacks and uplift changing node states, the time fractions at
+    every node should add up to one, and be stored in the node fields.
+    Boundary nodes never change, so they spend all their time in one state."""
+    pytest.importorskip('numba')
+    gh = GrainHill((9, 11), cts_type=cts_type, run_duration=20.0,
+                   uplift_interval=4.0, disturbance_rate=1.0,
+                   weathering_rate=0.1, opt_ballistic_fall=True,
+                   opt_track_occupancy=True, report_interval=1.0e99)
+    gh.run()
+    fraction = gh.ca.occupancy.time_fraction(20.0)
+    np.testing.assert_allclose(np.sum(fraction, axis=0), 1.0)
+    np.testing.assert_array_equal(
+        gh.grid.at_node['node_state_7__time_fraction'], fraction[7])
+    assert np.all(np.amax(fraction[:, gh.grid.boundary_nodes], axis=0)
+                  == 1.0)
+    with pytest.raises(ValueError):
+        GrainHill((5, 7), opt_track_occupancy=True)
+
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark the CellLab-CTS engines available to GrainHill.
+
+Runs the same GrainHill configuration with each engine (cts_type) and a set
+of random seeds, and prints the mean wall-clock time per run along with the
+mean and standard deviation of hill height and soil thickness, so that both
+speed and statistical agreement between engines can be checked.
+
+With --crossover, it instead times two engines (by default, the binary-heap
+and calendar-queue versions of the compiled engine) over a range of grid
+sizes, to find the size above which the second becomes faster.
+
+Usage:
+
+    python benchmark_cts_engines.py [<rows> <cols> <duration> <seeds>
+                                     [<cts_type> ...]]
+    python benchmark_cts_engines.py --crossover [<duration> <seeds>
+                                                 [<cts_type> <cts_type>]]
+
+@author: gtucker
+"""
+
+import contextlib
+import io
+import sys
+import time
+
+import numpy as np
+
+from grainhill import GrainHill
+
+DEFAULT_ENGINES = ['oriented_hex', 'oriented_hex_jit',
+                   'oriented_hex_calendar', 'oriented_hex_ssa']
+CROSSOVER_ENGINES = ['oriented_hex_jit', 'oriented_hex_calendar']
+CROSSOVER_SIZES = [(11, 15), (21, 29), (41, 57), (81, 113), (161, 225)]
+
+
+def run_once(cts_type, grid_size, run_duration, seed, **kwds):
+    """Run GrainHill once and return wall time, mean height, and mean soil
+    thickness."""
+    with contextlib.redirect_stdout(io.StringIO()):
+        gh = GrainHill(grid_size, cts_type=cts_type,
+                       run_duration=run_duration, seed=seed, **kwds)
+        start = time.time()
+        gh.run()
+        wall_time = time.time() - start
+    (elev, soil) = gh.get_profile_and_soil_thickness(gh.grid,
+                                                     gh.ca.node_state)
+    return wall_time, np.mean(elev[1:-1]), np.mean(soil[1:-1])
+
+
+def benchmark(engines, grid_size, run_duration, num_seeds, **kwds):
+    """Run each engine for num_seeds seeds, and print a summary table."""
+    for cts_type in engines:
+        run_once(cts_type, (5, 7), 1.0, 0)  # compile / warm up
+
+    print('{:>18} {:>10} {:>16} {:>16}'.format('cts_type', 'wall (s)',
+                                               'height', 'soil'))
+    for cts_type in engines:
+        results = np.array([run_once(cts_type, grid_size, run_duration, seed,
+                                     **kwds)
+                            for seed in range(num_seeds)])
+        print('{:>18} {:>10.3f} {:>8.3f} +/-{:<5.3f} {:>8.3f} +/-{:<5.3f}'
+              .format(cts_type, np.mean(results[:, 0]),
+                      np.mean(results[:, 1]), np.std(results[:, 1]),
+                      np.mean(results[:, 2]), np.std(results[:, 2])))
+
+
+def crossover(engines, grid_sizes, run_duration, num_seeds, **kwds):
+    """Time two engines over a range of grid sizes, print the ratio of their
+    wall times, and return the smallest grid size (if any) from which the
+    second engine is faster at that and all larger sizes."""
+    for cts_type in engines:
+        run_once(cts_type, (5, 7), 1.0, 0)  # compile / warm up
+
+    print('{:>10} {:>8} {:>22} {:>22} {:>6}'.format('grid', 'links',
+                                                   engines[0], engines[1],
+                                                   'ratio'))
+    crossover_size = None
+    for grid_size in grid_sizes:
+        wall = []
+        for cts_type in engines:
+            wall.append(np.mean([run_once(cts_type, grid_size, run_duration,
+                                          seed, **kwds)[0]
+                                 for seed in range(num_seeds)]))
+        num_links = GrainHill(grid_size).grid.number_of_links
+        print('{:>10} {:>8} {:>22.3f} {:>22.3f} {:>6.2f}'.format(
+            '{}x{}'.format(*grid_size), num_links, wall[0], wall[1],
+            wall[1] / wall[0]))
+        if wall[1] >= wall[0]:
+            crossover_size = None
+        elif crossover_size is None:
+            crossover_size = grid_size
+    return crossover_size
+
+
+def main():
+    """Parse command-line arguments and run the benchmark."""
+    if len(sys.argv) > 1 and sys.argv[1] == '--crossover':
+        run_duration = float(sys.argv[2]) if len(sys.argv) > 2 else 500.0
+        num_seeds = int(sys.argv[3]) if len(sys.argv) > 3 else 2
+        engines = sys.argv[4:6] or CROSSOVER_ENGINES
+        size = crossover(engines, CROSSOVER_SIZES, run_duration, num_seeds,
+                         disturbance_rate=0.01, weathering_rate=0.002,
+                         uplift_interval=100.0)
+        print('Crossover grid size: {}'.format(size))
+        return
+    if len(sys.argv) > 1:
+        grid_size = (int(sys.argv[1]), int(sys.argv[2]))
+        run_duration = float(sys.argv[3])
+        num_seeds = int(sys.argv[4])
+        engines = sys.argv[5:] or DEFAULT_ENGINES
+    else:
+        grid_size = (41, 61)
+        run_duration = 2000.0
+        num_seeds = 4
+        engines = DEFAULT_ENGINES
+    benchmark(engines, grid_size, run_duration, num_seeds,
+              disturbance_rate=0.01, weathering_rate=0.002,
+              uplift_interval=100.0)
+
+
+if __name__ == '__main__':
+    main()
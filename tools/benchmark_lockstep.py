@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Compare the cost of a replicate ensemble run in lockstep with the cost of
+running the same replicates as separate GrainHill models.
+
+Prints the wall-clock time per replicate for each approach, and the mean and
+standard deviation of hill height, so that both speed and statistical
+agreement can be checked.
+
+Usage:
+
+    python benchmark_lockstep.py [<rows> <cols> <duration> <replicates>
+                                  [<separate runs>]]
+
+@author: gtucker
+"""
+
+import contextlib
+import io
+import sys
+import time
+
+import numpy as np
+
+from grainhill import GrainHill
+from grainhill.lockstep_cts import run_grain_hill_replicates
+
+
+def main():
+    """Parse command-line arguments and run the comparison."""
+    if len(sys.argv) > 1:
+        grid_size = (int(sys.argv[1]), int(sys.argv[2]))
+        run_duration = float(sys.argv[3])
+        num_replicates = int(sys.argv[4])
+        num_separate = int(sys.argv[5]) if len(sys.argv) > 5 else 16
+    else:
+        grid_size = (11, 15)
+        run_duration = 300.0
+        num_replicates = 1000
+        num_separate = 16
+    params = {'run_duration': run_duration, 'disturbance_rate': 0.01,
+              'weathering_rate': 0.002, 'uplift_interval': 50.0}
+
+    heights = []
+    start = time.time()
+    for seed in range(num_separate):
+        with contextlib.redirect_stdout(io.StringIO()):
+            gh = GrainHill(grid_size, seed=seed, **params)
+            gh.run()
+        (elev, _) = gh.get_profile_and_soil_thickness(gh.grid,
+                                                      gh.ca.node_state)
+        heights.append(np.mean(elev[1:-1]))
+    separate_time = (time.time() - start) / num_separate
+
+    gh = GrainHill(grid_size, **params)
+    start = time.time()
+    (_, elev, _) = run_grain_hill_replicates(gh, num_replicates)
+    lockstep_time = (time.time() - start) / num_replicates
+    lockstep_heights = np.mean(elev[:, 1:-1], axis=1)
+
+    print('{:>10} {:>12} {:>10} {:>8}'.format('', 'replicates',
+                                              'wall (s)', 'height'))
+    print('{:>10} {:>12} {:>10.4f} {:>8.3f} +/-{:<5.3f}'.format(
+        'separate', num_separate, separate_time, np.mean(heights),
+        np.std(heights)))
+    print('{:>10} {:>12} {:>10.4f} {:>8.3f} +/-{:<5.3f}'.format(
+        'lockstep', num_replicates, lockstep_time,
+        np.mean(lockstep_heights), np.std(lockstep_heights)))
+    print('Speedup per replicate: {:.1f}'.format(separate_time
+                                                 / lockstep_time))
+
+
+if __name__ == '__main__':
+    main()
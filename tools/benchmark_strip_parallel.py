@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Compare the cost and results of GrainHill runs on strips of the lattice
+(strip_parallel.run_grain_hill_strips) with those of serial runs.
+
+Runs each seed serially and on strips, and prints the mean wall-clock time
+per run and the mean and standard error of hill height for each. The strip
+runs also report the CPU time of their workers along the critical path (the
+slowest worker in each phase). On a machine with fewer cores than workers,
+the measured wall time includes all the workers' computing, so the wall time
+on enough cores is projected as the measured wall time less the workers' CPU
+time, plus the critical path.
+
+Usage:
+
+    python benchmark_strip_parallel.py [<rows> <cols> <duration> <seeds>
+                                        <workers> <cap> [<window>]]
+
+A cap of "none" means no motion_rate_cap; the window defaults to that of
+run_grain_hill_strips.
+
+@author: gtucker
+"""
+
+import contextlib
+import io
+import multiprocessing
+import sys
+import time
+
+import numpy as np
+
+from grainhill import GrainHill
+from grainhill.strip_parallel import run_grain_hill_strips
+
+
+def main():
+    """Parse command-line arguments and run the comparison."""
+    if len(sys.argv) > 1:
+        grid_size = (int(sys.argv[1]), int(sys.argv[2]))
+        run_duration = float(sys.argv[3])
+        num_seeds = int(sys.argv[4])
+        num_workers = int(sys.argv[5])
+        cap = None if sys.argv[6] == 'none' else float(sys.argv[6])
+        window = float(sys.argv[7]) if len(sys.argv) > 7 else None
+    else:
+        grid_size = (31, 121)
+        run_duration = 1000.0
+        num_seeds = 8
+        num_workers = 4
+        cap = 10.0
+        window = None
+    params = {'run_duration': run_duration, 'disturbance_rate': 0.01,
+              'weathering_rate': 0.002, 'uplift_interval': 100.0,
+              'cts_type': 'oriented_hex_jit', 'motion_rate_cap': cap}
+
+    serial = []
+    strips = []
+    for seed in range(num_seeds):
+        with contextlib.redirect_stdout(io.StringIO()):
+            gh = GrainHill(grid_size, seed=seed, **params)
+            start = time.time()
+            gh.run()
+            wall_time = time.time() - start
+        (elev, _) = gh.get_profile_and_soil_thickness(gh.grid,
+                                                      gh.ca.node_state)
+        serial.append((wall_time, np.mean(elev[1:-1])))
+
+        gh = GrainHill(grid_size, seed=seed, **params)
+        start = time.time()
+        (sp, elev, _) = run_grain_hill_strips(gh, num_workers, window,
+                                              seed=100 * seed)
+        wall_time = time.time() - start
+        projected = wall_time - sp.compute_time + sp.critical_time
+        strips.append((wall_time, np.mean(elev[1:-1]), projected))
+    serial = np.array(serial)
+    strips = np.array(strips)
+
+    print('Window {:.4g}, {} workers, {} cores'.format(
+        sp.window, num_workers, multiprocessing.cpu_count()))
+    print('{:>8} {:>6} {:>10} {:>14} {:>8}'.format(
+        '', 'runs', 'wall (s)', 'projected (s)', 'height'))
+    for (name, wall, projected, height) in (
+            ('serial', serial[:, 0], serial[:, 0], serial[:, 1]),
+            ('strips', strips[:, 0], strips[:, 2], strips[:, 1])):
+        print('{:>8} {:>6} {:>10.3f} {:>14.3f} {:>8.3f} +/-{:<5.3f}'.format(
+            name, num_seeds, np.mean(wall), np.mean(projected),
+            np.mean(height), np.std(height, ddof=1) / np.sqrt(num_seeds)))
+    print('Speedup: {:.3f} measured, {:.3f} projected'.format(
+        np.mean(serial[:, 0]) / np.mean(strips[:, 0]),
+        np.mean(serial[:, 0]) / np.mean(strips[:, 2])))
+
+
+if __name__ == '__main__':
+    main()